@@ -1,4 +1,6 @@
 import os
+import sys
+import click
 from flask import Flask, jsonify
 from dotenv import load_dotenv
 
@@ -8,6 +10,10 @@ load_dotenv()
 def create_app():
     app = Flask(__name__)
     
+    # DBの行（Row）をJSONオブジェクトとして出力
+    from app.rows import RowJSONProvider
+    app.json = RowJSONProvider(app)
+    
     # 本番環境とローカル環境の設定を分ける
     app.secret_key = os.getenv('FLASK_SECRET_KEY', 'vulnerable_shop_secret_key_12345')
     
@@ -18,14 +24,139 @@ def create_app():
     else:
         app.config['DEBUG'] = True
     
+    # リクエスト単位のDB接続をteardownでプールへ返却
+    from app.database import db_config
+    db_config.init_app(app)
+    
+    # 未適用のスキーママイグレーションを最初のリクエストで適用（db_config とローカルSQLiteの両方）
+    from app.migrations import migrator, migrators, DB_AUTO_MIGRATE
+    if DB_AUTO_MIGRATE:
+        for target in migrators:
+            target.init_app(app)
+    
+    # マイグレーション適用コマンド: flask --app run migrate
+    @app.cli.command('migrate')
+    def migrate():
+        for target in migrators:
+            applied = target.migrate()
+            print(f"📦 {target.label}")
+            for version, name, done in target.status():
+                print(f"   {'✅' if done else '⏳'} v{version} {name}")
+            print(f"✅ マイグレーション完了: {len(applied)}件適用")
+    
+    # 全文検索インデックス再構築コマンド: flask --app run rebuild-search-index
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index():
+        from app.search import product_search
+        
+        count = product_search.rebuild()
+        if count is None:
+            print("❌ 全文検索インデックスを作成できませんでした")
+        else:
+            print(f"✅ 全文検索インデックス再構築完了: {count}件")
+    
+    # 評価集計の再構築コマンド: flask --app run rebuild-rating-stats
+    @app.cli.command('rebuild-rating-stats')
+    def rebuild_rating_stats():
+        from app.ratings import rating_stats
+        
+        count = rating_stats.rebuild()
+        if count is None:
+            print("❌ 評価集計テーブルを作成できませんでした")
+        else:
+            print(f"✅ 評価集計再構築完了: {count}商品")
+    
+    # クエリ実行計画の監査コマンド: flask --app run audit-queries
+    @app.cli.command('audit-queries')
+    @click.option('--username', default='user1', help='巡回時にログインするユーザー')
+    @click.option('--password', default='password123')
+    @click.option('--fail-on', default=None, help='全件スキャンを許容しないテーブル（カンマ区切り）')
+    @click.option('--update-baseline', is_flag=True, help='現在の全件スキャンをベースラインとして保存')
+    @click.option('--json-output', default=None, help='結果をJSONで書き出すファイル（CI用）')
+    def audit_queries(username, password, fail_on, update_baseline, json_output):
+        import contextlib
+        import io
+        import json
+        from app.query_audit import (QueryAuditor, query_recorder, load_baseline, save_baseline,
+                                     QUERY_AUDIT_FAIL_TABLES)
+        
+        auditor = QueryAuditor(db_config, query_recorder)
+        query_recorder.reset()
+        query_recorder.enabled = True
+        try:
+            # ページ側のログ出力は捨てて結果だけを表示する
+            with contextlib.redirect_stdout(io.StringIO()):
+                auditor.exercise(app, username, password)
+        finally:
+            query_recorder.enabled = False
+        
+        report = auditor.audit()
+        fail_tables = [t.strip() for t in fail_on.split(',') if t.strip()] if fail_on else QUERY_AUDIT_FAIL_TABLES
+        if update_baseline:
+            entries = auditor.violations(report, fail_tables)
+            save_baseline(entries)
+            print(f"✅ ベースライン保存: {len(entries)}件")
+            return
+        
+        violations = auditor.violations(report, fail_tables, load_baseline())
+        auditor.print_report(report, violations)
+        if json_output:
+            with open(json_output, 'w', encoding='utf-8') as f:
+                json.dump({'queries': report, 'violations': violations}, f, ensure_ascii=False, indent=2)
+        if violations:
+            sys.exit(1)
+    
+    # ルートごとのHTTPキャッシュ方針の一覧: flask --app run cache-policies
+    @app.cli.command('cache-policies')
+    @click.option('--uncacheable-only', is_flag=True, help='共有キャッシュに載らないルートだけ表示')
+    def show_cache_policies(uncacheable_only):
+        from app.cache_policy import cache_policies
+        
+        report = cache_policies.report(app)
+        for entry in report:
+            if uncacheable_only and entry['cacheable']:
+                continue
+            mark = '✅' if entry['cacheable'] else '❌'
+            vary = f" (Vary: {', '.join(entry['vary'])})" if entry['vary'] else ''
+            print(f"{mark} {entry['rule']:<40} {entry['endpoint']:<28} {entry['cache_control']}{vary}")
+            for reason in entry['reasons']:
+                print(f"      {reason}")
+        cacheable = sum(1 for entry in report if entry['cacheable'])
+        print(f"🔍 ルート {len(report)}件 / CDNにキャッシュできるもの {cacheable}件"
+              f"（セッション付きのリクエストは常に no-store）")
+    
+    # ブループリント共通のSQLite接続の後始末
+    from app import sqlite_db
+    sqlite_db.init_app(app)
+    
+    # 匿名ユーザーのトップ・商品一覧・商品詳細はルーティング前にページキャッシュから返す
+    from app.microcache import MICROCACHE_ENABLED, MicrocacheMiddleware, microcache
+    if MICROCACHE_ENABLED:
+        from app.result_cache import result_cache
+        app.wsgi_app = MicrocacheMiddleware(
+            app.wsgi_app, microcache,
+            # 商品・レビューへの書き込みで版数が進み、それ以前のページは使わない
+            version=lambda: result_cache.versions(('products', 'reviews'))
+        )
+    
+    # ルートごとのキャッシュ方針を Cache-Control に反映（CDNはカタログのページだけ保持する）
+    from app.cache_policy import cache_policies
+    cache_policies.init_app(app)
+    
     # ヘルスチェックエンドポイント（デバッグ用に残す）
     @app.route('/health')
     def health_check():
+        from app.database import db_config
+        
+        # ブレーカーが closed 以外なら PostgreSQL 障害中（SQLiteへフォールバックか即時失敗）
+        breaker = db_config.breaker.stats()
         return jsonify({
             'status': 'OK',
             'message': 'Application is running',
             'environment': os.getenv('FLASK_ENV', 'development'),
             'database': 'PostgreSQL' if os.getenv('DATABASE_URL') else 'SQLite',
+            'database_status': 'degraded' if db_config.use_postgres and breaker['state'] != 'closed' else 'ok',
+            'circuit_breaker': breaker,
             'supabase_configured': bool(os.getenv('SUPABASE_URL')),
             'env_variables': {
                 'SUPABASE_URL': '✅' if os.getenv('SUPABASE_URL') else '❌',
@@ -91,44 +222,136 @@ def create_app():
                 'error_type': type(e).__name__
             }), 500
     
+    # 接続プール統計エンドポイント（サイジング用）
+    @app.route('/api/pool-stats')
+    def pool_stats():
+        try:
+            from app.database import db_config
+            from app.microcache import microcache
+            from app.statements import statement_cache
+            
+            return jsonify({
+                'success': True,
+                'pool': db_config.pool_stats(),
+                'statements': statement_cache.stats(),
+                'result_cache': db_config.result_cache.stats(),
+                'microcache': microcache.stats()
+            })
+            
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'error_type': type(e).__name__
+            }), 500
+    
     # 商品データ直接取得エンドポイント
     @app.route('/api/products')
     def api_products():
         try:
+            from flask import Response, request, stream_with_context
             from app.database import db_config
+            from app.conditional import catalog_validators
+            
+            # カタログが変わっていなければ問い合わせずに 304
+            validators = catalog_validators.catalog('api-products')
+            not_modified = validators.not_modified()
+            if not_modified:
+                return not_modified
             
             # 接続状況をログ出力
             print(f"🔍 PostgreSQL使用: {db_config.use_postgres}")
             print(f"🔍 DATABASE_URL設定済み: {bool(os.getenv('DATABASE_URL'))}")
             
-            # まずテーブルの存在確認
-            table_check = db_config.execute_query("""
-                SELECT table_name FROM information_schema.tables 
-                WHERE table_schema = 'public' AND table_name = 'products'
-            """)
+            # まずテーブルの存在確認（SQLiteには information_schema が無い）
+            if db_config.is_sqlite_mode():
+                table_check = db_config.execute_query(
+                    "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'products'"
+                )
+            else:
+                table_check = db_config.execute_query("""
+                    SELECT table_name FROM information_schema.tables 
+                    WHERE table_schema = 'public' AND table_name = 'products'
+                """)
             
             if not table_check:
+                # テーブルが無い・DBを読めない状態を 200 で返すと共有キャッシュに残るので 503
                 return jsonify({
                     'success': False,
                     'error': 'products table not found',
                     'debug': 'テーブルが作成されていません'
-                })
+                }), 503
             
             # 商品数をカウント
-            count_result = db_config.execute_query("SELECT COUNT(*) as count FROM products")
+            count_result = db_config.execute_query("SELECT COUNT(*) as count FROM products",
+                                                   cache_tables=('products',))
             product_count = count_result[0]['count'] if count_result else 0
             
-            # 商品データを取得
-            products = db_config.execute_query("SELECT * FROM products LIMIT 10")
+            # 取得件数（0 で全件）
+            limit = request.args.get('limit', 10, type=int)
+            if limit > 0:
+                query, params = "SELECT * FROM products LIMIT ?", (limit,)
+            else:
+                query, params = "SELECT * FROM products", None
             
-            return jsonify({
-                'success': True,
-                'table_exists': True,
-                'total_products': product_count,
-                'fetched_count': len(products),
-                'products': products,
-                'connection_type': 'PostgreSQL' if db_config.use_postgres else 'SQLite'
-            })
+            from itertools import chain, islice
+            from app.ratings import rating_stats
+            
+            # 件数指定の一覧は結果キャッシュから、全件はストリーミングで読む
+            if limit > 0:
+                rows = iter(db_config.execute_query(query, params, cache_tables=('products',)))
+            else:
+                rows = db_config.iter_query(query, params, raise_errors=True)
+            
+            def batches():
+                while True:
+                    batch = list(islice(rows, db_config.iter_batch_size))
+                    if not batch:
+                        return
+                    # 評価集計はバッチ単位でまとめて付加
+                    ratings = rating_stats.for_products([p['id'] for p in batch])
+                    yield [dict(product, rating=ratings.get(product['id'], rating_stats.empty()))
+                           for product in batch]
+            
+            # 送信を始める前に読めるところまで読み、エラーは下の except で 500 にする
+            # （件数指定の一覧は全件、全件のストリームは最初のバッチだけ）
+            pending = batches()
+            if limit > 0:
+                pending = iter(list(pending))
+            first = next(pending, [])
+            
+            def generate():
+                """商品を少しずつ読みながらJSONを出力（全件でもメモリ使用量は一定）"""
+                fetched = 0
+                yield '{"products": ['
+                try:
+                    for batch in chain([first], pending):
+                        for item in batch:
+                            yield (', ' if fetched else '') + app.json.dumps(item)
+                            fetched += 1
+                except Exception as e:
+                    # ステータスは送信済みなので、配列を閉じて失敗したことを本文で伝える
+                    print(f"❌ API商品取得エラー（送信中）: {e}")
+                    yield '], ' + app.json.dumps({
+                        'success': False,
+                        'error': str(e),
+                        'error_type': type(e).__name__,
+                        'fetched_count': fetched
+                    })[1:]
+                    return
+                yield '], ' + app.json.dumps({
+                    'success': True,
+                    'table_exists': True,
+                    'total_products': product_count,
+                    'fetched_count': fetched,
+                    'connection_type': 'PostgreSQL' if db_config.use_postgres else 'SQLite'
+                })[1:]
+            
+            response = validators.apply(Response(stream_with_context(generate()), mimetype='application/json'))
+            if limit <= 0:
+                # 送信中に失敗してもヘッダーは変えられないので、全件のストリームは共有キャッシュに置かない
+                response.headers['Cache-Control'] = 'no-store'
+            return response
             
         except Exception as e:
             print(f"❌ API商品取得エラー: {e}")
@@ -298,6 +521,12 @@ def create_app():
             
             success_count = sum(1 for v in results.values() if v == 'SUCCESS')
             
+            # 作成したテーブルのインデックスを適用
+            try:
+                results['migrations'] = migrator.migrate()
+            except Exception as e:
+                results['migrations'] = f'ERROR: {str(e)}'
+            
             return jsonify({
                 'success': success_count > 0,
                 'message': f'{success_count}/3 テーブル作成完了',
@@ -331,7 +560,7 @@ def create_app():
             except Exception as e:
                 results['users_inserted'] = f'ERROR: {str(e)}'
             
-            # テスト商品作成（1つずつ）
+            # テスト商品作成（まとめて1回で挿入）
             products = [
                 ('ノートパソコン', '高性能ノートパソコンです', 120000.00, 10, '電子機器', 'https://images.unsplash.com/photo-1496181133206-80ce9b88a853?w=400&h=300&fit=crop'),
                 ('スマートフォン', '最新スマートフォンです', 80000.00, 15, '電子機器', 'https://images.unsplash.com/photo-1511707171634-5f897ff02aa9?w=400&h=300&fit=crop'),
@@ -341,16 +570,16 @@ def create_app():
             ]
             
             inserted_count = 0
-            for i, (name, desc, price, stock, category, image_url) in enumerate(products):
-                try:
-                    result = db_config.execute_update(
-                        "INSERT INTO products (name, description, price, stock, category, image_url) VALUES (?, ?, ?, ?, ?, ?)",
-                        (name, desc, price, stock, category, image_url)
-                    )
-                    if result is not None:
-                        inserted_count += 1
-                except Exception as e:
-                    results[f'product_{i+1}_error'] = str(e)
+            try:
+                result = db_config.bulk_insert(
+                    'products', ('name', 'description', 'price', 'stock', 'category', 'image_url'), products
+                )
+                if result is not None:
+                    inserted_count = result
+                else:
+                    results['products_error'] = '一括挿入に失敗しました'
+            except Exception as e:
+                results['products_error'] = str(e)
             
             results['products_inserted'] = f'{inserted_count}/{len(products)} products'
             
@@ -386,15 +615,18 @@ def create_app():
     def main_index():
         """メインページ - ショッピングモールのトップページ（HTML直接出力）"""
         try:
+            from flask import request
             from app.database import db_config
             
             # 人気商品を取得
             featured_products = db_config.execute_query(
-                "SELECT * FROM products ORDER BY id DESC LIMIT 4"
+                "SELECT * FROM products ORDER BY id DESC LIMIT 4",
+                cache_tables=('products',)
             ) or []
             
             # 商品データがない場合、デモ用のサンプルデータを使用
-            if not featured_products:
+            sample = not featured_products
+            if sample:
                 print("🔄 メインページ: 商品データが見つからないため、サンプル表示")
                 featured_products = [
                     (1, 'MacBook Air M3', 'Ultra-thin laptop with M3 chip', 199999.0, 5, 'electronics', 'https://images.unsplash.com/photo-1541807084-5c52b6b3adef?w=400&h=300&fit=crop', '2025-09-29'),
@@ -403,6 +635,30 @@ def create_app():
                     (4, 'Sony Camera', 'Professional digital camera', 89999.0, 3, 'electronics', 'https://images.unsplash.com/photo-1606983340126-99ab4feaa64a?w=400&h=300&fit=crop', '2025-09-29')
                 ]
             
+            # レビュー検索（クエリが空なら最新レビュー）
+            from app.routes.main import search_reviews
+            from markupsafe import escape
+            review_query = request.args.get('review_search', '')
+            try:
+                recent_reviews = search_reviews(review_query) or []
+            except Exception as review_error:
+                print(f"❌ レビュー検索エラー: {review_error}")
+                recent_reviews = []
+                sample = True
+            
+            review_items = ""
+            for review in recent_reviews:
+                review_items += f'''
+                    <li class="list-group-item">
+                        <span class="text-warning">⭐ {escape(review[3])}/5</span>
+                        <strong class="ms-2">{escape(review[7])}</strong>
+                        <small class="text-muted ms-2">{escape(review[6])}</small>
+                        <div class="mt-1">{escape(review[4])}</div>
+                    </li>
+                    '''
+            if not review_items:
+                review_items = '<li class="list-group-item text-muted">該当するレビューはありません</li>'
+            
             # 商品カードHTML生成
             product_cards = ""
             for p in featured_products[:4]:
@@ -523,6 +779,18 @@ def create_app():
             {('<div class="text-center mt-4"><p class="text-muted">商品データを読み込み中...</p></div>' if not featured_products else '')}
         </section>
 
+        <!-- レビュー検索セクション -->
+        <section class="mb-5">
+            <h3 class="mb-3"><i class="bi bi-chat-left-text"></i> レビュー</h3>
+            <form method="GET" action="/" class="input-group mb-3">
+                <input type="text" class="form-control" name="review_search" value="{escape(review_query)}" placeholder="コメント・ユーザー名・商品名で検索">
+                <button type="submit" class="btn btn-outline-primary"><i class="bi bi-search"></i> 検索</button>
+            </form>
+            <ul class="list-group">
+                {review_items}
+            </ul>
+        </section>
+
         <!-- 機能紹介セクション -->
         <section class="mb-5">
             <h3 class="text-center mb-4">
@@ -589,10 +857,14 @@ def create_app():
 </body>
 </html>'''
             
+            if sample:
+                # DBを読めなかっただけかもしれないので、サンプル表示はCDN・ページキャッシュに残さない
+                from app.cache_policy import uncacheable
+                return uncacheable(html_content)
             return html_content
             
         except Exception as e:
-            # エラーが発生した場合の最小限のHTMLページ
+            # エラーが発生した場合の最小限のHTMLページ（共有キャッシュに載らないよう 500）
             return f'''<!DOCTYPE html>
 <html lang="ja">
 <head>
@@ -609,7 +881,7 @@ def create_app():
         <a href="/health" class="btn btn-primary">システム状態を確認</a>
     </div>
 </body>
-</html>'''
+</html>''', 500
 
     # 追加ルート: 商品一覧ページ（mainブループリントから移植）
     @app.route('/products')
@@ -617,39 +889,84 @@ def create_app():
         """商品一覧ページ"""
         try:
             from app.database import db_config
+            from app.conditional import catalog_validators
             from flask import request
             
+            # カタログが変わっていなければ検索・描画せずに 304
+            validators = catalog_validators.catalog('products')
+            not_modified = validators.not_modified()
+            if not_modified:
+                return not_modified
+            
+            from app.pagination import cached_count, fetch_page, invalidate_counts, page_count
+            
             # カテゴリ、検索、ソート機能
             category = request.args.get('category', '')
             search = request.args.get('search', '')
             sort = request.args.get('sort', 'id')
+            page = max(request.args.get('page', 1, type=int), 1)
+            per_page = 12
             
-            # SQLクエリ構築
-            query = "SELECT * FROM products WHERE 1=1"
+            # 絞り込み条件
+            conditions = []
             params = []
             
             if category:
-                query += " AND category = ?"
+                conditions.append("category = ?")
                 params.append(category)
             
             if search:
-                query += " AND (name LIKE ? OR description LIKE ?)"
+                conditions.append("(name LIKE ? OR description LIKE ?)")
                 params.extend([f'%{search}%', f'%{search}%'])
             
-            # ソート順序
-            if sort == 'price_asc':
-                query += " ORDER BY price ASC"
-            elif sort == 'price_desc':
-                query += " ORDER BY price DESC"
-            elif sort == 'name':
-                query += " ORDER BY name ASC"
-            else:
-                query += " ORDER BY id DESC"
-            
-            products = db_config.execute_query(query, params) or []
+            where_sql = ' AND '.join(conditions)
+            
+            # ソート順序（評価順は集計テーブルを参照）
+            from app.ratings import rating_stats
+            order_columns, descending = {
+                'price_asc': (('price', 'id'), False),
+                'price_desc': (('price', 'id'), True),
+                'name': (('name', 'id'), False),
+                'rating': (rating_stats.order_columns('products'), True),
+            }.get(sort, (('id',), True))
+            # 評価順は集計テーブルを結合してその列で並べる
+            rating_join = rating_stats.join_sql('products') if sort == 'rating' else ''
+            from_sql = f"FROM products {rating_join}" if rating_join else "FROM products"
+            
+            from app.search import product_search
+            use_index = bool(search) and product_search.ensure_index()
+            
+            def load_page():
+                """現在のページの商品だけをDBから取得"""
+                if use_index:
+                    # 全文検索インデックスを使用（新着順指定時は関連度順）
+                    order_by = {
+                        'price_asc': 'p.price ASC',
+                        'price_desc': 'p.price DESC',
+                        'name': 'p.name ASC',
+                        'rating': rating_stats.order_sql('p')
+                    }.get(sort)
+                    return product_search.search(search, category=category, order_by=order_by,
+                                                 limit=per_page, offset=(page - 1) * per_page,
+                                                 joins=rating_stats.join_sql('p') if sort == 'rating' else '') or []
+                return fetch_page(db_config.execute_query, "SELECT products.*", from_sql, where_sql, params,
+                                  order_columns=order_columns, page=page, per_page=per_page,
+                                  descending=descending) or []
+            
+            def count_products():
+                if use_index:
+                    return product_search.count(search, category=category)
+                return cached_count(db_config.execute_query, "FROM products", where_sql, params)
+            
+            # ページング処理（総件数はキャッシュ）
+            total_products = count_products()
+            total_pages = page_count(total_products, per_page)
+            current_page = page
+            products = load_page()
             
             # 商品データがない場合、確実にサンプルデータを作成
-            if not products:
+            sample = False
+            if not products and total_products == 0 and not (search or category):
                 print("🔄 商品データが見つからないため、確実にサンプルデータを作成中...")
                 
                 # 強制的にテーブルを作成
@@ -682,13 +999,10 @@ def create_app():
                     """)
                     
                     # 管理者ユーザーとテストユーザーを作成
-                    db_config.execute_update(
+                    db_config.execute_many(
                         "INSERT OR IGNORE INTO users (username, password, email, is_admin) VALUES (?, ?, ?, ?)",
-                        ('admin', 'admin123', 'admin@shop.com', True)
-                    )
-                    db_config.execute_update(
-                        "INSERT OR IGNORE INTO users (username, password, email, is_admin) VALUES (?, ?, ?, ?)",
-                        ('user1', 'password123', 'user1@test.com', False)
+                        [('admin', 'admin123', 'admin@shop.com', True),
+                         ('user1', 'password123', 'user1@test.com', False)]
                     )
                     
                     # 高品質な商品データを挿入
@@ -703,14 +1017,16 @@ def create_app():
                         ('Dyson V15 Detect', 'レーザー技術で見えないゴミまで検出する最新コードレス掃除機。', 89999.0, 4, 'home', 'https://images.unsplash.com/photo-1558618666-fcd25c85cd64?w=500&h=400&fit=crop')
                     ]
                     
-                    for product_data in sample_products:
-                        db_config.execute_update(
-                            "INSERT OR IGNORE INTO products (name, description, price, stock, category, image_url) VALUES (?, ?, ?, ?, ?, ?)",
-                            product_data
-                        )
+                    db_config.execute_many(
+                        "INSERT OR IGNORE INTO products (name, description, price, stock, category, image_url) VALUES (?, ?, ?, ?, ?, ?)",
+                        sample_products
+                    )
                     
                     # データ再取得
-                    products = db_config.execute_query(query, params) or []
+                    invalidate_counts('products')
+                    products = load_page()
+                    total_products = count_products()
+                    total_pages = page_count(total_products, per_page)
                     print(f"✅ 完全なサンプルデータ作成完了: {len(products)}件の商品")
                     
                 except Exception as sample_error:
@@ -718,6 +1034,7 @@ def create_app():
                     
                 # データベースが完全に失敗した場合のハードコードフォールバック
                 if not products:
+                    sample = True
                     products = [
                         (1, 'MacBook Air M3', '最新のM3チップ搭載、超薄型ノートパソコン', 199999.0, 5, 'electronics', 'https://images.unsplash.com/photo-1541807084-5c52b6b3adef?w=500&h=400&fit=crop', '2025-09-29'),
                         (2, 'AirPods Pro', 'アクティブノイズキャンセリング搭載', 39999.0, 10, 'electronics', 'https://images.unsplash.com/photo-1572569511254-d8f925fe2cbb?w=500&h=400&fit=crop', '2025-09-29'),
@@ -726,17 +1043,21 @@ def create_app():
                         (5, 'エルゴデスクチェア', '人間工学デザインオフィスチェア', 45999.0, 8, 'furniture', 'https://images.unsplash.com/photo-1586023492125-27b2c045efd7?w=500&h=400&fit=crop', '2025-09-29'),
                         (6, 'Apple Watch Series 9', '最新フィットネス追跡スマートウォッチ', 59999.0, 12, 'electronics', 'https://images.unsplash.com/photo-1551816230-ef5deaed4a26?w=500&h=400&fit=crop', '2025-09-29')
                     ]
+                    total_products = len(products)
             
-            # カテゴリ一覧取得
-            categories = db_config.execute_query(
-                "SELECT DISTINCT category FROM products WHERE category IS NOT NULL ORDER BY category"
-            ) or []
+            # 検索結果に対するカテゴリ・価格帯の件数（1回の集計クエリ、カタログ版数でキャッシュ）
+            from app.facets import facet_service
+            facets = facet_service.facets(search=search, category=category)
+            categories = [(facet['value'], facet['count']) for facet in facets['categories']]
             
             # カテゴリデータがない場合のフォールバック
             if not categories and products:
                 categories = [('electronics',), ('fashion',), ('furniture',)]
             
-            # 商品カード生成
+            # 商品カード生成（評価は集計テーブルから1クエリで取得）
+            ratings = rating_stats.for_products(
+                [p[0] for p in products]
+            )
             product_cards = ""
             for product in products:
                 try:
@@ -745,6 +1066,10 @@ def create_app():
                     description = product[2][:100] + "..." if len(product) > 2 and product[2] else ""
                     image_url = product[6] if len(product) > 6 and product[6] else "/static/uploads/no-image.jpg"
                     product_id = product[0] if len(product) > 0 else ""
+                    rating = ratings.get(product_id)
+                    rating_html = (f'<p class="small text-warning mb-1"><i class="bi bi-star-fill"></i> '
+                                   f'{rating["average"]:.1f} <span class="text-muted">({rating["count"]}件)</span></p>'
+                                   if rating and rating['count'] else '')
                     
                     product_cards += f'''
                     <div class="col-md-4 col-sm-6 mb-4">
@@ -754,6 +1079,7 @@ def create_app():
                                 <h6 class="card-title">{name}</h6>
                                 <p class="card-text text-muted small">{description}</p>
                                 <div class="mt-auto">
+                                    {rating_html}
                                     <p class="product-price mb-3"><strong>¥{price}</strong></p>
                                     <a href="/product/{product_id}" class="btn btn-primary btn-sm">詳細を見る</a>
                                 </div>
@@ -769,8 +1095,32 @@ def create_app():
             category_options = ""
             for cat in categories:
                 cat_name = cat[0] if isinstance(cat, (list, tuple)) else cat
+                cat_label = f"{cat_name} ({cat[1]})" if isinstance(cat, (list, tuple)) and len(cat) > 1 else cat_name
                 selected = "selected" if cat_name == category else ""
-                category_options += f'<option value="{cat_name}" {selected}>{cat_name}</option>'
+                category_options += f'<option value="{cat_name}" {selected}>{cat_label}</option>'
+            
+            # 価格帯ごとの件数
+            price_badges = "".join(
+                f'<span class="badge bg-light text-dark border me-2">{bucket["label"]}: {bucket["count"]}件</span>'
+                for bucket in facets['price_buckets'] if bucket['count']
+            )
+            
+            # ページ送り（検索条件を引き継ぐ）
+            from urllib.parse import urlencode
+            
+            def page_url(number):
+                args = {key: value for key, value in (('search', search), ('category', category), ('sort', sort)) if value}
+                return '/products?' + urlencode(dict(args, page=number))
+            
+            pagination_html = ''
+            if total_pages > 1:
+                previous_link = (f'<li class="page-item"><a class="page-link" href="{page_url(current_page - 1)}">前へ</a></li>'
+                                 if current_page > 1 else '<li class="page-item disabled"><span class="page-link">前へ</span></li>')
+                next_link = (f'<li class="page-item"><a class="page-link" href="{page_url(current_page + 1)}">次へ</a></li>'
+                             if current_page < total_pages else '<li class="page-item disabled"><span class="page-link">次へ</span></li>')
+                pagination_html = (f'<nav class="mt-4"><ul class="pagination justify-content-center">{previous_link}'
+                                   f'<li class="page-item disabled"><span class="page-link">{current_page} / {total_pages}</span></li>'
+                                   f'{next_link}</ul></nav>')
             
             # HTMLページ生成
             html_content = f'''<!DOCTYPE html>
@@ -801,7 +1151,7 @@ def create_app():
     </nav>
 
     <div class="container my-5">
-        <h1 class="mb-4"><i class="bi bi-bag-check"></i> 商品一覧 ({len(products)}件)</h1>
+        <h1 class="mb-4"><i class="bi bi-bag-check"></i> 商品一覧 ({total_products}件)</h1>
         
         <!-- 検索・フィルター -->
         <div class="row mb-4">
@@ -809,7 +1159,7 @@ def create_app():
                 <form method="GET" class="row g-3">
                     <div class="col-md-3">
                         <label class="form-label">検索</label>
-                        <input type="text" class="form-control" name="search" value="{search}" placeholder="商品名・説明で検索">
+                        <input type="text" class="form-control" name="search" value="{search}" placeholder="商品名・説明で検索" data-suggest>
                     </div>
                     <div class="col-md-3">
                         <label class="form-label">カテゴリ</label>
@@ -825,6 +1175,7 @@ def create_app():
                             <option value="name" {"selected" if sort == "name" else ""}>名前順</option>
                             <option value="price_asc" {"selected" if sort == "price_asc" else ""}>価格安い順</option>
                             <option value="price_desc" {"selected" if sort == "price_desc" else ""}>価格高い順</option>
+                            <option value="rating" {"selected" if sort == "rating" else ""}>評価順</option>
                         </select>
                     </div>
                     <div class="col-md-3">
@@ -837,24 +1188,35 @@ def create_app():
             </div>
         </div>
 
+        <!-- 価格帯 -->
+        {('<div class="mb-4"><small class="text-muted me-2">価格帯:</small>' + price_badges + '</div>') if price_badges else ''}
+        
         <!-- 商品一覧 -->
         <div class="row">
             {product_cards}
         </div>
         
+        {pagination_html}
+        
         {('<div class="text-center mt-5"><div class="alert alert-info"><h5>商品データがありません</h5><p>データベースを初期化してサンプル商品を追加してください。</p><a href="/api/create-tables" class="btn btn-warning me-2">テーブル作成</a><a href="/api/seed-data" class="btn btn-success">サンプルデータ追加</a><a href="/products" class="btn btn-primary ms-2">再読み込み</a></div></div>' if not products else '')}
     </div>
 
     <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js"></script>
+    <!-- 検索ボックスの入力補完（data-suggest） -->
+    <script src="/static/js/main.js"></script>
 </body>
 </html>'''
             
-            return html_content
+            if sample:
+                # ハードコードの商品はDB障害時の代替表示なので、CDN・ページキャッシュに残さない
+                from app.cache_policy import uncacheable
+                return uncacheable(html_content)
+            return validators.apply(html_content)
             
         except Exception as e:
             return f'''<!DOCTYPE html>
 <html><head><title>エラー</title><link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css" rel="stylesheet"></head>
-<body><div class="container mt-5"><h1>商品一覧エラー</h1><p>エラー: {str(e)}</p><a href="/" class="btn btn-primary">ホームに戻る</a></div></body></html>'''
+<body><div class="container mt-5"><h1>商品一覧エラー</h1><p>エラー: {str(e)}</p><a href="/" class="btn btn-primary">ホームに戻る</a></div></body></html>''', 500
 
     # ログインページ
     @app.route('/auth/login', methods=['GET', 'POST'])
@@ -1097,11 +1459,19 @@ def create_app():
         """商品詳細ページ"""
         try:
             from app.database import db_config
+            from app.conditional import catalog_validators
+            
+            # 商品とレビューが変わっていなければ問い合わせずに 304
+            validators = catalog_validators.product('product', product_id)
+            not_modified = validators.not_modified()
+            if not_modified:
+                return not_modified
             
             # 商品情報取得
             products = db_config.execute_query(
                 "SELECT * FROM products WHERE id = ?",
-                (product_id,)
+                (product_id,),
+                cache_tables=('products',)
             )
             
             if not products:
@@ -1109,7 +1479,42 @@ def create_app():
                 
             product = products[0]
             
-            return f'''<!DOCTYPE html>
+            # 評価集計（平均・件数・★別件数）
+            from app.ratings import rating_stats
+            rating = rating_stats.get(product_id)
+            rating_html = '<p class="text-muted">まだレビューがありません</p>'
+            if rating['count']:
+                histogram = ''.join(
+                    f'<div class="small">★{star}: {rating["histogram"][star]}件</div>' for star in range(5, 0, -1)
+                )
+                rating_html = (f'<p class="text-warning"><i class="bi bi-star-fill"></i> {rating["average"]:.1f} '
+                               f'<span class="text-muted">({rating["count"]}件のレビュー)</span></p>{histogram}')
+            
+            # レビュー（新しい順に1ページ分だけ取得、先頭ページはキャッシュ。続きはカーソルで取得）
+            from flask import request
+            from markupsafe import escape
+            from app.review_feed import review_feed
+            reviews, next_cursor = review_feed.page(product_id, cursor=request.args.get('reviews_cursor'))
+            review_cards = ''.join(f'''
+            <div class="card mb-3">
+                <div class="card-body">
+                    <div class="d-flex justify-content-between">
+                        <h6>{escape(review['created_at'])}</h6>
+                        <div>
+                            <span class="text-warning">⭐ {escape(review['rating'])}/5</span>
+                            <small class="text-muted">{escape(review['username'])}</small>
+                        </div>
+                    </div>
+                    <div class="review-content mt-2">{escape(review['comment'])}</div>
+                </div>
+            </div>''' for review in reviews) or '<p class="text-muted">まだレビューがありません</p>'
+            more_reviews_html = ''
+            if next_cursor:
+                more_reviews_html = (f'<div class="text-center"><a href="/product/{product_id}?reviews_cursor={next_cursor}" '
+                                     f'class="btn btn-outline-secondary" data-review-more="product" '
+                                     f'data-product-id="{product_id}" data-cursor="{next_cursor}">もっと見る</a></div>')
+            
+            return validators.apply(f'''<!DOCTYPE html>
 <html lang="ja">
 <head>
     <meta charset="UTF-8">
@@ -1140,15 +1545,22 @@ def create_app():
                 <p class="text-muted">{product[2] if len(product) > 2 else ''}></p>
                 <h3 class="text-primary">¥{product[3]:,.0f}</h3>
                 <p>在庫: {product[4] if len(product) > 4 else 0}個</p>
+                {rating_html}
                 <button class="btn btn-primary btn-lg"><i class="bi bi-cart-plus"></i> カートに追加</button>
                 <a href="/products" class="btn btn-secondary">商品一覧に戻る</a>
             </div>
         </div>
+        <h3 class="mt-5 mb-3">レビュー</h3>
+        <div class="reviews-list">{review_cards}
+        </div>
+        {more_reviews_html}
     </div>
+    <!-- 「もっと見る」は /api/reviews から続きを読み込む -->
+    <script src="/static/js/main.js"></script>
 </body>
-</html>'''
+</html>''')
         except Exception as e:
-            return f'<h1>エラー: {str(e)}</h1><a href="/products">商品一覧に戻る</a>'
+            return f'<h1>エラー: {str(e)}</h1><a href="/products">商品一覧に戻る</a>', 500
 
     # 必須: request, redirect, sessionのインポートを追加
     from flask import request, redirect, session
@@ -1168,6 +1580,9 @@ def create_app():
         app.register_blueprint(api.bp)
         app.register_blueprint(mail.bp)
         
+        # mainブループリントは / などがアプリ本体と重複するため登録せず、検索ページだけ公開する
+        app.add_url_rule('/search', 'search', main.search)
+        
         print("✅ 全ブループリント登録完了")
         
     except ImportError as e:
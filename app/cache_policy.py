@@ -0,0 +1,219 @@
+import os
+from fnmatch import fnmatchcase
+
+from dotenv import load_dotenv
+from flask import current_app, make_response, request, session
+
+from app.microcache import SESSION_COOKIES
+
+# 環境変数を読み込み
+load_dotenv()
+
+# after_request で Cache-Control を付けるか
+HTTP_CACHE_ENABLED = os.getenv('HTTP_CACHE_ENABLED', 'true').lower() == 'true'
+# CDN（Vercel のエッジなど共有キャッシュ）がカタログのページを保持する秒数
+HTTP_CACHE_S_MAXAGE = int(os.getenv('HTTP_CACHE_S_MAXAGE', 30))
+# s-maxage 切れから何秒間は古いページを返しつつ裏で取り直してよいか
+HTTP_CACHE_STALE_WHILE_REVALIDATE = int(os.getenv('HTTP_CACHE_STALE_WHILE_REVALIDATE', 60))
+# 静的ファイル（/static）をブラウザ・CDNが保持する秒数
+HTTP_CACHE_STATIC_MAX_AGE = int(os.getenv('HTTP_CACHE_STATIC_MAX_AGE', 86400))
+
+# 共有キャッシュに保存してよいステータスコード（リダイレクトやエラーは保存させない）
+CACHEABLE_STATUSES = {200, 203, 204, 206, 300, 301, 304, 404, 405, 410, 414, 501}
+
+
+class CachePolicy:
+    """1つのルートのキャッシュ方針（Cache-Control と Vary）
+
+    public=False は共有キャッシュに保存させない（private）。
+    store=False は no-store（ブラウザにも保存させない）で、reason に理由を書く。
+    session_safe=True は内容がログイン状態に依存しない（静的ファイルなど）ことを表し、
+    セッション付きのリクエストでも同じ方針を使う。
+    """
+
+    def __init__(self, public=False, max_age=0, s_maxage=None, stale_while_revalidate=None,
+                 stale_if_error=None, vary=(), store=True, reason=None, session_safe=False):
+        self.public = public
+        self.max_age = max_age
+        self.s_maxage = s_maxage
+        self.stale_while_revalidate = stale_while_revalidate
+        self.stale_if_error = stale_if_error
+        self.vary = vary
+        self.store = store
+        self.reason = reason
+        self.session_safe = session_safe
+
+    @property
+    def cacheable(self):
+        """CDNなどの共有キャッシュに保存されうるか"""
+        return self.store and self.public
+
+    def header(self):
+        if not self.store:
+            return 'no-store'
+        if not self.public:
+            return 'private, no-cache' if self.max_age == 0 else f'private, max-age={self.max_age}'
+        directives = ['public', f'max-age={self.max_age}']
+        if self.s_maxage is not None:
+            directives.append(f's-maxage={self.s_maxage}')
+        if self.stale_while_revalidate:
+            directives.append(f'stale-while-revalidate={self.stale_while_revalidate}')
+        if self.stale_if_error:
+            directives.append(f'stale-if-error={self.stale_if_error}')
+        return ', '.join(directives)
+
+
+def no_store(reason):
+    return CachePolicy(store=False, reason=reason)
+
+
+def uncacheable(response):
+    """このレスポンスだけ no-store にする（DB障害時のサンプル表示など、正常時と違う内容を返すとき）
+
+    ルートの方針より優先され、ページキャッシュ（microcache）にも保存されない。
+    """
+    response = make_response(response)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+# カタログのページ: ETag で 304 を返せるのでブラウザは毎回再検証し、CDNは s-maxage 秒保持する
+CATALOG_PAGE = CachePolicy(public=True, max_age=0, s_maxage=HTTP_CACHE_S_MAXAGE,
+                           stale_while_revalidate=HTTP_CACHE_STALE_WHILE_REVALIDATE,
+                           stale_if_error=HTTP_CACHE_STALE_WHILE_REVALIDATE)
+# テンプレートのページはヘッダーにログイン状態が出るのでクッキーごとに分ける
+CATALOG_TEMPLATE_PAGE = CachePolicy(public=True, max_age=0, s_maxage=HTTP_CACHE_S_MAXAGE,
+                                    stale_while_revalidate=HTTP_CACHE_STALE_WHILE_REVALIDATE,
+                                    stale_if_error=HTTP_CACHE_STALE_WHILE_REVALIDATE, vary=('Cookie',))
+# 登録のないルート: 共有キャッシュには置かず、ブラウザは毎回再検証する
+DEFAULT_POLICY = CachePolicy(reason='ポリシー未登録')
+
+# (エンドポイント名のパターン, 方針)。上から順に最初に一致したものを使う
+CACHE_POLICIES = [
+    ('static', CachePolicy(public=True, max_age=HTTP_CACHE_STATIC_MAX_AGE, s_maxage=HTTP_CACHE_STATIC_MAX_AGE,
+                           session_safe=True)),
+    # カタログ（匿名ユーザー向けの内容で、商品・レビューの版数から ETag を返す）
+    ('main_index', CATALOG_PAGE),
+    ('products_list', CATALOG_PAGE),
+    ('product_detail', CATALOG_PAGE),
+    ('api_products', CATALOG_PAGE),
+    ('api.api_products', CATALOG_PAGE),
+    ('api.api_suggest', CATALOG_PAGE),
+    ('api.api_reviews', CATALOG_PAGE),
+    ('product.product_detail', CATALOG_TEMPLATE_PAGE),
+    ('product.categories', CATALOG_TEMPLATE_PAGE),
+    ('review.all_reviews', CATALOG_TEMPLATE_PAGE),
+    # 利用者ごとの情報・状態を変える操作
+    ('auth.*', no_store('ログイン・利用者情報')),
+    ('login_page', no_store('ログイン・利用者情報')),
+    ('register_page', no_store('ログイン・利用者情報')),
+    ('cart.*', no_store('利用者ごとのカート')),
+    ('order.*', no_store('利用者ごとの注文')),
+    ('user.*', no_store('利用者ごとのプロフィール・ファイル')),
+    ('mail.*', no_store('利用者ごとのメール')),
+    ('admin.*', no_store('管理画面')),
+    ('api.*', no_store('サーバー操作・ファイル参照API')),
+    # 監視・運用・デバッグ用（常に最新の状態を返す）
+    ('health_check', no_store('死活監視')),
+    ('pool_stats', no_store('運用統計')),
+    ('db_test', no_store('デバッグ用API')),
+    ('api_users', no_store('デバッグ用API')),
+    ('api_tables', no_store('デバッグ用API')),
+    ('create_tables', no_store('デバッグ用API')),
+    ('seed_data', no_store('デバッグ用API')),
+    ('config_check', no_store('デバッグ用API')),
+    ('enable_fallback', no_store('デバッグ用API')),
+    ('fallback_test', no_store('デバッグ用API')),
+    ('alt_connect', no_store('デバッグ用API')),
+    ('simple_test', no_store('デバッグ用API')),
+    ('raw_sql', no_store('デバッグ用API')),
+]
+
+
+class CachePolicies:
+    """ルート（エンドポイント名）ごとのキャッシュ方針を after_request で Cache-Control に反映する
+
+    ルートが自分で Cache-Control を付けたレスポンスはそのまま返す。
+    どの方針でも、セッション系のクッキー付きのリクエスト、Set-Cookie 付き・
+    セッションを書き換えたレスポンス、GET/HEAD 以外、保存に向かないステータスでは
+    no-store にする（ログイン中のページをCDNやブラウザに残さない）。
+    """
+
+    def __init__(self, policies=CACHE_POLICIES, default=DEFAULT_POLICY,
+                 session_cookies=SESSION_COOKIES, enabled=HTTP_CACHE_ENABLED):
+        self.policies = list(policies)
+        self.default = default
+        self.session_cookies = session_cookies
+        self.enabled = enabled
+
+    def register(self, pattern, policy):
+        """方針を追加（既存の登録より優先する）"""
+        self.policies.insert(0, (pattern, policy))
+
+    def resolve(self, endpoint):
+        """エンドポイントに適用する (パターン, 方針)（一致しなければ (None, 既定の方針)）"""
+        for pattern, policy in self.policies:
+            if endpoint and fnmatchcase(endpoint, pattern):
+                return pattern, policy
+        return None, self.default
+
+    def init_app(self, app):
+        app.after_request(self.apply)
+
+    def _no_store_reason(self, response, policy):
+        """このレスポンスを保存させてはいけない理由（無ければ None）"""
+        if request.method not in ('GET', 'HEAD'):
+            return f'{request.method} リクエスト'
+        if 'Set-Cookie' in response.headers or session.modified:
+            return 'クッキーを設定するレスポンス'
+        cookies = set(self.session_cookies) | {current_app.config.get('SESSION_COOKIE_NAME', 'session')}
+        if not policy.session_safe and any(name in request.cookies for name in cookies):
+            return 'セッション付きのリクエスト'
+        if response.status_code not in CACHEABLE_STATUSES:
+            return f'ステータス {response.status_code}'
+        return None
+
+    def apply(self, response):
+        # 静的ファイルに send_file が付ける既定の no-cache は方針で置き換える
+        explicit = 'Cache-Control' in response.headers and request.endpoint != 'static'
+        if not self.enabled or explicit:
+            return response
+        _, policy = self.resolve(request.endpoint)
+        if policy.store and self._no_store_reason(response, policy):
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+        response.headers['Cache-Control'] = policy.header()
+        if policy.store:
+            response.vary.update(policy.vary)
+        return response
+
+    def report(self, app):
+        """全ルートの方針と、共有キャッシュに載らない理由のリスト"""
+        first_rule = {}
+        entries = []
+        for rule in sorted(app.url_map.iter_rules(), key=lambda rule: rule.rule):
+            methods = sorted((rule.methods or set()) - {'HEAD', 'OPTIONS'})
+            pattern, policy = self.resolve(rule.endpoint)
+            reasons = []
+            if 'GET' not in methods:
+                reasons.append(f"GETを受け付けない（{', '.join(methods)}）")
+            shadowing = first_rule.setdefault((rule.rule, 'GET' in methods), rule.endpoint)
+            if shadowing != rule.endpoint and 'GET' in methods:
+                reasons.append(f'同じURLの {shadowing} が先に一致する')
+            if not policy.cacheable:
+                reasons.append(policy.reason or policy.header())
+            entries.append({
+                'rule': rule.rule,
+                'endpoint': rule.endpoint,
+                'methods': methods,
+                'policy': pattern,
+                'cache_control': policy.header(),
+                'vary': list(policy.vary),
+                'cacheable': not reasons,
+                'reasons': reasons,
+            })
+        return entries
+
+
+# グローバルインスタンス
+cache_policies = CachePolicies()
@@ -0,0 +1,103 @@
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """接続失敗が続いたら一定時間その接続先を使わないようにするブレーカー
+
+    - closed: 通常どおり接続する。連続 failure_threshold 回失敗すると open
+    - open: 接続を試みずに呼び出し側へ即座に知らせる（フォールバックかエラー）
+    - half_open: cooldown 経過後、バックグラウンドで probe を1回だけ実行中。
+      成功すれば closed、失敗すれば再び open（リクエストは引き続き接続しない）
+    """
+
+    def __init__(self, name, probe, failure_threshold=5, cooldown=30):
+        self.name = name
+        self.probe = probe
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._last_error = None
+        self._transitions = {}
+        self._stats = {'rejected': 0, 'probes': 0, 'probe_failures': 0}
+
+    def _transition_locked(self, state):
+        key = f"{self._state}->{state}"
+        self._transitions[key] = self._transitions.get(key, 0) + 1
+        self._state = state
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        print(f"🔄 サーキットブレーカー[{self.name}]: {key}")
+
+    def allow(self):
+        """接続を試みてよいか（open 中は False、cooldown 経過時は probe を開始）"""
+        if self._state == CLOSED:
+            return True
+        start_probe = False
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            self._stats['rejected'] += 1
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self._transition_locked(HALF_OPEN)
+                start_probe = True
+        if start_probe:
+            threading.Thread(target=self._run_probe, name=f"{self.name}-probe", daemon=True).start()
+        return False
+
+    def _run_probe(self):
+        with self._lock:
+            self._stats['probes'] += 1
+        try:
+            self.probe()
+        except Exception as e:
+            with self._lock:
+                self._stats['probe_failures'] += 1
+                self._last_error = type(e).__name__
+                if self._state == HALF_OPEN:
+                    self._transition_locked(OPEN)
+            return
+        with self._lock:
+            self._failures = 0
+            if self._state == HALF_OPEN:
+                self._transition_locked(CLOSED)
+
+    def record_success(self):
+        if self._failures == 0:
+            return
+        with self._lock:
+            self._failures = 0
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self._failures += 1
+            if error is not None:
+                # 接続先のホスト名などを含むためメッセージは残さない
+                self._last_error = type(error).__name__
+            if self._state == CLOSED and self._failures >= self.failure_threshold:
+                self._transition_locked(OPEN)
+
+    @property
+    def state(self):
+        return self._state
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'state': self._state,
+                'consecutive_failures': self._failures,
+                'failure_threshold': self.failure_threshold,
+                'cooldown': self.cooldown,
+                'open_for': round(time.monotonic() - self._opened_at, 1) if self._state != CLOSED else 0,
+                'transitions': dict(self._transitions),
+                'last_error': self._last_error,
+            })
+            return stats
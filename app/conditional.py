@@ -0,0 +1,158 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask import current_app, make_response, request, session
+
+from app.database import db_config
+
+# catalog_versions テーブルが無かったとき、次に確認するまでの秒数（マイグレーション適用待ち）
+_RECHECK_SECONDS = 60
+
+
+def _to_utc(value):
+    """DBの時刻（SQLiteは文字列、PostgreSQLは datetime。どちらもUTC）を秒単位のUTC datetime に"""
+    if value is None:
+        return None
+    if not isinstance(value, datetime):
+        try:
+            value = datetime.fromisoformat(str(value))
+        except ValueError:
+            return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).replace(microsecond=0)
+
+
+class Validators:
+    """1つの表現の ETag と Last-Modified（どちらも None なら条件付きリクエストは扱わない）"""
+
+    def __init__(self, etag=None, last_modified=None):
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def not_modified(self):
+        """If-None-Match / If-Modified-Since が現在の版と一致すれば 304 レスポンス、それ以外は None
+
+        If-None-Match があれば If-Modified-Since は見ない（RFC 9110）。
+        """
+        if self.etag is None:
+            return None
+        if request.if_none_match:
+            matched = request.if_none_match.contains_weak(self.etag)
+        elif request.if_modified_since and self.last_modified:
+            matched = self.last_modified <= request.if_modified_since
+        else:
+            matched = False
+        if not matched:
+            return None
+        return self.apply(current_app.response_class(status=304))
+
+    def apply(self, response):
+        """レスポンスに ETag / Last-Modified を付ける"""
+        response = make_response(response)
+        if self.etag is None:
+            return response
+        response.set_etag(self.etag)
+        if self.last_modified:
+            response.last_modified = self.last_modified
+        # ログイン状態でヘッダー表示が変わるページがあるので、共有キャッシュはクッキーごとに分ける
+        response.vary.add('Cookie')
+        return response
+
+
+class CatalogValidators:
+    """商品・レビューの版数（catalog_versions）から ETag / Last-Modified を作る
+
+    版数は products / reviews への書き込みでトリガーが進める（migrations の v5）ので、
+    本文を描画してハッシュを取らなくても、版数1行を読むだけで 304 を返せる。
+    版数は他のプロセス・インスタンスの書き込みも反映するよう、キャッシュせずに読む。
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._ready = {}
+        self._lock = threading.Lock()
+
+    def _backend(self):
+        return 'sqlite' if self.db.is_sqlite_mode() else 'postgres'
+
+    def _table_exists(self, backend):
+        if backend == 'sqlite':
+            rows = self.db.execute_query(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'catalog_versions'",
+                primary=True
+            )
+        else:
+            rows = self.db.execute_query(
+                "SELECT table_name FROM information_schema.tables WHERE table_name = 'catalog_versions'",
+                primary=True
+            )
+        return bool(rows)
+
+    def available(self):
+        """catalog_versions テーブルがあるか（無ければ一定時間ごとに確認し直す）"""
+        backend = self._backend()
+        checked = self._ready.get(backend)
+        if checked is None or (not checked[0] and time.monotonic() - checked[1] > _RECHECK_SECONDS):
+            with self._lock:
+                checked = self._ready.get(backend)
+                if checked is None or (not checked[0] and time.monotonic() - checked[1] > _RECHECK_SECONDS):
+                    ready = self._table_exists(backend)
+                    if not ready:
+                        print(f"⚠️ catalog_versions テーブルがありません ({backend}) - ETag / 304 は使いません")
+                    checked = self._ready[backend] = (ready, time.monotonic())
+        return checked[0]
+
+    def _versions(self, scopes):
+        # プロセス内キャッシュを通すと他のプロセスの書き込みに気付かず 304 を返してしまうので、
+        # 毎回プライマリから読む（主キー1件の検索）
+        placeholders = ', '.join('?' for _ in scopes)
+        rows = self.db.execute_query(
+            f"SELECT scope, version, updated_at FROM catalog_versions WHERE scope IN ({placeholders})",
+            tuple(scopes), primary=True
+        )
+        return {row['scope']: row for row in rows or []}
+
+    def version(self, scope='catalog'):
+        """scope の現在の版数（テーブル・行が無ければ None）。ファセット集計のキャッシュキーにも使う"""
+        if not self.available():
+            return None
+        row = self._versions((scope,)).get(scope)
+        return row['version'] if row else None
+
+    def _cacheable(self):
+        # フラッシュメッセージは1回しか出ないので、表示待ちがあるときは 304 にしない
+        return '_flashes' not in session and self.available()
+
+    def _etag(self, kind, *parts):
+        # 同じ版でもログイン中のユーザーごとに表示が違うことがある
+        user_id = session.get('user_id')
+        suffix = f"-u{user_id}" if user_id is not None else ''
+        return f"{kind}-{'-'.join(str(part) for part in parts)}{suffix}"
+
+    def catalog(self, kind):
+        """商品一覧・カテゴリ一覧など、カタログ全体に依存するページの Validators"""
+        if not self._cacheable():
+            return Validators()
+        row = self._versions(('catalog',)).get('catalog')
+        if row is None:
+            return Validators()
+        return Validators(self._etag(kind, f"c{row['version']}"), _to_utc(row['updated_at']))
+
+    def product(self, kind, product_id):
+        """1商品（とそのレビュー）に依存するページの Validators（商品が無ければ扱わない）"""
+        if not self._cacheable():
+            return Validators()
+        try:
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            return Validators()
+        row = self._versions((f"product:{product_id}",)).get(f"product:{product_id}")
+        if row is None:
+            return Validators()
+        return Validators(self._etag(kind, product_id, f"v{row['version']}"), _to_utc(row['updated_at']))
+
+
+# グローバルインスタンス
+catalog_validators = CatalogValidators(db_config)
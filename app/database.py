@@ -1,34 +1,125 @@
+import io
+import itertools
 import os
+import re
+import threading
+import time
+from contextlib import contextmanager
 import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
 from psycopg2.extras import RealDictCursor
 import sqlite3
 from supabase import create_client, Client
 from dotenv import load_dotenv
+from flask import g, has_app_context, has_request_context, session
+from app.circuit_breaker import CircuitBreaker
+from app.db_pool import CircuitOpenError, ConnectionUnavailableError, PoolTimeoutError, PostgresConnectionPool
+from app.query_audit import query_recorder
+from app.replicas import ReplicaRouter
+from app.result_cache import result_cache
+from app.rows import iter_rows, rows_from_cursor
+from app.statements import statement_cache
+from app.transaction import Transaction
 
 # 環境変数を読み込み
 load_dotenv()
 
+# bulk_insert でSQLに埋め込むテーブル名・列名
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def _copy_text(value):
+    """COPY FROM STDIN（text形式）の1フィールド"""
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
 class DatabaseConfig:
     def __init__(self):
         self.supabase_url = os.getenv('SUPABASE_URL')
         self.supabase_key = os.getenv('SUPABASE_KEY')
         self.database_url = os.getenv('DATABASE_URL')
         
+        # 接続プール設定
+        self.pool_min = int(os.getenv('DB_POOL_MIN', 1))
+        self.pool_max = int(os.getenv('DB_POOL_MAX', 10))
+        self.pool_idle_timeout = float(os.getenv('DB_POOL_IDLE_TIMEOUT', 300))
+        self.pool_checkout_timeout = float(os.getenv('DB_POOL_CHECKOUT_TIMEOUT', 10))
+        self.pool_healthcheck_interval = float(os.getenv('DB_POOL_HEALTHCHECK_INTERVAL', 30))
+        self.connect_timeout = int(os.getenv('DB_CONNECT_TIMEOUT', 10))
+        self.startup_connect_timeout = int(os.getenv('DB_STARTUP_CONNECT_TIMEOUT', 3))
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        
+        # PostgreSQL障害時は一定回数の失敗で接続を止め、待たずにSQLiteへフォールバック
+        # （DB_BREAKER_FALLBACK=false ならフォールバックせず接続なしとして即座に失敗）
+        self.breaker = CircuitBreaker(
+            'postgres', self._probe_postgres,
+            failure_threshold=int(os.getenv('DB_BREAKER_THRESHOLD', 3)),
+            cooldown=float(os.getenv('DB_BREAKER_COOLDOWN', 30))
+        )
+        self.breaker_fallback = os.getenv('DB_BREAKER_FALLBACK', 'true').lower() == 'true'
+        
+        # 読み取り専用レプリカ（カンマ区切り、sqlite:///パス も可）。execute_query / iter_query を振り分ける
+        self.replicas = ReplicaRouter(
+            [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()],
+            strategy=os.getenv('DB_REPLICA_STRATEGY', 'round_robin'),
+            pool_options={'minconn': 0, 'maxconn': self.pool_max, 'idle_timeout': self.pool_idle_timeout,
+                          'checkout_timeout': self.pool_checkout_timeout,
+                          'healthcheck_interval': self.pool_healthcheck_interval},
+            breaker_threshold=self.breaker.failure_threshold,
+            breaker_cooldown=self.breaker.cooldown,
+            connect_timeout=self.connect_timeout
+        )
+        # 書き込み後この秒数は同じセッションの読み取りをプライマリで行う（レプリカの遅延対策）
+        self.read_your_writes_seconds = float(os.getenv('DB_READ_YOUR_WRITES_SECONDS', 5))
+        
+        # execute_query(cache_tables=...) の結果キャッシュ（書き込んだテーブルで破棄）
+        self.result_cache = result_cache
+        
+        # iter_query で1回に取得する行数
+        self.iter_batch_size = int(os.getenv('DB_ITER_BATCH_SIZE', 500))
+        # execute_many / bulk_insert で1回に送る行数
+        self.bulk_chunk_size = int(os.getenv('DB_BULK_CHUNK_SIZE', 5000))
+        self._iter_ids = itertools.count(1)
+        
         # 環境変数の確認
         print(f"🔍 SUPABASE_URL: {'✅' if self.supabase_url else '❌'}")
         print(f"🔍 DATABASE_URL: {'✅' if self.database_url else '❌'}")
         
-        # 接続テストを実行してフォールバックを決定
-        self.use_postgres = self._test_postgres_connection()
+        # 接続テストは初めて use_postgres を参照したときに行う（import を待たせない）
+        self._use_postgres = None
+        self._startup_lock = threading.Lock()
+    
+    @property
+    def use_postgres(self):
+        """PostgreSQLを使うか（初回参照時に接続テストを実行してフォールバックを決定）"""
+        if self._use_postgres is None:
+            with self._startup_lock:
+                if self._use_postgres is None:
+                    self._use_postgres = self._startup()
+        return self._use_postgres
+    
+    @use_postgres.setter
+    def use_postgres(self, value):
+        self._use_postgres = value
+    
+    def _startup(self):
+        """接続テストとSupabaseクライアントの初期化（PostgreSQLを使うかを返す）"""
+        use_postgres = self._test_postgres_connection()
         
         # Supabaseクライアントの初期化
-        if self.supabase_url and self.supabase_key and self.use_postgres:
+        if self.supabase_url and self.supabase_key and use_postgres:
             try:
                 self.supabase: Client = create_client(self.supabase_url, self.supabase_key)
                 print("✅ Supabaseクライアント初期化成功")
             except Exception as e:
                 print(f"❌ Supabaseクライアント初期化エラー: {e}")
-                self.use_postgres = False
+                use_postgres = False
+        return use_postgres
                 
     def _test_postgres_connection(self):
         """PostgreSQLの接続テストを実行"""
@@ -38,7 +129,7 @@ class DatabaseConfig:
             
         try:
             # 短いタイムアウトで接続テスト
-            conn = psycopg2.connect(self.database_url, connect_timeout=3)
+            conn = psycopg2.connect(self.database_url, connect_timeout=self.startup_connect_timeout)
             cursor = conn.cursor()
             cursor.execute("SELECT 1")
             cursor.close()
@@ -152,27 +243,16 @@ class DatabaseConfig:
             
         try:
             if self.use_postgres and self.database_url:
-                print(f"🔍 PostgreSQL接続試行: {self.database_url[:50]}...")
+                # 同一リクエスト内では同じプール接続を再利用
+                if has_app_context():
+                    conn = g.get('_db_conn')
+                    if conn is not None and not conn.closed:
+                        return conn
                 
-                # PostgreSQL/Supabase接続（接続パラメータを追加）
-                conn = psycopg2.connect(
-                    self.database_url,
-                    cursor_factory=RealDictCursor,
-                    connect_timeout=10,
-                    application_name='vulnerable_shopping_mall'
-                )
+                conn = self._checkout_postgres()
                 
-                # autocommitモードを設定（DDL文用）
-                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
-                
-                # 接続テスト
-                cursor = conn.cursor()
-                try:
-                    cursor.execute("SELECT current_database(), current_schema(), version()")
-                    result = cursor.fetchone()
-                    print(f"✅ PostgreSQL接続成功: DB={result[0]}, Schema={result[1]}")
-                except Exception as e:
-                    print(f"⚠️ 詳細情報取得失敗: {e}, でも接続は成功")
+                if has_app_context():
+                    g._db_conn = conn
                 
                 return conn
             else:
@@ -190,105 +270,374 @@ class DatabaseConfig:
                 print("✅ SQLite接続成功（フォールバック）")
                 return conn
                 
+        except CircuitOpenError:
+            # 障害中は接続を待たない（ログも出さない）
+            return self._fallback_sqlite_connection() if self.breaker_fallback else None
+            
+        except PoolTimeoutError as e:
+            # プールの枯渇は負荷によるもの。別のDB（SQLite）に読み書きさせず接続なしとして失敗させる
+            print(f"⚠️ 接続プール待ちタイムアウト: {e}")
+            return None
+            
         except psycopg2.Error as e:
             print(f"❌ PostgreSQL接続エラー: {e}")
             print("⚠️ SQLiteにフォールバック")
             
             # PostgreSQL接続失敗時はSQLiteにフォールバック
-            try:
-                import os
-                db_path = os.path.join(os.path.dirname(__file__), '..', 'database', 'shop.db')
-                os.makedirs(os.path.dirname(db_path), exist_ok=True)
-                
-                conn = sqlite3.connect(db_path)
-                conn.row_factory = sqlite3.Row
-                print("✅ SQLiteフォールバック接続成功")
-                return conn
-            except:
-                # 最終フォールバック：メモリ内SQLite
-                conn = sqlite3.connect(':memory:')
-                conn.row_factory = sqlite3.Row
-                print("⚠️ メモリ内SQLite使用（一時的）")
-                return conn
+            conn = self._fallback_sqlite_connection()
+            print("✅ SQLiteフォールバック接続成功")
+            return conn
                 
         except Exception as e:
             print(f"❌ 一般的なデータベース接続エラー: {e}")
             return None
     
+    def _fallback_sqlite_connection(self):
+        """PostgreSQLを使えないときのローカルSQLite接続"""
+        try:
+            db_path = os.path.join(os.path.dirname(__file__), '..', 'database', 'shop.db')
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            
+            conn = sqlite3.connect(db_path)
+            conn.row_factory = sqlite3.Row
+            return conn
+        except:
+            # 最終フォールバック：メモリ内SQLite
+            conn = sqlite3.connect(':memory:')
+            conn.row_factory = sqlite3.Row
+            print("⚠️ メモリ内SQLite使用（一時的）")
+            return conn
+    
+    def _checkout_postgres(self):
+        """プールから接続を取得（ブレーカーが open なら待たずに CircuitOpenError）"""
+        if not self.breaker.allow():
+            raise CircuitOpenError('PostgreSQL circuit breaker is open')
+        try:
+            conn = self._get_pool().getconn()
+        except PoolTimeoutError:
+            # プールの枯渇はサーバー障害ではない
+            raise
+        except psycopg2.OperationalError as e:
+            self.breaker.record_failure(e)
+            raise
+        self.breaker.record_success()
+        return conn
+    
+    def _probe_postgres(self):
+        """ブレーカーの half-open 時にバックグラウンドで実行する疎通確認"""
+        conn = psycopg2.connect(self.database_url, connect_timeout=self.connect_timeout)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+        finally:
+            conn.close()
+    
+    def _get_pool(self):
+        """PostgreSQL接続プールを取得（初回のみ作成）"""
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = PostgresConnectionPool(
+                        self.database_url,
+                        minconn=self.pool_min,
+                        maxconn=self.pool_max,
+                        idle_timeout=self.pool_idle_timeout,
+                        checkout_timeout=self.pool_checkout_timeout,
+                        healthcheck_interval=self.pool_healthcheck_interval,
+                        connect_timeout=self.connect_timeout
+                    )
+        return self._pool
+    
+    def release_connection(self, conn, discard=False):
+        """接続を解放（SQLiteは閉じる、PostgreSQLはプールへ返却）"""
+        if conn is None:
+            return
+        if isinstance(conn, sqlite3.Connection):
+            conn.close()
+            return
+        
+        # 使用中に壊れた接続はブレーカーの失敗として数える
+        if discard:
+            self.breaker.record_failure()
+        
+        # リクエストに紐付いた接続はteardownで返却する
+        if has_app_context() and g.get('_db_conn') is conn:
+            if not (discard or conn.closed):
+                return
+            g.pop('_db_conn', None)
+        
+        if self._pool is not None:
+            self._pool.putconn(conn, discard=discard)
+        else:
+            conn.close()
+    
+    def _is_connection_error(self, error):
+        """接続自体が壊れたエラーかどうか"""
+        return isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError))
+    
+    def teardown_request_connection(self, exception=None):
+        """アプリケーションコンテキスト終了時にリクエスト接続をプールへ返却"""
+        conn = g.pop('_db_conn', None)
+        if conn is not None and self._pool is not None:
+            self._pool.putconn(conn)
+    
+    def init_app(self, app):
+        """Flaskアプリにteardownを登録"""
+        app.teardown_appcontext(self.teardown_request_connection)
+    
+    def is_sqlite_mode(self):
+        """フォールバックモードかPostgreSQL未使用ならSQLiteとして扱う"""
+        return os.getenv('FALLBACK_MODE') == 'true' or not self.use_postgres
+    
+    def pool_stats(self):
+        """接続プール統計情報"""
+        if self.is_sqlite_mode():
+            stats = {'backend': 'SQLite', 'pooled': False}
+        else:
+            stats = self._get_pool().stats()
+            stats.update({'backend': 'PostgreSQL', 'pooled': True})
+        if self.replicas.enabled:
+            stats['replicas'] = self.replicas.stats()
+        return stats
+    
     def get_supabase_client(self):
         """Supabaseクライアントを取得"""
+        # クライアントは接続テストの後に作る
+        if not self.use_postgres:
+            return None
         return self.supabase if hasattr(self, 'supabase') else None
     
-    def execute_query(self, query, params=None):
-        """SQLクエリ実行（SELECT用）"""
-        import os
+    def _mark_write(self, tables=()):
+        """書き込んだテーブルの結果キャッシュを破棄し、以降の読み取りをしばらくプライマリに固定
+        （同じリクエストと、同じセッションの短時間）"""
+        if tables:
+            self.result_cache.invalidate(*tables)
+        if not self.replicas.enabled or not has_app_context():
+            return
+        g._read_primary = True
+        if has_request_context() and self.read_your_writes_seconds > 0:
+            session['_read_primary_until'] = time.time() + self.read_your_writes_seconds
+    
+    def _use_replica(self, primary):
+        """この読み取りをレプリカで実行してよいか"""
+        if primary or not self.replicas.enabled:
+            return False
+        if has_app_context() and g.get('_read_primary'):
+            return False
+        if has_request_context() and session.get('_read_primary_until', 0) > time.time():
+            return False
+        return True
+    
+    def _run_query(self, conn, query, params):
+        """取得した接続でSELECTを実行して Row のリストを返す（例外はそのまま送出）"""
+        # 実際に取得した接続でバックエンドを判定（PostgreSQL失敗時はSQLite接続が返る）
+        is_sqlite_mode = isinstance(conn, sqlite3.Connection)
+        if callable(query):
+            query, params = query('sqlite' if is_sqlite_mode else 'postgres')
+            query_recorder.record('db', query)
+        
+        # 行はタプルのまま受け取り、列情報を共有する Row で包む
+        if is_sqlite_mode:
+            cursor = conn.cursor()
+            cursor.row_factory = None
+        else:
+            cursor = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+        
+        # プレースホルダーの変換はSQLごとに1回だけ行いキャッシュする
+        statement_cache.execute(cursor, conn, query, params, 'sqlite' if is_sqlite_mode else 'postgres')
+        
+        # PostgreSQLとSQLiteの結果を統一（row[0] と row['name'] の両方で参照できる）
+        return rows_from_cursor(cursor)
+    
+    def _query_replica(self, query, params):
+        """レプリカで実行（使えるレプリカが無い・失敗したら None を返しプライマリで実行させる）"""
+        replica = self.replicas.choose()
+        if replica is None:
+            return None
+        try:
+            conn = replica.connect()
+        except (psycopg2.Error, sqlite3.Error, ConnectionUnavailableError):
+            self.replicas.count('fallbacks')
+            return None
+        
+        broken = False
+        try:
+            rows = self._run_query(conn, query, params)
+            self.replicas.count('replica_reads')
+            return rows
+        except Exception as e:
+            broken = self._is_connection_error(e) or isinstance(e, sqlite3.OperationalError)
+            if broken:
+                self.replicas.count('fallbacks')
+                return None
+            # SQLエラー（移行中でスキーマが古いなど）もプライマリで実行し直す
+            print(f"⚠️ クエリ実行エラー（レプリカ {replica.name}、プライマリで再実行）: {e}")
+            self.replicas.count('fallbacks')
+            return None
+        finally:
+            replica.release(conn, discard=broken)
+    
+    def execute_query(self, query, params=None, primary=False, cache_tables=None):
+        """SQLクエリ実行（SELECT用）
+        
+        レプリカが設定されていれば読み取りはレプリカへ振り分ける。
+        primary=True（書き込み直後の確認やスキーマ確認など）は常にプライマリで実行する。
+        
+        cache_tables に参照するテーブル名を渡すと結果をキャッシュし、そのテーブルへの
+        書き込み（execute_update など）で破棄する。変更の少ないカタログの読み取り向け。
+        
+        方言で文が変わる場合（全文検索など）は、query にバックエンド名（'sqlite' / 'postgres'）を
+        受け取って (sql, params) を返す関数を渡す。実際に取得した接続の方言で組み立てるので、
+        PostgreSQL障害中のSQLiteフォールバックでも正しいSQLになる（この形はキャッシュしない）。
+        """
+        if cache_tables and self.result_cache.enabled and not callable(query):
+            key = (query, tuple(params) if params else ())
+            # 書き込み直後は遅れているレプリカの結果をキャッシュしないようプライマリから読む
+            primary = primary or self.result_cache.written_within(cache_tables, self.read_your_writes_seconds)
+            rows = self.result_cache.get_or_load(key, tuple(cache_tables),
+                                                 lambda: self._read(query, params, primary))
+            # 呼び出し側がリストを変更してもキャッシュに影響しないようコピーを返す
+            return list(rows) if rows is not None else []
+        
+        rows = self._read(query, params, primary)
+        return rows if rows is not None else []
+    
+    def _read(self, query, params, primary):
+        """SELECTを実行して Row のリストを返す（接続できない・エラー時は None）"""
+        if not callable(query):
+            query_recorder.record('db', query)
+        
+        if self._use_replica(primary):
+            rows = self._query_replica(query, params)
+            if rows is not None:
+                return rows
+        if self.replicas.enabled:
+            self.replicas.count('primary_reads')
         
         conn = self.get_db_connection()
         if not conn:
-            return []
+            return None
             
+        broken = False
         try:
-            cursor = conn.cursor()
-            
-            # フォールバックモードかPostgreSQL失敗の場合はSQLiteとして扱う
-            is_sqlite_mode = (os.getenv('FALLBACK_MODE') == 'true' or not self.use_postgres)
-            
-            # PostgreSQLとSQLiteの構文違いを自動調整
-            if not is_sqlite_mode and params:
-                # PostgreSQLは%sプレースホルダー
-                adjusted_query = query.replace('?', '%s')
-                cursor.execute(adjusted_query, params)
-            elif is_sqlite_mode and params:
-                # SQLiteは?プレースホルダー
-                adjusted_query = query.replace('%s', '?')
-                cursor.execute(adjusted_query, params)
+            return self._run_query(conn, query, params)
+                
+        except Exception as e:
+            broken = self._is_connection_error(e)
+            print(f"❌ クエリ実行エラー: {e}")
+            print(f"クエリ: {query}")
+            print(f"パラメータ: {params}")
+            return None
+        finally:
+            self.release_connection(conn, discard=broken)
+    
+    def iter_query(self, query, params=None, batch_size=None, primary=False, raise_errors=False):
+        """SQLクエリを実行し、結果を1行ずつ返すジェネレータ（SELECT用）
+        
+        fetchall() せずに batch_size 行ずつ読み進めるので、行数に関係なくメモリ使用量は一定。
+        PostgreSQLはサーバー側（名前付き）カーソル、SQLiteは fetchmany を使う。
+        PostgreSQLではリクエストの接続とは別にプールから1本借り、最後まで読むか
+        ジェネレータが閉じられた時点で返却する（stream_with_context と組み合わせて使う）。
+        レプリカの振り分けは execute_query と同じ。
+        エラー時はログを出して終了する。raise_errors=True なら例外を送出し、
+        途中で終わったのか全件読んだのかを呼び出し側が区別できるようにする。
+        """
+        query_recorder.record('db', query)
+        batch_size = batch_size or self.iter_batch_size
+        
+        conn = None
+        replica = self.replicas.choose() if self._use_replica(primary) else None
+        if replica is not None:
+            try:
+                conn = replica.connect()
+            except (psycopg2.Error, sqlite3.Error, ConnectionUnavailableError):
+                self.replicas.count('fallbacks')
+                replica = None
+        
+        if conn is None:
+            try:
+                conn = self.get_db_connection() if self.is_sqlite_mode() else self._checkout_postgres()
+            except CircuitOpenError:
+                conn = self._fallback_sqlite_connection() if self.breaker_fallback else None
+            except Exception as e:
+                print(f"❌ クエリ実行エラー: {e}")
+                if raise_errors:
+                    raise
+                return
+            if not conn:
+                if raise_errors:
+                    raise ConnectionUnavailableError('no database connection')
+                return
+        
+        is_sqlite_mode = isinstance(conn, sqlite3.Connection)
+        broken = False
+        try:
+            if is_sqlite_mode:
+                cursor = conn.cursor()
+                cursor.row_factory = None
+                statement_cache.execute(cursor, conn, query, params, 'sqlite')
             else:
-                cursor.execute(query)
+                # 名前付きカーソルはトランザクション内でのみ使える（プール接続はautocommit）
+                conn.autocommit = False
+                cursor = conn.cursor(name=f"iter_query_{next(self._iter_ids)}",
+                                     cursor_factory=psycopg2.extensions.cursor)
+                # DECLARE ... CURSOR FOR には EXECUTE を書けないため、変換結果だけ使う
+                statement = statement_cache.get(query, 'postgres', bool(params))
+                cursor.execute(statement.text, params or None)
             
-            results = cursor.fetchall()
-            
-            # PostgreSQLとSQLiteの結果を統一
-            return [dict(row) for row in results]
-                
+            yield from iter_rows(cursor, batch_size)
+        
         except Exception as e:
+            broken = self._is_connection_error(e)
             print(f"❌ クエリ実行エラー: {e}")
             print(f"クエリ: {query}")
             print(f"パラメータ: {params}")
-            return []
+            if raise_errors:
+                raise
         finally:
-            conn.close()
+            if not is_sqlite_mode:
+                try:
+                    # 読み取りのみなのでロールバックでカーソルごと閉じる
+                    conn.rollback()
+                    conn.autocommit = True
+                except Exception:
+                    broken = True
+            if replica is not None:
+                replica.release(conn, discard=broken)
+            else:
+                self.release_connection(conn, discard=broken)
     
-    def execute_update(self, query, params=None):
-        """SQLクエリ実行（INSERT/UPDATE/DELETE用）"""
+    def execute_update(self, query, params=None, tables=None):
+        """SQLクエリ実行（INSERT/UPDATE/DELETE用）
+        
+        書き込み先のテーブル（文から判定、判定できない文は tables で指定）に
+        依存する結果キャッシュを破棄する。
+        """
+        query_recorder.record('db', query)
         import os
         
         conn = self.get_db_connection()
         if not conn:
             return None
             
+        broken = False
         try:
             cursor = conn.cursor()
             
-            # フォールバックモードかPostgreSQL失敗の場合はSQLiteとして扱う
-            is_sqlite_mode = (os.getenv('FALLBACK_MODE') == 'true' or not self.use_postgres)
+            # 実際に取得した接続でバックエンドを判定（PostgreSQL失敗時はSQLite接続が返る）
+            is_sqlite_mode = isinstance(conn, sqlite3.Connection)
             
-            # PostgreSQLとSQLiteの構文違いを自動調整
-            if not is_sqlite_mode and params:
-                # PostgreSQLは%sプレースホルダー
-                adjusted_query = query.replace('?', '%s')
-                cursor.execute(adjusted_query, params)
-            elif is_sqlite_mode and params:
-                # SQLiteは?プレースホルダー
-                adjusted_query = query.replace('%s', '?')
-                cursor.execute(adjusted_query, params)
-            else:
-                cursor.execute(query)
+            # プレースホルダーの変換はSQLごとに1回だけ行いキャッシュする
+            statement = statement_cache.execute(cursor, conn, query, params,
+                                                'sqlite' if is_sqlite_mode else 'postgres')
             
             conn.commit()
+            self._mark_write(statement.tables | set(tables or ()))
             
             # 挿入されたIDを返す
             if not is_sqlite_mode:  # PostgreSQL
-                if query.strip().upper().startswith('INSERT'):
+                if statement.is_insert:
                     try:
                         cursor.execute('SELECT lastval()')
                         result = cursor.fetchone()
@@ -299,13 +648,182 @@ class DatabaseConfig:
                 return cursor.lastrowid
                 
         except Exception as e:
-            conn.rollback()
+            broken = self._is_connection_error(e)
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
             print(f"❌ 更新クエリエラー: {e}")
             print(f"クエリ: {query}")
             print(f"パラメータ: {params}")
             return None
         finally:
-            conn.close()
+            self.release_connection(conn, discard=broken)
+
+    @contextmanager
+    def transaction(self):
+        """複数の文を1本の接続・1トランザクションで実行する
+        
+            with db_config.transaction() as tx:
+                order_id = tx.execute("INSERT ... RETURNING id", (...))
+                tx.execute_many("INSERT ...", rows)
+        
+        ブロックを抜けるとコミットは1回だけ。例外時は全体をロールバックして
+        例外をそのまま送出する（execute_query などと違いエラーを握りつぶさない）。
+        トランザクション内の読み取り（tx.query）は常にプライマリで行う。
+        """
+        conn = self.get_db_connection()
+        if not conn:
+            raise RuntimeError("データベースに接続できません")
+        
+        is_sqlite_mode = isinstance(conn, sqlite3.Connection)
+        broken = False
+        try:
+            tx = Transaction(conn, 'sqlite' if is_sqlite_mode else 'postgres', 'db')
+            tx.begin()
+            try:
+                yield tx
+                tx.commit()
+                self._mark_write(tx.tables)
+            except BaseException:
+                if not tx.rollback():
+                    broken = True
+                raise
+        except Exception as e:
+            broken = broken or self._is_connection_error(e)
+            raise
+        finally:
+            self.release_connection(conn, discard=broken)
+    
+    def _rollback(self, conn, cursor, is_sqlite_mode):
+        """明示的に張ったトランザクションを取り消す（失敗したら接続を破棄すべきなので False）"""
+        try:
+            if is_sqlite_mode:
+                conn.rollback()
+            else:
+                cursor.execute("ROLLBACK")
+            return True
+        except Exception:
+            return False
+    
+    def execute_many(self, query, rows, tables=None):
+        """同じSQLを複数のパラメータで実行（INSERT/UPDATE/DELETE用）
+        
+        全体を1トランザクションで実行し、処理した行数を返す。
+        失敗時は全体をロールバックして None を返す。
+        結果キャッシュの破棄は execute_update と同じ。
+        """
+        query_recorder.record('db', query)
+        rows = list(rows)
+        
+        conn = self.get_db_connection()
+        if not conn:
+            return None
+        
+        is_sqlite_mode = isinstance(conn, sqlite3.Connection)
+        broken = False
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            statement = statement_cache.get(query, 'sqlite' if is_sqlite_mode else 'postgres', True)
+            if is_sqlite_mode:
+                cursor.executemany(statement.text, rows)
+                conn.commit()
+            else:
+                # プール接続はautocommitのため明示的にトランザクションを張る
+                cursor.execute("BEGIN")
+                psycopg2.extras.execute_batch(cursor, statement.text, rows, page_size=self.bulk_chunk_size)
+                cursor.execute("COMMIT")
+            self._mark_write(statement.tables | set(tables or ()))
+            return len(rows)
+        
+        except Exception as e:
+            broken = self._is_connection_error(e)
+            if cursor is not None and not self._rollback(conn, cursor, is_sqlite_mode):
+                broken = True
+            print(f"❌ 一括更新エラー: {e}")
+            print(f"クエリ: {query}")
+            print(f"件数: {len(rows)}")
+            return None
+        finally:
+            self.release_connection(conn, discard=broken)
+    
+    def bulk_insert(self, table, columns, rows, chunk_size=None, return_ids=False):
+        """複数行をまとめて挿入（全体を1トランザクションで実行）
+        
+        rows は columns の順の値のタプル（ジェネレータ可）。chunk_size 行ずつ送るので、
+        行数が多くても保持するのは1チャンク分だけ。
+        SQLiteは executemany、PostgreSQLは COPY FROM STDIN
+        （return_ids=True の場合は execute_values と RETURNING id）。
+        
+        戻り値: 挿入件数（return_ids=True なら挿入したidのリスト）。
+        失敗時は全体をロールバックして None を返す。
+        """
+        for name in (table, *columns):
+            if not _IDENTIFIER.match(name):
+                raise ValueError(f"不正なテーブル名・列名です: {name!r}")
+        column_sql = ', '.join(columns)
+        query = f"INSERT INTO {table} ({column_sql}) VALUES ({', '.join(['?'] * len(columns))})"
+        query_recorder.record('db', query)
+        chunk_size = chunk_size or self.bulk_chunk_size
+        rows = iter(rows)
+        
+        conn = self.get_db_connection()
+        if not conn:
+            return None
+        
+        is_sqlite_mode = isinstance(conn, sqlite3.Connection)
+        broken = False
+        cursor = None
+        count, ids = 0, []
+        try:
+            if is_sqlite_mode:
+                cursor = conn.cursor()
+            else:
+                cursor = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+                cursor.execute("BEGIN")
+            
+            while True:
+                chunk = list(itertools.islice(rows, chunk_size))
+                if not chunk:
+                    break
+                if is_sqlite_mode:
+                    if return_ids:
+                        # SQLiteの executemany では行ごとのidが取れない（同一トランザクション内なので十分速い）
+                        for values in chunk:
+                            cursor.execute(query, values)
+                            ids.append(cursor.lastrowid)
+                    else:
+                        cursor.executemany(query, chunk)
+                elif return_ids:
+                    inserted = psycopg2.extras.execute_values(
+                        cursor, f"INSERT INTO {table} ({column_sql}) VALUES %s RETURNING id",
+                        chunk, page_size=len(chunk), fetch=True
+                    )
+                    ids.extend(row[0] for row in inserted)
+                else:
+                    data = io.StringIO(''.join(
+                        '\t'.join(_copy_text(value) for value in values) + '\n' for values in chunk
+                    ))
+                    cursor.copy_expert(f"COPY {table} ({column_sql}) FROM STDIN", data)
+                count += len(chunk)
+            
+            if is_sqlite_mode:
+                conn.commit()
+            else:
+                cursor.execute("COMMIT")
+            self._mark_write((table.lower(),))
+            return ids if return_ids else count
+        
+        except Exception as e:
+            broken = self._is_connection_error(e)
+            if cursor is not None and not self._rollback(conn, cursor, is_sqlite_mode):
+                broken = True
+            print(f"❌ 一括挿入エラー: {e}")
+            print(f"テーブル: {table}（{count}件目以降で失敗）")
+            return None
+        finally:
+            self.release_connection(conn, discard=broken)
 
 # グローバルインスタンス
 db_config = DatabaseConfig()
\ No newline at end of file
@@ -1,6 +1,8 @@
 import os
 import sqlite3
 from typing import Optional, Any
+
+from app.statements import statement_cache
 try:
     import psycopg2
     import psycopg2.extras
@@ -56,11 +58,11 @@ class DatabaseManager:
             return None
         
         try:
-            if POSTGRES_AVAILABLE and self.database_url:
+            if not isinstance(conn, sqlite3.Connection):
                 # PostgreSQL用
                 with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
-                    # SQLiteのプレースホルダー（?）をPostgreSQL用（%s）に変換
-                    pg_query = query.replace('?', '%s')
+                    # SQLiteのプレースホルダー（?）をPostgreSQL用（%s）に変換（SQLごとにキャッシュ）
+                    pg_query = statement_cache.get(query, 'postgres', bool(params)).text
                     cursor.execute(pg_query, params)
                     
                     if fetchone:
@@ -75,7 +77,7 @@ class DatabaseManager:
             else:
                 # SQLite用
                 cursor = conn.cursor()
-                cursor.execute(query, params or ())
+                cursor.execute(statement_cache.get(query, 'sqlite', bool(params)).text, params or ())
                 
                 if fetchone:
                     result = cursor.fetchone()
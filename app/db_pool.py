@@ -0,0 +1,248 @@
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor
+
+
+class ConnectionUnavailableError(Exception):
+    """接続を取得できなかった（サーバー障害ではないので psycopg2.OperationalError とは区別する）"""
+
+
+class PoolTimeoutError(ConnectionUnavailableError):
+    """プールから接続を取得できなかった（待機タイムアウト）"""
+
+
+class CircuitOpenError(ConnectionUnavailableError):
+    """障害中のためサーキットブレーカーが接続を止めている"""
+
+
+class PostgresConnectionPool:
+    """PostgreSQL接続プール
+
+    - 最小/最大接続数で上限を設ける
+    - チェックアウト時に一定時間アイドルだった接続のみヘルスチェック
+    - idle_timeout を超えたアイドル接続を最小数まで回収
+    """
+
+    def __init__(self, dsn, minconn=1, maxconn=10, idle_timeout=300,
+                 checkout_timeout=10, healthcheck_interval=30,
+                 connect_timeout=10, connect_fn=None):
+        self.dsn = dsn
+        self.minconn = max(0, minconn)
+        self.maxconn = max(1, maxconn, self.minconn)
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.healthcheck_interval = healthcheck_interval
+        self.connect_timeout = connect_timeout
+        self._connect_fn = connect_fn or self._default_connect
+
+        self._cond = threading.Condition()
+        self._idle = []  # (conn, last_used) のLIFOスタック
+        self._size = 0   # 作成済み（作成中を含む）の接続数
+        self._in_use = 0
+        self._closed = False
+
+        # 統計情報
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'timeouts': 0,
+            'created': 0,
+            'discarded': 0,
+            'reaped': 0,
+            'healthchecks': 0,
+            'healthcheck_failures': 0,
+        }
+
+    def _default_connect(self):
+        conn = psycopg2.connect(
+            self.dsn,
+            cursor_factory=RealDictCursor,
+            connect_timeout=self.connect_timeout,
+            application_name='vulnerable_shopping_mall'
+        )
+        # autocommitモードを設定（DDL文用）
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        return conn
+
+    def _new_connection(self):
+        """スロット予約済みの状態で新しい接続を作成"""
+        try:
+            conn = self._connect_fn()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats['created'] += 1
+        print(f"✅ PostgreSQL接続作成（プール: {self._size}/{self.maxconn}）")
+        return conn
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, conn, last_used):
+        """チェックアウト時のヘルスチェック"""
+        if getattr(conn, 'closed', 0):
+            return False
+        if time.monotonic() - last_used < self.healthcheck_interval:
+            return True
+        self._stats['healthchecks'] += 1
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _reap_idle_locked(self):
+        """idle_timeoutを超えたアイドル接続を回収（ロック保持中に呼ぶ）"""
+        if self.idle_timeout is None or self._size <= self.minconn:
+            return []
+        now = time.monotonic()
+        reaped = []
+        # スタックの底ほど古いので先頭から見る
+        while self._idle and self._size > self.minconn:
+            conn, last_used = self._idle[0]
+            if now - last_used < self.idle_timeout:
+                break
+            self._idle.pop(0)
+            self._size -= 1
+            reaped.append(conn)
+        self._stats['reaped'] += len(reaped)
+        return reaped
+
+    def getconn(self, timeout=None):
+        """接続をチェックアウト"""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+
+        while True:
+            create = False
+            timed_out = False
+            reaped = []
+            with self._cond:
+                if self._closed:
+                    raise psycopg2.InterfaceError('connection pool is closed')
+                while True:
+                    reaped.extend(self._reap_idle_locked())
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        self._in_use += 1
+                        break
+                    if self._size < self.maxconn:
+                        self._size += 1
+                        self._in_use += 1
+                        conn, last_used, create = None, None, True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        timed_out = True
+                        break
+                    waited = True
+                    self._cond.wait(remaining)
+
+                if not timed_out:
+                    self._stats['checkouts'] += 1
+                if waited and not timed_out:
+                    wait_time = time.monotonic() - start
+                    self._stats['waits'] += 1
+                    self._stats['wait_time_total'] += wait_time
+                    self._stats['wait_time_max'] = max(self._stats['wait_time_max'], wait_time)
+
+            for old in reaped:
+                self._close_quietly(old)
+
+            if timed_out:
+                raise PoolTimeoutError(
+                    f'connection pool exhausted ({self.maxconn} in use, waited {timeout}s)'
+                )
+
+            if create:
+                return self._new_connection()
+
+            if self._is_healthy(conn, last_used):
+                return conn
+
+            # 不健全な接続は破棄して取り直す
+            with self._cond:
+                self._stats['healthcheck_failures'] += 1
+                self._stats['discarded'] += 1
+                self._stats['checkouts'] -= 1
+                self._size -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            self._close_quietly(conn)
+
+    def putconn(self, conn, discard=False):
+        """接続をプールに返却"""
+        if not discard and not getattr(conn, 'closed', 0):
+            try:
+                status = conn.get_transaction_status()
+                if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+        else:
+            discard = True
+
+        with self._cond:
+            self._in_use -= 1
+            if discard or self._closed:
+                self._size -= 1
+                self._stats['discarded'] += 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+        if discard or self._closed:
+            self._close_quietly(conn)
+
+    def closeall(self):
+        """アイドル接続をすべて閉じ、以降のチェックアウトを拒否"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        """プール統計情報"""
+        with self._cond:
+            stats = dict(self._stats)
+            checkouts = stats['checkouts']
+            return {
+                'min_size': self.minconn,
+                'max_size': self.maxconn,
+                'size': self._size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'checkouts': checkouts,
+                'waits': stats['waits'],
+                'timeouts': stats['timeouts'],
+                'wait_time_total_ms': round(stats['wait_time_total'] * 1000, 3),
+                'wait_time_avg_ms': round(stats['wait_time_total'] * 1000 / checkouts, 3) if checkouts else 0.0,
+                'wait_time_max_ms': round(stats['wait_time_max'] * 1000, 3),
+                'created': stats['created'],
+                'discarded': stats['discarded'],
+                'reaped': stats['reaped'],
+                'healthchecks': stats['healthchecks'],
+                'healthcheck_failures': stats['healthcheck_failures'],
+            }
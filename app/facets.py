@@ -0,0 +1,106 @@
+import os
+
+from dotenv import load_dotenv
+
+from app.conditional import catalog_validators
+from app.database import db_config
+from app.pagination import TTLCache
+from app.search import normalize_text, product_search
+
+# 環境変数を読み込み
+load_dotenv()
+
+# ファセット集計キャッシュの有効期間（秒）。カタログ版数が変われば期間内でも使わない
+FACET_CACHE_TTL = float(os.getenv('FACET_CACHE_TTL', 300))
+
+# 価格帯（下限以上・上限未満、Noneは上限なし）
+PRICE_BUCKETS = [
+    (0, 5000, '¥5,000未満'),
+    (5000, 20000, '¥5,000〜¥20,000'),
+    (20000, 50000, '¥20,000〜¥50,000'),
+    (50000, 100000, '¥50,000〜¥100,000'),
+    (100000, None, '¥100,000以上'),
+]
+
+def price_bucket_sql(column='price'):
+    """価格帯の番号を返すCASE式"""
+    cases = ' '.join(
+        f"WHEN {column} < {upper} THEN {index}"
+        for index, (_, upper, _) in enumerate(PRICE_BUCKETS) if upper is not None
+    )
+    return f"CASE {cases} ELSE {len(PRICE_BUCKETS) - 1} END"
+
+
+class FacetService:
+    """カテゴリ・価格帯のファセット集計
+
+    カテゴリ × 価格帯で GROUP BY した1回のクエリから両方の件数を求め、
+    カタログ版数（migrations の catalog_versions）と検索語をキーにキャッシュする。
+    """
+
+    def __init__(self, db, search_index, versions):
+        self.db = db
+        self.search_index = search_index
+        self.versions = versions
+        self.cache = TTLCache(ttl=FACET_CACHE_TTL, max_entries=256)
+
+    def catalog_version(self):
+        """商品データの版数（変更のたびに増える。取得できなければNone）"""
+        # 版数は他のプロセスの書き込みも反映するようキャッシュせずに読む（CatalogValidators と共通）
+        return self.versions.version('catalog')
+
+    def _aggregate(self, search):
+        """検索語で絞り込んだ商品をカテゴリ × 価格帯で集計"""
+        use_index = bool(search) and self.search_index.ensure_index()
+
+        def build(backend):
+            # 全文検索の条件は実際に取得した接続の方言で組み立てる
+            where_sql, params = '', ()
+            if use_index:
+                where_sql, params = self.search_index.product_filter(search, backend)
+                where_sql = f" WHERE {where_sql or '1=0'}"
+            elif search:
+                where_sql = " WHERE (p.name LIKE ? OR p.description LIKE ?)"
+                params = (f'%{search}%', f'%{search}%')
+            return (f"SELECT p.category AS category, {price_bucket_sql('p.price')} AS bucket, COUNT(*) AS count "
+                    f"FROM products p{where_sql} GROUP BY 1, 2", params)
+
+        return self.db.execute_query(build)
+
+    def facets(self, search='', category=''):
+        """ファセット件数を取得
+
+        カテゴリの件数はカテゴリ選択を無視した件数（他のカテゴリへ切り替えた
+        ときの件数）、価格帯と total は選択中のカテゴリ内の件数。
+        """
+        version = self.catalog_version()
+        if version is None:
+            rows = self._aggregate(search)
+        else:
+            # 同じ検索語の同時集計は1回にまとめる
+            rows = self.cache.get_or_set((version, normalize_text(search)), lambda: self._aggregate(search))
+
+        category_counts = {}
+        bucket_counts = [0] * len(PRICE_BUCKETS)
+        for row in rows:
+            if row['category'] is not None:
+                category_counts[row['category']] = category_counts.get(row['category'], 0) + row['count']
+            if not category or row['category'] == category:
+                bucket_counts[row['bucket']] += row['count']
+
+        return {
+            'categories': [
+                {'value': value, 'count': count}
+                for value, count in sorted(category_counts.items(), key=lambda item: (-item[1], item[0]))
+            ],
+            'price_buckets': [
+                {'min': lower, 'max': upper, 'label': label, 'count': bucket_counts[index]}
+                for index, (lower, upper, label) in enumerate(PRICE_BUCKETS)
+            ],
+            'total': sum(bucket_counts),
+            'catalog_version': version,
+        }
+
+
+# グローバルインスタンス
+facet_service = FacetService(db_config, product_search, catalog_validators)
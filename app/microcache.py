@@ -0,0 +1,262 @@
+import gzip
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode
+
+from dotenv import load_dotenv
+from werkzeug.http import parse_cookie, parse_date, parse_etags, unquote_etag
+
+from app.single_flight import SingleFlight
+
+# 環境変数を読み込み
+load_dotenv()
+
+# 匿名ユーザー向けページキャッシュ（Flaskのルーティング前にWSGIミドルウェアで返す）
+MICROCACHE_ENABLED = os.getenv('MICROCACHE_ENABLED', 'true').lower() == 'true'
+# ページごとの有効期間（秒、1〜10秒程度。0でそのページはキャッシュしない）
+MICROCACHE_TTL_HOME = float(os.getenv('MICROCACHE_TTL_HOME', 5))
+MICROCACHE_TTL_PRODUCTS = float(os.getenv('MICROCACHE_TTL_PRODUCTS', 3))
+MICROCACHE_TTL_PRODUCT = float(os.getenv('MICROCACHE_TTL_PRODUCT', 5))
+# 圧縮後の合計サイズの上限（バイト）
+MICROCACHE_MAX_BYTES = int(os.getenv('MICROCACHE_MAX_BYTES', 16 * 1024 * 1024))
+# このクッキーがあればログイン中などとみなす（カンマ区切り）。
+# ページキャッシュを使わない判定と、Cache-Control を no-store にする判定（cache_policy）で共有する
+SESSION_COOKIES = [name.strip() for name in os.getenv('SESSION_COOKIES', 'session,user_id,auth_token').split(',')
+                   if name.strip()]
+
+# (パスの正規表現, 有効期間)
+MICROCACHE_ROUTES = [
+    (re.compile(r'^/$'), MICROCACHE_TTL_HOME),
+    (re.compile(r'^/products$'), MICROCACHE_TTL_PRODUCTS),
+    (re.compile(r'^/product/\d+$'), MICROCACHE_TTL_PRODUCT),
+]
+
+# 保存したレスポンスから返さないヘッダー（返すときに付け直す）
+_DROP_HEADERS = {'content-length', 'content-encoding', 'vary'}
+
+
+def normalize_query(query_string):
+    """クエリ文字列をパラメータ名順に並べ替えて正規化"""
+    if not query_string:
+        return ''
+    return urlencode(sorted(parse_qsl(query_string, keep_blank_values=True)))
+
+
+class _Page:
+    __slots__ = ('status', 'headers', 'body', 'size', 'raw_size', 'stored_at', 'expires', 'etag', 'last_modified')
+
+    def __init__(self, status, headers, body, raw_size, ttl):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        names = {name.lower(): value for name, value in headers}
+        self.etag = names.get('etag')
+        self.last_modified = names.get('last-modified')
+        self.size = len(body)
+        self.raw_size = raw_size
+        self.stored_at = time.monotonic()
+        self.expires = self.stored_at + ttl
+
+
+class Microcache:
+    """gzip圧縮したページを保持するLRU（圧縮後のバイト数で上限）"""
+
+    def __init__(self, max_bytes=MICROCACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._pages = OrderedDict()
+        self._bytes = 0
+        self._raw_bytes = 0
+        self._lock = threading.Lock()
+        # 同じページの同時ミスを1回の描画にまとめる
+        self.flight = SingleFlight()
+        self._stats = {'hits': 0, 'misses': 0, 'bypassed': 0, 'stores': 0, 'evictions': 0, 'uncacheable': 0}
+
+    def count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def get(self, key):
+        with self._lock:
+            page = self._pages.get(key)
+            if page is None:
+                self._stats['misses'] += 1
+                return None
+            if page.expires < time.monotonic():
+                self._remove_locked(key)
+                self._stats['misses'] += 1
+                return None
+            self._pages.move_to_end(key)
+            self._stats['hits'] += 1
+            return page
+
+    def _remove_locked(self, key):
+        page = self._pages.pop(key)
+        self._bytes -= page.size
+        self._raw_bytes -= page.raw_size
+
+    def put(self, key, page):
+        with self._lock:
+            if key in self._pages:
+                self._remove_locked(key)
+            if page.size > self.max_bytes:
+                return
+            self._pages[key] = page
+            self._bytes += page.size
+            self._raw_bytes += page.raw_size
+            self._stats['stores'] += 1
+            while self._bytes > self.max_bytes:
+                self._remove_locked(next(iter(self._pages)))
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self._bytes = 0
+            self._raw_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats['hits'] + stats['misses']
+            stats.update({
+                'enabled': MICROCACHE_ENABLED,
+                'pages': len(self._pages),
+                'bytes': self._bytes,
+                'uncompressed_bytes': self._raw_bytes,
+                'max_bytes': self.max_bytes,
+                'hit_ratio': round(stats['hits'] / lookups, 4) if lookups else 0.0,
+            })
+        stats['single_flight'] = self.flight.stats()
+        return stats
+
+
+class MicrocacheMiddleware:
+    """匿名リクエストのページをキャッシュから返すWSGIミドルウェア
+
+    対象は MICROCACHE_ROUTES の GET/HEAD で、SESSION_COOKIES のクッキーが
+    無いリクエストだけ。キーはパス・正規化したクエリ文字列・version() の戻り値
+    （カタログの版数。書き込みがあれば有効期間内でも別のキーになる）。
+    200 の text/html で Set-Cookie の無いレスポンスだけを保存する。
+    同じキーの同時ミスは1回の描画にまとめる。
+    保存したページに ETag / Last-Modified があれば、条件付きリクエストにはここで 304 を返す。
+    """
+
+    def __init__(self, wsgi_app, cache, version=None, routes=None, bypass_cookies=None):
+        self.wsgi_app = wsgi_app
+        self.cache = cache
+        self.version = version or (lambda: None)
+        self.routes = MICROCACHE_ROUTES if routes is None else routes
+        self.bypass_cookies = SESSION_COOKIES if bypass_cookies is None else bypass_cookies
+
+    def _ttl(self, path):
+        for pattern, ttl in self.routes:
+            if pattern.match(path):
+                return ttl
+        return 0
+
+    def __call__(self, environ, start_response):
+        method = environ.get('REQUEST_METHOD')
+        ttl = self._ttl(environ.get('PATH_INFO', '')) if method in ('GET', 'HEAD') else 0
+        if ttl <= 0:
+            return self.wsgi_app(environ, start_response)
+        cookies = parse_cookie(environ)
+        if any(name in cookies for name in self.bypass_cookies):
+            self.cache.count('bypassed')
+            return self.wsgi_app(environ, start_response)
+
+        key = (environ.get('PATH_INFO'), normalize_query(environ.get('QUERY_STRING', '')), self.version())
+        page = self.cache.get(key)
+        if page is not None:
+            return self._serve(environ, start_response, page, 'HIT')
+        if method == 'HEAD':
+            return self.wsgi_app(environ, start_response)
+
+        # 同じページの同時ミスは1回だけ描画し、保存できたページを全員に返す
+        rendered = []
+
+        def fill():
+            rendered.append(True)
+            status, headers, body = self._render(environ)
+            return status, headers, body, self._store(key, status, headers, body, ttl)
+
+        status, headers, body, page = self.cache.flight.do(key, fill)
+        if page is not None:
+            return self._serve(environ, start_response, page, 'MISS')
+        if not rendered:
+            # 保存できないレスポンス（Set-Cookie 付きなど）は他人の結果を使わず自分で描画する
+            return self.wsgi_app(environ, start_response)
+        start_response(status, headers)
+        return [body]
+
+    def _render(self, environ):
+        """アプリを呼び出してレスポンス全体を (status, headers, body) で受け取る"""
+        captured = {}
+        chunks = []
+
+        def capture(status, headers, exc_info=None):
+            captured['status'], captured['headers'] = status, headers
+            return chunks.append
+
+        result = self.wsgi_app(environ, capture)
+        try:
+            for chunk in result:
+                chunks.append(chunk)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return captured['status'], captured['headers'], b''.join(chunks)
+
+    def _store(self, key, status, headers, body, ttl):
+        names = {name.lower(): value for name, value in headers}
+        # ルートが no-store / private にしたレスポンス（エラー時の代替表示など）は保存しない
+        cache_control = names.get('cache-control', '').lower()
+        cacheable = (status.startswith('200') and names.get('content-type', '').startswith('text/html')
+                     and 'set-cookie' not in names and 'content-encoding' not in names
+                     and 'no-store' not in cache_control and 'private' not in cache_control)
+        if not cacheable:
+            self.cache.count('uncacheable')
+            return None
+        page = _Page(status, [(name, value) for name, value in headers if name.lower() not in _DROP_HEADERS],
+                     gzip.compress(body, compresslevel=6), len(body), ttl)
+        self.cache.put(key, page)
+        return page
+
+    def _not_modified(self, environ, page):
+        """保存したページの ETag / Last-Modified が条件付きリクエストと一致するか"""
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            return page.etag is not None and parse_etags(if_none_match).contains_weak(unquote_etag(page.etag)[0])
+        if_modified_since = parse_date(environ.get('HTTP_IF_MODIFIED_SINCE'))
+        last_modified = parse_date(page.last_modified)
+        return if_modified_since is not None and last_modified is not None and last_modified <= if_modified_since
+
+    def _serve(self, environ, start_response, page, state):
+        common = [
+            ('Vary', 'Accept-Encoding, Cookie'),
+            ('Age', str(int(time.monotonic() - page.stored_at))),
+            ('X-Cache', state),
+        ]
+        if self._not_modified(environ, page):
+            start_response('304 Not Modified',
+                           [(name, value) for name, value in page.headers
+                            if name.lower() in ('etag', 'last-modified', 'cache-control')] + common)
+            return []
+        headers = list(page.headers)
+        if 'gzip' in environ.get('HTTP_ACCEPT_ENCODING', ''):
+            body = page.body
+            headers.append(('Content-Encoding', 'gzip'))
+            if page.etag and not page.etag.startswith('W/'):
+                # 圧縮した本文は元と同じバイト列ではないので弱いETagにする（If-None-Match は弱い比較）
+                headers = [(name, 'W/' + value if name.lower() == 'etag' else value) for name, value in headers]
+        else:
+            body = gzip.decompress(page.body)
+        headers += [('Content-Length', str(len(body)))] + common
+        start_response(page.status, headers)
+        return [] if environ.get('REQUEST_METHOD') == 'HEAD' else [body]
+
+
+# グローバルインスタンス
+microcache = Microcache()
@@ -0,0 +1,348 @@
+import os
+import threading
+
+from dotenv import load_dotenv
+
+from app.database import db_config
+from app.ratings import BACKFILL_PRODUCT_ROWS, POSTGRES_PRODUCT_ROW_DDL, SQLITE_PRODUCT_ROW_DDL
+from app.rows import rows_from_cursor
+from app.sqlite_db import get_db
+from app.statements import statement_cache
+
+# 環境変数を読み込み
+load_dotenv()
+
+# 最初のリクエストで未適用のマイグレーションを適用するか
+DB_AUTO_MIGRATE = os.getenv('DB_AUTO_MIGRATE', 'true').lower() == 'true'
+
+SCHEMA_VERSION_DDL = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+class Migration:
+    """バージョン付きのスキーマ変更
+
+    sqlite / postgres はそれぞれの方言のSQL文リスト（postgres 省略時は sqlite と同じ）。
+    requires のテーブルがまだ無いDBでは適用を保留し、作成後に改めて適用する。
+    """
+
+    def __init__(self, version, name, sqlite, postgres=None, requires=()):
+        self.version = version
+        self.name = name
+        self.sqlite = sqlite
+        self.postgres = postgres if postgres is not None else sqlite
+        self.requires = requires
+
+    def statements(self, backend):
+        return self.sqlite if backend == 'sqlite' else self.postgres
+
+
+CATALOG_VERSIONS_DDL = """
+    CREATE TABLE IF NOT EXISTS catalog_versions (
+        scope VARCHAR(64) PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 1,
+        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+# PostgreSQL の TIMESTAMP 列には UTC で記録する（SQLite の CURRENT_TIMESTAMP も UTC）
+POSTGRES_UTC_NOW = "(now() AT TIME ZONE 'UTC')"
+
+
+def _bump_catalog_versions(product_id, now):
+    """カタログ全体（'catalog'）と商品ごと（'product:<id>'）の版数を進めて更新時刻を記録するSQL"""
+    return f"""
+        INSERT INTO catalog_versions (scope, version, updated_at)
+        VALUES ('catalog', 1, {now}), ('product:' || COALESCE({product_id}, 0), 1, {now})
+        ON CONFLICT (scope) DO UPDATE SET
+            version = catalog_versions.version + 1,
+            updated_at = excluded.updated_at
+    """
+
+
+def _sqlite_catalog_version_triggers():
+    triggers = []
+    for table, column in (('products', 'id'), ('reviews', 'product_id')):
+        triggers += [
+            f"""CREATE TRIGGER IF NOT EXISTS {table}_catalog_versions_ai AFTER INSERT ON {table} BEGIN
+                {_bump_catalog_versions(f'NEW.{column}', 'CURRENT_TIMESTAMP')};
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS {table}_catalog_versions_au AFTER UPDATE ON {table} BEGIN
+                {_bump_catalog_versions(f'OLD.{column}', 'CURRENT_TIMESTAMP')};
+                {_bump_catalog_versions(f'NEW.{column}', 'CURRENT_TIMESTAMP')};
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS {table}_catalog_versions_ad AFTER DELETE ON {table} BEGIN
+                {_bump_catalog_versions(f'OLD.{column}', 'CURRENT_TIMESTAMP')};
+            END""",
+        ]
+    return triggers
+
+
+def _postgres_catalog_version_triggers():
+    statements = []
+    for table, column in (('products', 'id'), ('reviews', 'product_id')):
+        statements += [
+            f"""
+            CREATE OR REPLACE FUNCTION {table}_bump_catalog_versions() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    {_bump_catalog_versions(f'OLD.{column}', POSTGRES_UTC_NOW)};
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    {_bump_catalog_versions(f'NEW.{column}', POSTGRES_UTC_NOW)};
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+            f"DROP TRIGGER IF EXISTS {table}_catalog_versions ON {table}",
+            f"""
+            CREATE TRIGGER {table}_catalog_versions
+            AFTER INSERT OR UPDATE OR DELETE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION {table}_bump_catalog_versions()
+            """,
+        ]
+    return statements
+
+
+# 適用順に並べる（既に公開したものは書き換えず、変更は新しいバージョンで追加する）
+MIGRATIONS = [
+    Migration(1, 'reviews_indexes', [
+        # 商品ごと・全体の新しい順レビュー（キーセットページング）、ユーザー別の削除・集計
+        "CREATE INDEX IF NOT EXISTS idx_reviews_product_created ON reviews (product_id, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS idx_reviews_created ON reviews (created_at, id)",
+        "CREATE INDEX IF NOT EXISTS idx_reviews_user ON reviews (user_id)",
+    ], requires=('reviews',)),
+    Migration(2, 'cart_indexes', [
+        # カート表示（user_id）と追加時の既存行検索（user_id, product_id）
+        "CREATE INDEX IF NOT EXISTS idx_cart_user_product ON cart (user_id, product_id)",
+    ], requires=('cart',)),
+    Migration(3, 'order_indexes', [
+        "CREATE INDEX IF NOT EXISTS idx_orders_user ON orders (user_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id)",
+    ], requires=('orders', 'order_items')),
+    Migration(4, 'email_indexes', [
+        # 受信箱・送信箱（新しい順）と添付ファイル件数
+        "CREATE INDEX IF NOT EXISTS idx_emails_recipient_created ON emails (recipient_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_emails_sender_created ON emails (sender_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_email_attachments_email ON email_attachments (email_id)",
+    ], requires=('emails', 'email_attachments')),
+    # ETag / Last-Modified 用の版数と更新時刻（商品・レビューの書き込みでトリガーが進める）
+    Migration(5, 'catalog_versions', [
+        CATALOG_VERSIONS_DDL,
+        "INSERT OR IGNORE INTO catalog_versions (scope, version, updated_at) VALUES ('catalog', 1, CURRENT_TIMESTAMP)",
+        """
+        INSERT OR IGNORE INTO catalog_versions (scope, version, updated_at)
+        SELECT 'product:' || p.id, 1,
+               MAX(COALESCE(p.created_at, CURRENT_TIMESTAMP),
+                   COALESCE((SELECT MAX(r.created_at) FROM reviews r WHERE r.product_id = p.id), ''))
+        FROM products p
+        """,
+        *_sqlite_catalog_version_triggers(),
+    ], [
+        CATALOG_VERSIONS_DDL,
+        f"""
+        INSERT INTO catalog_versions (scope, version, updated_at) VALUES ('catalog', 1, {POSTGRES_UTC_NOW})
+        ON CONFLICT (scope) DO NOTHING
+        """,
+        f"""
+        INSERT INTO catalog_versions (scope, version, updated_at)
+        SELECT 'product:' || p.id, 1,
+               GREATEST(COALESCE(p.created_at, {POSTGRES_UTC_NOW}),
+                        (SELECT MAX(r.created_at) FROM reviews r WHERE r.product_id = p.id))
+        FROM products p
+        ON CONFLICT (scope) DO NOTHING
+        """,
+        *_postgres_catalog_version_triggers(),
+    ], requires=('products', 'reviews')),
+    # ファセット集計が実行時に作っていた catalog_version（v5 の catalog_versions に統合）
+    Migration(6, 'drop_catalog_version', [
+        "DROP TRIGGER IF EXISTS products_version_ai",
+        "DROP TRIGGER IF EXISTS products_version_au",
+        "DROP TRIGGER IF EXISTS products_version_ad",
+        "DROP TABLE IF EXISTS catalog_version",
+    ], [
+        "DROP TRIGGER IF EXISTS products_catalog_version ON products",
+        "DROP FUNCTION IF EXISTS bump_catalog_version()",
+        "DROP TABLE IF EXISTS catalog_version",
+    ], requires=('products',)),
+    # 評価順を集計テーブルからの内部結合で引けるよう、レビューのない商品にも集計行を置く
+    Migration(7, 'rating_stats_all_products', [
+        *SQLITE_PRODUCT_ROW_DDL,
+        BACKFILL_PRODUCT_ROWS,
+        "UPDATE product_rating_stats SET rating_avg = 0 WHERE rating_avg IS NULL",
+    ], [
+        *POSTGRES_PRODUCT_ROW_DDL,
+        BACKFILL_PRODUCT_ROWS,
+        "UPDATE product_rating_stats SET rating_avg = 0 WHERE rating_avg IS NULL",
+    ], requires=('products', 'product_rating_stats')),
+]
+
+
+class LocalSQLiteDatabase:
+    """ブループリントが使うローカルSQLite（sqlite_db.get_db()）を Migrator から使うためのラッパー
+
+    カート・注文・メールなどは db_config ではなくこのDBを読むので、インデックスも
+    こちらに作る必要がある。Migrator が db_config に対して使うメソッドだけを持つ。
+    """
+
+    def is_sqlite_mode(self):
+        return True
+
+    def get_db_connection(self):
+        return get_db()
+
+    def release_connection(self, conn, discard=False):
+        # 未コミットの変更を破棄するだけで、スレッドの接続は保持される
+        conn.close()
+
+    def _is_connection_error(self, error):
+        return False
+
+    def execute_query(self, query, params=None, primary=False):
+        cursor = get_db().cursor()
+        cursor.execute(query, params or ())
+        return rows_from_cursor(cursor)
+
+    def execute_update(self, query, params=None):
+        conn = get_db()
+        conn.execute(query, params or ())
+        conn.commit()
+
+
+class Migrator:
+    """schema_version テーブルで適用済みバージョンを管理するマイグレーション実行
+
+    label はログに出す適用先の名前。
+    """
+
+    def __init__(self, db, migrations=MIGRATIONS, label='db_config'):
+        self.db = db
+        self.label = label
+        self.migrations = sorted(migrations, key=lambda migration: migration.version)
+        self._lock = threading.Lock()
+        self._auto_lock = threading.Lock()
+        self._auto_migrated = False
+
+    def _backend(self):
+        return 'sqlite' if self.db.is_sqlite_mode() else 'postgres'
+
+    def _existing_tables(self, backend):
+        if backend == 'sqlite':
+            rows = self.db.execute_query("SELECT name FROM sqlite_master WHERE type = 'table'", primary=True)
+            return {row['name'] for row in rows}
+        rows = self.db.execute_query(
+            "SELECT table_name FROM information_schema.tables WHERE table_schema = current_schema()",
+            primary=True
+        )
+        return {row['table_name'] for row in rows}
+
+    def applied_versions(self):
+        """適用済みバージョンの集合（schema_version が無ければ作成）"""
+        self.db.execute_update(SCHEMA_VERSION_DDL)
+        rows = self.db.execute_query("SELECT version FROM schema_version", primary=True)
+        return {row['version'] for row in rows}
+
+    def status(self):
+        """(version, name, 適用済みか) のリスト"""
+        applied = self.applied_versions()
+        return [(m.version, m.name, m.version in applied) for m in self.migrations]
+
+    def _apply(self, migration, backend):
+        """1つのマイグレーションと schema_version への記録を1トランザクションで実行"""
+        conn = self.db.get_db_connection()
+        if not conn:
+            return False
+
+        is_sqlite = backend == 'sqlite'
+        broken = False
+        try:
+            cursor = conn.cursor()
+            if not is_sqlite:
+                # プール接続はautocommitのため明示的にトランザクションを張る
+                cursor.execute("BEGIN")
+            for sql in migration.statements(backend):
+                cursor.execute(sql)
+            statement_cache.execute(cursor, conn, "INSERT INTO schema_version (version, name) VALUES (?, ?)",
+                                    (migration.version, migration.name), backend)
+            if is_sqlite:
+                conn.commit()
+            else:
+                cursor.execute("COMMIT")
+            return True
+        except Exception as e:
+            broken = self.db._is_connection_error(e)
+            try:
+                if is_sqlite:
+                    conn.rollback()
+                else:
+                    cursor.execute("ROLLBACK")
+            except Exception:
+                broken = True
+            print(f"❌ マイグレーション失敗 v{migration.version} {migration.name} ({self.label}): {e}")
+            return False
+        finally:
+            self.db.release_connection(conn, discard=broken)
+
+    def migrate(self):
+        """未適用のマイグレーションを順番に適用し、適用したバージョンのリストを返す
+
+        必要なテーブルが無いマイグレーションは保留して次へ進む（テーブル作成後に改めて適用）。
+        失敗したマイグレーションで止まり、以降は次回に持ち越す。
+        """
+        with self._lock:
+            backend = self._backend()
+            applied = self.applied_versions()
+            pending = [m for m in self.migrations if m.version not in applied]
+            if not pending:
+                return []
+
+            tables = self._existing_tables(backend)
+            done = []
+            for migration in pending:
+                missing = [table for table in migration.requires if table not in tables]
+                if missing:
+                    print(f"⚠️ マイグレーション保留 v{migration.version} {migration.name} ({self.label}): "
+                          f"テーブルがありません ({', '.join(missing)})")
+                    continue
+                if not self._apply(migration, backend):
+                    # 他プロセスが同時に適用した場合は記録済みなので続行
+                    if migration.version in self.applied_versions():
+                        continue
+                    break
+                print(f"✅ マイグレーション適用 v{migration.version} {migration.name} ({self.label})")
+                done.append(migration.version)
+            return done
+
+    def init_app(self, app):
+        """最初のリクエストで未適用のマイグレーションを適用する
+
+        create_app() の中で適用すると import 時にDBの接続テストが走るので、
+        最初のリクエストまで遅らせる（flask --app run migrate ならすぐに適用できる）。
+        """
+        app.before_request(self._auto_migrate)
+
+    def _auto_migrate(self):
+        if self._auto_migrated:
+            return
+        # 同時に来た最初のリクエストは適用が終わるまで待たせる（1回だけ試す）
+        with self._auto_lock:
+            if self._auto_migrated:
+                return
+            try:
+                self.migrate()
+            except Exception as e:
+                print(f"⚠️ 起動時マイグレーションエラー: {e}")
+            self._auto_migrated = True
+
+
+# グローバルインスタンス
+migrator = Migrator(db_config)
+local_migrator = Migrator(LocalSQLiteDatabase(), label='sqlite_db')
+# 適用先すべて（db_config と、ブループリントのローカルSQLite）
+migrators = (migrator, local_migrator)
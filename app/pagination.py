@@ -0,0 +1,193 @@
+import base64
+import json
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from app.single_flight import SingleFlight
+
+# 環境変数を読み込み
+load_dotenv()
+
+# 総件数キャッシュの有効期間（秒）
+COUNT_CACHE_TTL = float(os.getenv('COUNT_CACHE_TTL', 30))
+
+
+class TTLCache:
+    """有効期限付きの簡易キャッシュ（スレッドセーフ）"""
+
+    def __init__(self, ttl=30, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = {}
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if len(self._data) >= self.max_entries and key not in self._data:
+                # 最も古く登録されたエントリを捨てる
+                self._data.pop(next(iter(self._data)))
+            self._data[key] = (value, expires)
+
+    def get_or_set(self, key, compute, ttl=None):
+        """なければ compute() で計算して保存（同じキーの同時計算は1回にまとめる）"""
+        value = self.get(key)
+        if value is None:
+            value = self._flight.do(key, lambda: self._compute(key, compute, ttl))
+        return value
+
+    def _compute(self, key, compute, ttl):
+        # 直前に別のスレッドが計算を終えていればそれを使う
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            if value is not None:
+                self.set(key, value, ttl)
+        return value
+
+    def invalidate(self, predicate=None):
+        """キーが条件に合うエントリを削除（条件なしで全削除）"""
+        with self._lock:
+            if predicate is None:
+                self._data.clear()
+            else:
+                for key in [k for k in self._data if predicate(k)]:
+                    del self._data[key]
+
+
+# 総件数（COUNT(*)）のキャッシュ
+count_cache = TTLCache(ttl=COUNT_CACHE_TTL)
+
+
+def page_count(total, per_page):
+    """総件数からページ数を計算（0件でも1ページ）"""
+    return (total + per_page - 1) // per_page if total > 0 else 1
+
+
+def _where(conditions):
+    """条件式のリストからWHERE句を組み立てる（OR対策で各条件を括弧で囲む）"""
+    conditions = [c for c in conditions if c]
+    if not conditions:
+        return ''
+    return ' WHERE ' + ' AND '.join(f"({c})" for c in conditions)
+
+
+def cached_count(execute, from_sql, where_sql='', params=(), key=None, namespace='db_config'):
+    """SELECT COUNT(*) の結果をキャッシュ付きで取得
+
+    execute(sql, params) は行のリストを返す関数。
+    行は辞書でもタプルでもよい。
+    namespace は接続先の区別（同じSQLでも別のDBなら件数が違うのでキーを分ける）。
+    key を渡すときも (namespace, from_sql, ...) の形にする（invalidate_counts が from_sql を見る）。
+    """
+    cache_key = key if key is not None else (namespace, from_sql, where_sql, tuple(params))
+
+    def compute():
+        rows = execute(f"SELECT COUNT(*) AS count {from_sql}{_where([where_sql])}", tuple(params))
+        if not rows:
+            return 0
+        row = rows[0]
+        return row['count'] if isinstance(row, dict) else row[0]
+
+    return count_cache.get_or_set(cache_key, compute)
+
+
+def fetch_page(execute, select_sql, from_sql, where_sql='', params=(),
+               order_columns=('id',), page=1, per_page=20, after=None,
+               descending=False):
+    """1ページ分の行をDB側で取得
+
+    after にソート列の値（order_columns と同じ順）を渡すとキーセット方式、
+    渡さなければ LIMIT/OFFSET 方式でページングする。
+    where_sql はWHEREを除いた条件式。
+    """
+    params = list(params)
+    direction = 'DESC' if descending else 'ASC'
+    order_sql = ', '.join(f"{col} {direction}" for col in order_columns)
+
+    if after is not None:
+        # 行値比較 (a, b) > (?, ?) はSQLite 3.15以降とPostgreSQLで使える
+        op = '<' if descending else '>'
+        columns = ', '.join(order_columns)
+        placeholders = ', '.join('?' for _ in order_columns)
+        where = _where([where_sql, f"({columns}) {op} ({placeholders})"])
+        sql = f"{select_sql} {from_sql}{where} ORDER BY {order_sql} LIMIT ?"
+        return execute(sql, tuple(params + list(after) + [per_page]))
+
+    offset = (max(page, 1) - 1) * per_page
+    sql = f"{select_sql} {from_sql}{_where([where_sql])} ORDER BY {order_sql} LIMIT ? OFFSET ?"
+    return execute(sql, tuple(params + [per_page, offset]))
+
+
+def encode_cursor(values):
+    """キーセットの値をURLに載せられる不透明なカーソル文字列にする"""
+    raw = json.dumps(list(values), default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, size):
+    """カーソル文字列をキーセットの値に戻す（不正ならNone）"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return tuple(values)
+
+
+def invalidate_counts(table):
+    """指定テーブルを参照する総件数キャッシュを破棄"""
+    def refers(key):
+        from_sql = key[1] if isinstance(key, tuple) and len(key) > 1 else ''
+        return isinstance(from_sql, str) and table in from_sql.replace(',', ' ').split()
+
+    count_cache.invalidate(refers)
+
+
+def fetch_admin_listing(cursor, select_sql, from_sql, where_sql='', params=(),
+                        id_column='id', page=1, per_page=20, after_id=None):
+    """管理画面一覧の1ページ分を取得
+
+    ROW_NUMBER() OVER (...) で全件に番号を振る代わりに、ページ位置から
+    row_num を計算して各行の先頭に付ける。select_sql の先頭列は id_column
+    と同じ値であること（次ページのキーセットに使う）。
+
+    戻り値: (rows, total, total_pages, next_after_id)
+    """
+    def execute(sql, query_params):
+        cursor.execute(sql, query_params)
+        return cursor.fetchall()
+
+    page = max(page, 1)
+    # 管理画面は db_config ではなくローカルSQLite（get_db）を読むので件数を別に持つ
+    total = cached_count(execute, from_sql, where_sql, params, namespace='sqlite')
+    total_pages = page_count(total, per_page)
+
+    rows = fetch_page(execute, select_sql, from_sql, where_sql, params,
+                      order_columns=(id_column,), page=page, per_page=per_page,
+                      after=(after_id,) if after_id is not None else None)
+
+    start = (page - 1) * per_page
+    rows = [(start + i + 1,) + tuple(row) for i, row in enumerate(rows)]
+    next_after_id = rows[-1][1] if len(rows) == per_page else None
+
+    return rows, total, total_pages, next_after_id
@@ -0,0 +1,274 @@
+import json
+import os
+import re
+import threading
+from collections import Counter
+
+from dotenv import load_dotenv
+
+# 環境変数を読み込み
+load_dotenv()
+
+# 発行したSQLを記録するか（本番では無効。audit-queries コマンドは自動で有効にする）
+QUERY_AUDIT = os.getenv('QUERY_AUDIT', 'false').lower() == 'true'
+# 全件スキャンがあれば失敗扱いにするテーブル
+QUERY_AUDIT_FAIL_TABLES = [
+    table.strip() for table in
+    os.getenv('QUERY_AUDIT_FAIL_TABLES', 'reviews,emails,email_attachments,cart,orders,order_items').split(',')
+    if table.strip()
+]
+# 既知の全件スキャンを許容するベースライン
+QUERY_AUDIT_BASELINE = os.getenv(
+    'QUERY_AUDIT_BASELINE',
+    os.path.join(os.path.dirname(__file__), '..', 'database', 'query_audit_baseline.json')
+)
+
+AUDITED_STATEMENTS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+# 監査で巡回する読み取り専用のページ（書き込みを伴うPOSTや削除リンクは含めない）
+AUDIT_ROUTES = [
+    '/', '/products', '/products?search=椅子', '/products?category=家具', '/products?sort=rating',
+    '/product/1', '/categories', '/reviews', '/review/1',
+    '/api/products', '/api/suggest?q=ノ', '/api/reviews?product_id=1',
+    '/user/profile', '/cart', '/checkout', '/orders', '/order/1',
+    '/mail/inbox', '/mail/sent',
+]
+AUDIT_ADMIN_ROUTES = ['/admin', '/admin/users', '/admin/orders', '/admin/products', '/admin/reviews']
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_TABLE_REF = re.compile(r"\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+_SQL_KEYWORDS = {'WHERE', 'JOIN', 'LEFT', 'RIGHT', 'INNER', 'OUTER', 'CROSS', 'ON', 'SET', 'VALUES', 'ORDER',
+                 'GROUP', 'LIMIT', 'OFFSET', 'HAVING', 'UNION', 'SELECT', 'USING', 'NATURAL', 'DEFAULT'}
+
+
+def normalize_sql(sql):
+    """リテラルを ? に置き換えて空白を詰めたSQL（同じ形のクエリを1つに集計する）"""
+    sql = sql.replace('%s', '?')
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _IN_LIST.sub('IN (?)', sql)
+    return ' '.join(sql.split()).rstrip(';')
+
+
+def table_aliases(sql):
+    """FROM / JOIN 句の別名 -> テーブル名"""
+    aliases = {}
+    for table, alias in _TABLE_REF.findall(sql):
+        aliases[table] = table
+        if alias and alias.upper() not in _SQL_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+
+class QueryRecorder:
+    """発行されたSQLを正規化して回数を数える
+
+    source は実行先（'db': db_config、'sqlite': ブループリントのSQLite接続）。
+    """
+
+    def __init__(self, enabled=QUERY_AUDIT):
+        self.enabled = enabled
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, source, sql):
+        if not self.enabled:
+            return
+        if not sql.lstrip().upper().startswith(AUDITED_STATEMENTS):
+            return
+        key = (source, normalize_sql(sql))
+        with self._lock:
+            self.counts[key] += 1
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+
+    def snapshot(self):
+        """[((source, sql), 回数)] を回数の多い順で返す"""
+        with self._lock:
+            return self.counts.most_common()
+
+
+class RecordingCursor:
+    """execute / executemany を記録してから実行するカーソル"""
+
+    def __init__(self, cursor, recorder, source):
+        self._cursor = cursor
+        self._recorder = recorder
+        self._source = source
+
+    def execute(self, sql, *args):
+        self._recorder.record(self._source, sql)
+        return self._cursor.execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        self._recorder.record(self._source, sql)
+        return self._cursor.executemany(sql, *args)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def sqlite_findings(conn, sql):
+    """EXPLAIN QUERY PLAN の結果から問題点を抽出"""
+    params = (None,) * sql.count('?')
+    details = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+    aliases = table_aliases(sql)
+
+    findings = []
+    for detail in details:
+        match = re.match(r"SCAN (\w+)(?: USING (COVERING )?INDEX (\w+))?$", detail)
+        if match:
+            table = aliases.get(match.group(1), match.group(1))
+            if match.group(3):
+                findings.append(('index_scan', table, detail))
+            else:
+                findings.append(('full_scan', table, detail))
+            continue
+        if detail.startswith('USE TEMP B-TREE'):
+            findings.append(('temp_sort', None, detail))
+            continue
+        match = re.match(r"SEARCH (\w+) USING INDEX (\w+)", detail)
+        if match:
+            # 索引で絞り込んだ後にテーブル本体を読む（カバリングインデックスではない）
+            findings.append(('non_covering', aliases.get(match.group(1), match.group(1)), detail))
+    return details, findings
+
+
+def postgres_findings(conn, sql):
+    """EXPLAIN (FORMAT JSON) の汎用プランから問題点を抽出"""
+    count = sql.count('?')
+    numbered = sql
+    for index in range(1, count + 1):
+        numbered = numbered.replace('?', f'${index}', 1)
+
+    cursor = conn.cursor()
+    # パラメータ値に依存しない汎用プランを得る
+    cursor.execute("SET plan_cache_mode = force_generic_plan")
+    try:
+        cursor.execute(f"PREPARE query_audit_stmt AS {numbered}")
+        try:
+            args = f"({', '.join('NULL' for _ in range(count))})" if count else ''
+            cursor.execute(f"EXPLAIN (FORMAT JSON) EXECUTE query_audit_stmt{args}")
+            row = cursor.fetchone()
+            plan = row['QUERY PLAN'] if isinstance(row, dict) else row[0]
+        finally:
+            cursor.execute("DEALLOCATE query_audit_stmt")
+    finally:
+        cursor.execute("RESET plan_cache_mode")
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    details, findings = [], []
+    stack = [plan[0]['Plan']]
+    while stack:
+        node = stack.pop()
+        node_type = node.get('Node Type')
+        relation = node.get('Relation Name')
+        details.append(f"{node_type} {relation or ''}".strip())
+        if node_type == 'Seq Scan':
+            findings.append(('full_scan', relation, details[-1]))
+        elif node_type in ('Sort', 'Incremental Sort'):
+            findings.append(('temp_sort', None, f"{node_type} {node.get('Sort Key', '')}"))
+        elif node_type == 'Index Scan':
+            findings.append(('non_covering', relation, f"Index Scan using {node.get('Index Name')}"))
+        stack.extend(node.get('Plans', []))
+    return details, findings
+
+
+def load_baseline(path=QUERY_AUDIT_BASELINE):
+    """許容済みの (table, sql) の集合"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return {(entry['table'], entry['sql']) for entry in json.load(f)}
+    except FileNotFoundError:
+        return set()
+
+
+def save_baseline(entries, path=QUERY_AUDIT_BASELINE):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump([{'table': table, 'sql': sql} for table, sql in sorted(entries)], f,
+                  ensure_ascii=False, indent=2)
+        f.write('\n')
+
+
+class QueryAuditor:
+    """記録したクエリの実行計画を調べて呼び出し回数順に報告する"""
+
+    def __init__(self, db, recorder):
+        self.db = db
+        self.recorder = recorder
+
+    def _explain(self, source, sql):
+        from app import sqlite_db
+
+        if source == 'sqlite':
+            return sqlite_findings(sqlite_db.get_db(), sql)
+
+        conn = self.db.get_db_connection()
+        broken = False
+        try:
+            if self.db.is_sqlite_mode():
+                return sqlite_findings(conn, sql)
+            return postgres_findings(conn, sql)
+        except Exception as e:
+            broken = self.db._is_connection_error(e)
+            raise
+        finally:
+            self.db.release_connection(conn, discard=broken)
+
+    def audit(self):
+        """[{source, sql, calls, plan, findings, error}] を呼び出し回数の多い順で返す"""
+        report = []
+        for (source, sql), calls in self.recorder.snapshot():
+            entry = {'source': source, 'sql': sql, 'calls': calls, 'plan': [], 'findings': [], 'error': None}
+            try:
+                entry['plan'], entry['findings'] = self._explain(source, sql)
+            except Exception as e:
+                entry['error'] = str(e)
+            report.append(entry)
+        return report
+
+    def violations(self, report, fail_tables=QUERY_AUDIT_FAIL_TABLES, baseline=frozenset()):
+        """ベースラインにない、対象テーブルの全件スキャン [(table, sql)]"""
+        found = []
+        for entry in report:
+            for kind, table, _ in entry['findings']:
+                if kind == 'full_scan' and table in fail_tables and (table, entry['sql']) not in baseline:
+                    found.append((table, entry['sql']))
+        return found
+
+    def print_report(self, report, violations):
+        for entry in report:
+            kinds = {kind for kind, _, _ in entry['findings']}
+            mark = '❌' if 'full_scan' in kinds else ('⚠️' if kinds - {'non_covering'} else '✅')
+            print(f"{mark} {entry['calls']:>4}回 [{entry['source']}] {entry['sql'][:160]}")
+            if entry['error']:
+                print(f"      ⚠️ EXPLAINエラー: {entry['error']}")
+            for kind, table, detail in entry['findings']:
+                print(f"      {kind:<13} {table or '-':<18} {detail}")
+
+        scans = sum(1 for entry in report if any(kind == 'full_scan' for kind, _, _ in entry['findings']))
+        print(f"🔍 クエリ {len(report)}種類 / 全件スキャンを含むもの {scans}種類")
+        for table, sql in violations:
+            print(f"❌ 許容されていない全件スキャン ({table}): {sql[:160]}")
+
+    def exercise(self, app, username, password):
+        """読み取り専用のページを巡回してクエリを記録する"""
+        client = app.test_client()
+        client.post('/login', data={'username': username, 'password': password})
+        for route in AUDIT_ROUTES:
+            client.get(route)
+        client.set_cookie('is_admin', '1')
+        for route in AUDIT_ADMIN_ROUTES:
+            client.get(route)
+
+
+# グローバルインスタンス
+query_recorder = QueryRecorder()
@@ -0,0 +1,248 @@
+import threading
+
+from app.database import db_config
+
+# 評価の集計列（件数・合計・★1〜★5の件数・平均）
+STAR_COLUMNS = ('stars_1', 'stars_2', 'stars_3', 'stars_4', 'stars_5')
+
+_STATS_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS product_rating_stats (
+        product_id INTEGER PRIMARY KEY,
+        review_count INTEGER NOT NULL DEFAULT 0,
+        rating_sum INTEGER NOT NULL DEFAULT 0,
+        {', '.join(f'{col} INTEGER NOT NULL DEFAULT 0' for col in STAR_COLUMNS)},
+        rating_avg REAL NOT NULL DEFAULT 0
+    )
+"""
+
+_STATS_INDEX = "CREATE INDEX IF NOT EXISTS idx_product_rating_stats_avg ON product_rating_stats (rating_avg)"
+
+
+def _upsert_sql(ref, sign, bool_cast=''):
+    """レビュー1件分（ref: new/old）を加算(sign=1)・減算(sign=-1)するUPSERT"""
+    prefix = '' if sign > 0 else '-'
+    stars = ', '.join(f"{prefix}({ref}.rating = {star}){bool_cast}" for star in range(1, 6))
+    star_updates = ', '.join(f"{col} = product_rating_stats.{col} + excluded.{col}" for col in STAR_COLUMNS)
+    return f"""
+        INSERT INTO product_rating_stats (product_id, review_count, rating_sum, {', '.join(STAR_COLUMNS)}, rating_avg)
+        VALUES ({ref}.product_id, {prefix}1, {prefix}{ref}.rating, {stars}, {ref}.rating)
+        ON CONFLICT (product_id) DO UPDATE SET
+            review_count = product_rating_stats.review_count + excluded.review_count,
+            rating_sum = product_rating_stats.rating_sum + excluded.rating_sum,
+            {star_updates},
+            rating_avg = COALESCE((product_rating_stats.rating_sum + excluded.rating_sum) * 1.0
+                / NULLIF(product_rating_stats.review_count + excluded.review_count, 0), 0)
+    """
+
+
+# 評価順は集計テーブルから商品を内部結合でたどるので、レビューのない商品にも0件の行を置く
+_PRODUCT_ROW_SQL = "INSERT INTO product_rating_stats (product_id, rating_avg) VALUES ({ref}.id, 0) ON CONFLICT (product_id) DO NOTHING"
+
+SQLITE_PRODUCT_ROW_DDL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS products_rating_ai AFTER INSERT ON products BEGIN
+        {_PRODUCT_ROW_SQL.format(ref='new')};
+    END
+    """,
+]
+
+POSTGRES_PRODUCT_ROW_DDL = [
+    f"""
+    CREATE OR REPLACE FUNCTION add_product_rating_stats() RETURNS trigger AS $$
+    BEGIN
+        {_PRODUCT_ROW_SQL.format(ref='NEW')};
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS products_rating_stats ON products",
+    """
+    CREATE TRIGGER products_rating_stats
+    AFTER INSERT ON products
+    FOR EACH ROW EXECUTE FUNCTION add_product_rating_stats()
+    """,
+]
+
+# 既存の商品に0件の行を作る（INSERT ... SELECT の ON CONFLICT はSQLiteの構文上 WHERE が必要）
+BACKFILL_PRODUCT_ROWS = """
+    INSERT INTO product_rating_stats (product_id, rating_avg)
+    SELECT id, 0 FROM products WHERE 1 = 1
+    ON CONFLICT (product_id) DO NOTHING
+"""
+
+
+# SQLite: reviews の変更と同じトランザクションで集計を増減する
+SQLITE_RATING_DDL = [
+    _STATS_TABLE,
+    _STATS_INDEX,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS reviews_rating_ai AFTER INSERT ON reviews BEGIN
+        {_upsert_sql('new', 1)};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS reviews_rating_au AFTER UPDATE OF rating, product_id ON reviews BEGIN
+        {_upsert_sql('old', -1)};
+        {_upsert_sql('new', 1)};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS reviews_rating_ad AFTER DELETE ON reviews BEGIN
+        {_upsert_sql('old', -1)};
+    END
+    """,
+    *SQLITE_PRODUCT_ROW_DDL,
+]
+
+# PostgreSQL: 行単位トリガー
+POSTGRES_RATING_DDL = [
+    _STATS_TABLE,
+    _STATS_INDEX,
+    f"""
+    CREATE OR REPLACE FUNCTION maintain_product_rating_stats() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            {_upsert_sql('OLD', -1, '::int')};
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            {_upsert_sql('NEW', 1, '::int')};
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS reviews_rating_stats ON reviews",
+    """
+    CREATE TRIGGER reviews_rating_stats
+    AFTER INSERT OR DELETE OR UPDATE OF rating, product_id ON reviews
+    FOR EACH ROW EXECUTE FUNCTION maintain_product_rating_stats()
+    """,
+    *POSTGRES_PRODUCT_ROW_DDL,
+]
+
+
+class RatingStats:
+    """商品ごとの評価集計（product_rating_stats）
+
+    レビューの投稿・編集・削除のたびにトリガーで件数・合計・★別件数を増減するので、
+    一覧で平均評価を表示・並べ替えするときに reviews を走査しなくてよい。
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._ready = {}
+        self._lock = threading.Lock()
+
+    def _backend(self):
+        return 'sqlite' if self.db.is_sqlite_mode() else 'postgres'
+
+    def _table_exists(self, backend):
+        if backend == 'sqlite':
+            rows = self.db.execute_query(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'product_rating_stats'",
+                primary=True
+            )
+        else:
+            rows = self.db.execute_query(
+                "SELECT table_name FROM information_schema.tables WHERE table_name = 'product_rating_stats'",
+                primary=True
+            )
+        return bool(rows)
+
+    def ensure_table(self):
+        """集計テーブルとトリガーがなければ作成して全件集計"""
+        backend = self._backend()
+        if backend not in self._ready:
+            with self._lock:
+                if backend not in self._ready:
+                    existed = self._table_exists(backend)
+                    if not existed:
+                        for ddl in (SQLITE_RATING_DDL if backend == 'sqlite' else POSTGRES_RATING_DDL):
+                            self.db.execute_update(ddl)
+                    ready = self._table_exists(backend)
+                    if ready and not existed:
+                        self._rebuild()
+                    if not ready:
+                        print(f"⚠️ 評価集計テーブルを作成できません ({backend})")
+                    self._ready[backend] = ready
+        return self._ready[backend]
+
+    def _rebuild(self):
+        stars = ', '.join(f"SUM(CASE WHEN rating = {star} THEN 1 ELSE 0 END)" for star in range(1, 6))
+        try:
+            # 削除と再集計の間に空のテーブルが見えないよう1トランザクションで入れ替える
+            with self.db.transaction() as tx:
+                tx.execute("DELETE FROM product_rating_stats")
+                tx.execute(f"""
+                    INSERT INTO product_rating_stats (product_id, review_count, rating_sum, {', '.join(STAR_COLUMNS)}, rating_avg)
+                    SELECT product_id, COUNT(*), SUM(rating), {stars}, AVG(rating * 1.0)
+                    FROM reviews
+                    GROUP BY product_id
+                    ON CONFLICT (product_id) DO UPDATE SET
+                        review_count = excluded.review_count,
+                        rating_sum = excluded.rating_sum,
+                        {', '.join(f"{col} = excluded.{col}" for col in STAR_COLUMNS)},
+                        rating_avg = excluded.rating_avg
+                """)
+                tx.execute(BACKFILL_PRODUCT_ROWS)
+        except Exception as e:
+            print(f"❌ 評価集計の再構築エラー: {e}")
+            return None
+        rows = self.db.execute_query("SELECT COUNT(*) AS count FROM product_rating_stats", primary=True)
+        return rows[0]['count'] if rows else 0
+
+    def rebuild(self):
+        """reviews から全件集計し直して商品数を返す"""
+        if not self.ensure_table():
+            return None
+        return self._rebuild()
+
+    def _to_dict(self, row):
+        count = row['review_count']
+        return {
+            'count': count,
+            'average': round(row['rating_sum'] / count, 2) if count else None,
+            'histogram': {star: row[col] for star, col in enumerate(STAR_COLUMNS, start=1)},
+        }
+
+    def empty(self):
+        return {'count': 0, 'average': None, 'histogram': {star: 0 for star in range(1, 6)}}
+
+    def get(self, product_id):
+        """1商品の評価集計"""
+        return self.for_products([product_id]).get(product_id, self.empty())
+
+    def for_products(self, product_ids):
+        """複数商品の評価集計を1クエリで取得（商品ID -> 集計）"""
+        product_ids = [pid for pid in product_ids if pid is not None]
+        if not product_ids or not self.ensure_table():
+            return {}
+        placeholders = ', '.join('?' for _ in product_ids)
+        rows = self.db.execute_query(
+            f"SELECT * FROM product_rating_stats WHERE product_id IN ({placeholders})", tuple(product_ids)
+        )
+        return {row['product_id']: self._to_dict(row) for row in rows}
+
+    def join_sql(self, alias='p'):
+        """評価順で並べるときに FROM に足す結合（集計テーブルの別名は rs）
+
+        全商品に集計行があるので内部結合でよく、idx_product_rating_stats_avg を
+        たどって上位の商品から読める。
+        """
+        if not self.ensure_table():
+            return ''
+        return f"JOIN product_rating_stats rs ON rs.product_id = {alias}.id"
+
+    def order_columns(self, alias='p'):
+        """評価順に並べる列（join_sql と組み合わせ、降順で使う。平均評価、同点は件数、最後にID）"""
+        if not self.ensure_table():
+            return (f"{alias}.id",)
+        return ("rs.rating_avg", "rs.review_count", f"{alias}.id")
+
+    def order_sql(self, alias='p'):
+        """平均評価の高い順（同点は件数の多い順）に並べるORDER BY句"""
+        return ', '.join(f"{column} DESC" for column in self.order_columns(alias))
+
+
+# グローバルインスタンス
+rating_stats = RatingStats(db_config)
@@ -0,0 +1,126 @@
+import itertools
+import sqlite3
+import threading
+from urllib.parse import urlsplit
+
+import psycopg2
+
+from app.circuit_breaker import CircuitBreaker
+from app.db_pool import CircuitOpenError, PoolTimeoutError, PostgresConnectionPool
+
+
+class Replica:
+    """読み取り専用の接続先1つ（PostgreSQLはプール、sqlite:///パス は読み取り専用で開く）"""
+
+    def __init__(self, url, pool_options, breaker_threshold, breaker_cooldown, connect_timeout):
+        self.url = url
+        self.is_sqlite = url.startswith('sqlite:///')
+        self.path = url[len('sqlite:///'):] if self.is_sqlite else None
+        # 統計に出す名前（認証情報は含めない）
+        self.name = self.path if self.is_sqlite else (urlsplit(url).hostname or 'replica')
+        self.connect_timeout = connect_timeout
+        self.pool_options = pool_options
+        self.inflight = 0
+        self._pool = None
+        self._lock = threading.Lock()
+        self._stats = {'queries': 0, 'failures': 0}
+        self.breaker = CircuitBreaker(f"replica:{self.name}", self._probe,
+                                      failure_threshold=breaker_threshold, cooldown=breaker_cooldown)
+
+    def _connect_sqlite(self):
+        return sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = PostgresConnectionPool(self.url, connect_timeout=self.connect_timeout,
+                                                        **self.pool_options)
+        return self._pool
+
+    def _probe(self):
+        conn = self._connect_sqlite() if self.is_sqlite else psycopg2.connect(
+            self.url, connect_timeout=self.connect_timeout)
+        try:
+            conn.cursor().execute("SELECT 1")
+        finally:
+            conn.close()
+
+    def connect(self):
+        """接続を取得（ブレーカーが open なら CircuitOpenError）"""
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"replica {self.name} circuit breaker is open")
+        try:
+            conn = self._connect_sqlite() if self.is_sqlite else self._get_pool().getconn()
+        except PoolTimeoutError:
+            raise
+        except (psycopg2.OperationalError, sqlite3.OperationalError) as e:
+            self.breaker.record_failure(e)
+            with self._lock:
+                self._stats['failures'] += 1
+            raise
+        self.breaker.record_success()
+        with self._lock:
+            self.inflight += 1
+            self._stats['queries'] += 1
+        return conn
+
+    def release(self, conn, discard=False):
+        with self._lock:
+            self.inflight -= 1
+            if discard:
+                self._stats['failures'] += 1
+        if discard:
+            self.breaker.record_failure()
+        if self.is_sqlite:
+            conn.close()
+        else:
+            self._get_pool().putconn(conn, discard=discard)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, name=self.name, inflight=self.inflight)
+        stats['breaker'] = self.breaker.stats()
+        if self._pool is not None:
+            stats['pool'] = self._pool.stats()
+        return stats
+
+
+class ReplicaRouter:
+    """読み取りクエリを振り分けるレプリカを選ぶ
+
+    strategy は round_robin（順番）か least_inflight（実行中の少ない順）。
+    ブレーカーが open のレプリカは飛ばし、すべて使えなければ None（プライマリで実行）。
+    """
+
+    def __init__(self, urls, strategy='round_robin', pool_options=None,
+                 breaker_threshold=3, breaker_cooldown=30, connect_timeout=10):
+        self.strategy = strategy if strategy in ('round_robin', 'least_inflight') else 'round_robin'
+        self.replicas = [Replica(url, pool_options or {}, breaker_threshold, breaker_cooldown, connect_timeout)
+                         for url in urls]
+        self._counter = itertools.count()
+        self._stats = {'replica_reads': 0, 'primary_reads': 0, 'fallbacks': 0}
+
+    @property
+    def enabled(self):
+        return bool(self.replicas)
+
+    def choose(self):
+        if not self.replicas:
+            return None
+        if self.strategy == 'least_inflight':
+            candidates = sorted(self.replicas, key=lambda replica: replica.inflight)
+        else:
+            start = next(self._counter) % len(self.replicas)
+            candidates = self.replicas[start:] + self.replicas[:start]
+        for replica in candidates:
+            if replica.breaker.allow():
+                return replica
+        return None
+
+    def count(self, key):
+        """統計（概数でよいのでロックは取らない）"""
+        self._stats[key] += 1
+
+    def stats(self):
+        return dict(self._stats, strategy=self.strategy, replicas=[replica.stats() for replica in self.replicas])
@@ -0,0 +1,218 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from app.single_flight import SingleFlight
+
+# 環境変数を読み込み
+load_dotenv()
+
+# クエリ結果キャッシュの有効期間（秒）と、全体・1件あたりの上限バイト数（概算、0で無効）
+RESULT_CACHE_TTL = float(os.getenv('RESULT_CACHE_TTL', 60))
+# 有効期間切れから何秒間は古い結果を返しつつ裏で読み直すか（stale-while-revalidate、0で無効）
+RESULT_CACHE_STALE_TTL = float(os.getenv('RESULT_CACHE_STALE_TTL', 30))
+RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+RESULT_CACHE_MAX_ENTRY_BYTES = int(os.getenv('RESULT_CACHE_MAX_ENTRY_BYTES', 1024 * 1024))
+
+
+def estimate_size(rows):
+    """結果（Row のリスト）のおおよそのメモリ使用量（列情報は行間で共有なので数えない）"""
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row)
+        for value in row:
+            size += sys.getsizeof(value)
+    return size
+
+
+class _Entry:
+    __slots__ = ('rows', 'tables', 'expires', 'stale_until', 'size')
+
+    def __init__(self, rows, tables, expires, stale_until, size):
+        self.rows = rows
+        self.tables = tables
+        self.expires = expires
+        self.stale_until = stale_until
+        self.size = size
+
+
+class ResultCache:
+    """依存テーブルで無効化できるクエリ結果キャッシュ（TTL + バイト数上限のLRU）
+
+    キャッシュするクエリは参照するテーブルを宣言し、書き込みがあったテーブルの
+    版数を invalidate() で進めると、そのテーブルに依存するエントリを破棄する。
+    読み込み中に書き込みがあった結果は保存しない（古い結果を残さない）。
+
+    同じキーの同時ミスは SingleFlight で1回の読み込みにまとめる。有効期間が切れた
+    エントリは stale_ttl 秒のあいだ古い結果を返し、読み直しはバックグラウンドで
+    1回だけ行う（書き込みで破棄したエントリは古い結果としても返さない）。
+
+    プロセス内のキャッシュなので、他のプロセス（別ワーカーや外部ツール）からの
+    書き込みは TTL が切れるまで反映されない。
+    """
+
+    def __init__(self, ttl=RESULT_CACHE_TTL, max_bytes=RESULT_CACHE_MAX_BYTES,
+                 max_entry_bytes=RESULT_CACHE_MAX_ENTRY_BYTES, stale_ttl=RESULT_CACHE_STALE_TTL):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self._entries = OrderedDict()
+        self._dependents = {}
+        self._versions = {}
+        self._written_at = {}
+        # invalidate() で全件破棄した回数と時刻（版数の一部として扱う）
+        self._epoch = 0
+        self._cleared_at = None
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'expired': 0, 'stores': 0, 'evictions': 0,
+                       'invalidations': 0, 'invalidated_entries': 0, 'too_large': 0, 'raced': 0}
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0 and self.ttl > 0
+
+    def _remove_locked(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        for table in entry.tables:
+            keys = self._dependents.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._dependents[table]
+        return entry
+
+    def get(self, key):
+        """キャッシュ済みの結果と、有効期間内かどうか（無い・古すぎれば (None, False)）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None, False
+            now = time.monotonic()
+            if entry.stale_until < now:
+                self._remove_locked(key)
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return None, False
+            self._entries.move_to_end(key)
+            fresh = entry.expires >= now
+            self._stats['hits' if fresh else 'stale_hits'] += 1
+            return entry.rows, fresh
+
+    def _versions_locked(self, tables):
+        return (self._epoch,) + tuple(self._versions.get(table, 0) for table in tables)
+
+    def versions(self, tables):
+        """テーブルの現在の版数（読み込み前に取得して put() に渡す）"""
+        with self._lock:
+            return self._versions_locked(tables)
+
+    def put(self, key, tables, versions, rows, ttl=None):
+        """結果を保存（versions 取得後に依存テーブルへの書き込みがあれば保存しない）"""
+        size = estimate_size(rows)
+        with self._lock:
+            if self._versions_locked(tables) != versions:
+                self._stats['raced'] += 1
+                return False
+            if size > self.max_entry_bytes:
+                self._stats['too_large'] += 1
+                return False
+            if key in self._entries:
+                self._remove_locked(key)
+            expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+            self._entries[key] = _Entry(rows, tables, expires, expires + self.stale_ttl, size)
+            self._bytes += size
+            for table in tables:
+                self._dependents.setdefault(table, set()).add(key)
+            self._stats['stores'] += 1
+            # 上限を超えたら最も長く使われていないものから捨てる
+            while self._bytes > self.max_bytes:
+                self._remove_locked(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+            return True
+
+    def get_or_load(self, key, tables, load, ttl=None):
+        """キャッシュになければ load() で読み込んで保存（load() が None を返したら保存しない）"""
+        rows, fresh = self.get(key)
+        if rows is not None:
+            if not fresh:
+                # 古い結果を返し、読み直しは裏で1回だけ
+                self._flight.do_background(key, lambda: self._load(key, tables, load, ttl))
+            return rows
+        return self._flight.do(key, lambda: self._load(key, tables, load, ttl))
+
+    def _load(self, key, tables, load, ttl):
+        # 直前に別のスレッドが読み込みを終えていればそれを使う
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires >= time.monotonic():
+                return entry.rows
+        versions = self.versions(tables)
+        rows = load()
+        if rows is not None:
+            self.put(key, tables, versions, rows, ttl)
+        return rows
+
+    def invalidate(self, *tables):
+        """テーブルの版数を進めて依存するエントリを破棄（引数なしで全件）"""
+        now = time.monotonic()
+        with self._lock:
+            self._stats['invalidations'] += 1
+            if not tables:
+                # 読み込み中の結果も保存させない
+                self._epoch += 1
+                self._cleared_at = now
+                self._stats['invalidated_entries'] += len(self._entries)
+                self._entries.clear()
+                self._dependents.clear()
+                self._bytes = 0
+                return
+            for table in tables:
+                for key in list(self._dependents.get(table, ())):
+                    self._remove_locked(key)
+                    self._stats['invalidated_entries'] += 1
+                self._versions[table] = self._versions.get(table, 0) + 1
+                self._written_at[table] = now
+
+    def written_within(self, tables, seconds):
+        """いずれかのテーブルに seconds 秒以内の書き込みがあったか"""
+        since = time.monotonic() - seconds
+        if self._cleared_at is not None and self._cleared_at > since:
+            return True
+        for table in tables:
+            written_at = self._written_at.get(table)
+            if written_at is not None and written_at > since:
+                return True
+        return False
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats['hits'] + stats['stale_hits'] + stats['misses']
+            stats.update({
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'stale_ttl': self.stale_ttl,
+                'epoch': self._epoch,
+                'single_flight': self._flight.stats(),
+                'hit_ratio': round((stats['hits'] + stats['stale_hits']) / lookups, 4) if lookups else 0.0,
+                'tables': {table: {'version': self._versions.get(table, 0),
+                                   'entries': len(self._dependents.get(table, ()))}
+                           for table in sorted(set(self._versions) | set(self._dependents))},
+            })
+            return stats
+
+
+# グローバルインスタンス
+result_cache = ResultCache()
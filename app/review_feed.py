@@ -0,0 +1,71 @@
+import os
+
+from dotenv import load_dotenv
+
+from app.database import db_config
+from app.pagination import TTLCache, decode_cursor, encode_cursor, fetch_page
+
+# 環境変数を読み込み
+load_dotenv()
+
+# 1ページのレビュー件数
+REVIEW_PAGE_SIZE = int(os.getenv('REVIEW_PAGE_SIZE', 10))
+# 先頭ページキャッシュの有効期間（秒）。投稿・編集・削除時は即座に破棄する
+REVIEW_CACHE_TTL = float(os.getenv('REVIEW_CACHE_TTL', 60))
+
+# 列の並びは r.* と同じ（id, product_id, user_id, rating, comment, created_at）
+REVIEW_SELECT = ("SELECT r.id, r.product_id, r.user_id, r.rating, r.comment, r.created_at, "
+                 "u.username, p.name AS product_name, p.image_url")
+REVIEW_FROM = "FROM reviews r JOIN users u ON r.user_id = u.id JOIN products p ON r.product_id = p.id"
+REVIEW_ORDER = ('r.created_at', 'r.id')
+
+
+class ReviewFeed:
+    """レビューの新しい順ページング（created_at, id のキーセット）
+
+    全件を読み込まず1ページ分だけ取得するので、レビュー数に関係なく
+    同じ時間で表示できる（インデックスは app/migrations.py の v1）。
+    商品ごと（と全体）の先頭ページはキャッシュする。
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.cache = TTLCache(ttl=REVIEW_CACHE_TTL, max_entries=1024)
+
+    def _fetch(self, product_id, after, limit):
+        where_sql, params = '', ()
+        if product_id is not None:
+            where_sql, params = "r.product_id = ?", (product_id,)
+
+        # 1件多く取得して次ページの有無を判定
+        rows = fetch_page(self.db.execute_query, REVIEW_SELECT, REVIEW_FROM, where_sql, params,
+                          order_columns=REVIEW_ORDER, per_page=limit + 1, after=after, descending=True)
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor((rows[-1]['created_at'], rows[-1]['id']))
+        return rows, next_cursor
+
+    def page(self, product_id=None, cursor=None, limit=None):
+        """レビュー1ページ分と次ページのカーソルを返す
+
+        product_id を省略すると全商品のレビュー。cursor は前ページの next_cursor。
+        """
+        limit = min(max(limit or REVIEW_PAGE_SIZE, 1), 100)
+        after = decode_cursor(cursor, 2)
+
+        if after is None and limit == REVIEW_PAGE_SIZE:
+            key = ('product', product_id) if product_id is not None else ('all',)
+            return self.cache.get_or_set(key, lambda: self._fetch(product_id, None, limit))
+        return self._fetch(product_id, after, limit)
+
+    def invalidate(self, product_id=None):
+        """先頭ページのキャッシュを破棄（商品指定なしで全て）"""
+        if product_id is None:
+            self.cache.invalidate()
+        else:
+            self.cache.invalidate(lambda key: key in (('product', product_id), ('all',)))
+
+
+# グローバルインスタンス
+review_feed = ReviewFeed(db_config)
@@ -1,9 +1,17 @@
-from flask import Blueprint, render_template, request, session, redirect, flash, jsonify, make_response
-import sqlite3
+from flask import Blueprint, render_template, request, session, redirect, flash, jsonify, make_response, Response, stream_with_context
+from app.sqlite_db import get_db, backup_to, restore_from
+from app.facets import facet_service
+from app.pagination import count_cache, fetch_admin_listing, invalidate_counts
+from app.result_cache import result_cache
+from app.review_feed import review_feed
+from app.rows import iter_rows
+from app.suggest import suggest_index
 import os
 import subprocess
 import pickle
 import base64
+import csv
+import io
 import json
 import shutil
 from datetime import datetime
@@ -20,7 +28,7 @@ def admin_dashboard():
     
     # 権限検証 (隠しパラメータによる権限昇格脆弱性デモ)
     if int(is_admin) > 0:
-        conn = sqlite3.connect('database/shop.db')
+        conn = get_db()
         cursor = conn.cursor()
         
         # 統計情報
@@ -54,26 +62,23 @@ def admin_users():
     is_admin = request.cookies.get('is_admin', '0')
     
     if int(is_admin) > 0:
-        conn = sqlite3.connect('database/shop.db')
+        conn = get_db()
         cursor = conn.cursor()
         
         search = request.args.get('search', '')
         page = request.args.get('page', 1, type=int)
+        after_id = request.args.get('after_id', type=int)
         per_page = 20
         
         if search:
-            cursor.execute(f"SELECT ROW_NUMBER() OVER (ORDER BY created_at ASC) as row_num, * FROM users WHERE username LIKE '%{search}%' OR email LIKE '%{search}%'")
+            where_sql = f"username LIKE '%{search}%' OR email LIKE '%{search}%'"
         else:
-            cursor.execute("SELECT ROW_NUMBER() OVER (ORDER BY created_at ASC) as row_num, * FROM users ORDER BY created_at ASC")
+            where_sql = ""
         
-        all_users = cursor.fetchall()
-        
-        # ページング計算
-        total = len(all_users)
-        total_pages = (total + per_page - 1) // per_page
-        start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        users = all_users[start_idx:end_idx]
+        # DB側でページング（idは登録順なので created_at 順と同じ並び）
+        users, total, total_pages, next_after_id = fetch_admin_listing(
+            cursor, "SELECT *", "FROM users", where_sql,
+            page=page, per_page=per_page, after_id=after_id)
         
         conn.close()
         
@@ -82,7 +87,8 @@ def admin_users():
                              search=search, 
                              page=page, 
                              total_pages=total_pages,
-                             total=total)
+                             total=total,
+                             next_after_id=next_after_id)
     
     return "管理者権限が必要です"
 
@@ -92,13 +98,14 @@ def delete_user(user_id):
     is_admin = request.cookies.get('is_admin', '0')
     
     if int(is_admin) > 0:
-        conn = sqlite3.connect('database/shop.db')
+        conn = get_db()
         cursor = conn.cursor()
         
 
         cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
         conn.commit()
         conn.close()
+        invalidate_counts('users')
         
         flash('ユーザーを削除しました', 'success')
         return redirect('/admin/users')
@@ -111,7 +118,7 @@ def edit_user(user_id):
     is_admin = request.cookies.get('is_admin', '0')
     
     if int(is_admin) > 0:
-        conn = sqlite3.connect('database/shop.db')
+        conn = get_db()
         cursor = conn.cursor()
         
         if request.method == 'POST':
@@ -153,26 +160,23 @@ def admin_orders():
     user_id = request.cookies.get('user_id')
     
     if user_id == '1':
-        conn = sqlite3.connect('database/shop.db')
+        conn = get_db()
         cursor = conn.cursor()
         
         search = request.args.get('search', '')
         page = request.args.get('page', 1, type=int)
+        after_id = request.args.get('after_id', type=int)
         per_page = 20
         
         if search:
-            cursor.execute(f"SELECT ROW_NUMBER() OVER (ORDER BY o.id ASC) as row_num, o.*, u.username FROM orders o JOIN users u ON o.user_id = u.id WHERE o.id LIKE '%{search}%' OR u.username LIKE '%{search}%' ORDER BY o.id ASC")
+            where_sql = f"o.id LIKE '%{search}%' OR u.username LIKE '%{search}%'"
         else:
-            cursor.execute("SELECT ROW_NUMBER() OVER (ORDER BY o.id ASC) as row_num, o.*, u.username FROM orders o JOIN users u ON o.user_id = u.id ORDER BY o.id ASC")
-        
-        all_orders = cursor.fetchall()
+            where_sql = ""
         
-        # ページング計算
-        total = len(all_orders)
-        total_pages = (total + per_page - 1) // per_page
-        start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        orders = all_orders[start_idx:end_idx]
+        # DB側でページング
+        orders, total, total_pages, next_after_id = fetch_admin_listing(
+            cursor, "SELECT o.*, u.username", "FROM orders o JOIN users u ON o.user_id = u.id", where_sql,
+            id_column='o.id', page=page, per_page=per_page, after_id=after_id)
         
         conn.close()
         
@@ -181,7 +185,8 @@ def admin_orders():
                              search=search, 
                              page=page, 
                              total_pages=total_pages,
-                             total=total)
+                             total=total,
+                             next_after_id=next_after_id)
     
     return "管理者権限が必要です"
 
@@ -191,7 +196,7 @@ def edit_order(order_id):
     user_id = request.cookies.get('user_id')
     
     if user_id == '1':
-        conn = sqlite3.connect('database/shop.db')
+        conn = get_db()
         cursor = conn.cursor()
         
         if request.method == 'POST':
@@ -227,12 +232,13 @@ def delete_order(order_id):
     user_id = request.cookies.get('user_id')
     
     if user_id == '1':
-        conn = sqlite3.connect('database/shop.db')
+        conn = get_db()
         cursor = conn.cursor()
         
         cursor.execute("DELETE FROM orders WHERE id = ?", (order_id,))
         conn.commit()
         conn.close()
+        invalidate_counts('orders')
         
         flash('注文を削除しました', 'success')
         return redirect('/admin/orders')
@@ -245,26 +251,23 @@ def admin_products():
     user_id = request.cookies.get('user_id')
     
     if user_id == '1':
-        conn = sqlite3.connect('database/shop.db')
+        conn = get_db()
         cursor = conn.cursor()
         
         search = request.args.get('search', '')
         page = request.args.get('page', 1, type=int)
+        after_id = request.args.get('after_id', type=int)
         per_page = 20
         
         if search:
-            cursor.execute(f"SELECT ROW_NUMBER() OVER (ORDER BY id ASC) as row_num, * FROM products WHERE name LIKE '%{search}%' OR category LIKE '%{search}%' ORDER BY id ASC")
+            where_sql = f"name LIKE '%{search}%' OR category LIKE '%{search}%'"
         else:
-            cursor.execute("SELECT ROW_NUMBER() OVER (ORDER BY id ASC) as row_num, * FROM products ORDER BY id ASC")
-        
-        all_products = cursor.fetchall()
+            where_sql = ""
         
-        # ページング計算
-        total = len(all_products)
-        total_pages = (total + per_page - 1) // per_page
-        start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        products = all_products[start_idx:end_idx]
+        # DB側でページング
+        products, total, total_pages, next_after_id = fetch_admin_listing(
+            cursor, "SELECT *", "FROM products", where_sql,
+            page=page, per_page=per_page, after_id=after_id)
         
         conn.close()
         
@@ -273,7 +276,8 @@ def admin_products():
                              search=search, 
                              page=page, 
                              total_pages=total_pages,
-                             total=total)
+                             total=total,
+                             next_after_id=next_after_id)
     
     return "管理者権限が必要です"
 
@@ -283,13 +287,16 @@ def delete_product(product_id):
     user_id = request.cookies.get('user_id')
     
     if user_id == '1':
-        conn = sqlite3.connect('database/shop.db')
+        conn = get_db()
         cursor = conn.cursor()
         
         # IDOR脆弱性: 権限チェックなしで削除
         cursor.execute("DELETE FROM products WHERE id = ?", (product_id,))
         conn.commit()
         conn.close()
+        invalidate_counts('products')
+        result_cache.invalidate('products')
+        suggest_index.remove_product(product_id)
         
         flash('商品を削除しました', 'success')
         return redirect('/admin/products')
@@ -318,12 +325,15 @@ def add_product():
                 file.save(file_path)
                 image_url = f'/static/uploads/{filename}'
             
-            conn = sqlite3.connect('database/shop.db')
+            conn = get_db()
             cursor = conn.cursor()
             cursor.execute("INSERT INTO products (name, description, price, stock, category, image_url) VALUES (?, ?, ?, ?, ?, ?)",
                          (name, description, price, stock, category, image_url))
             conn.commit()
             conn.close()
+            invalidate_counts('products')
+            result_cache.invalidate('products')
+            suggest_index.add_product(cursor.lastrowid, name, category)
             
             flash('商品を追加しました', 'success')
             return redirect('/admin/products')
@@ -338,7 +348,7 @@ def edit_product(product_id):
     user_id = request.cookies.get('user_id')
     
     if user_id == '1':
-        conn = sqlite3.connect('database/shop.db')
+        conn = get_db()
         cursor = conn.cursor()
         
         if request.method == 'POST':
@@ -363,6 +373,10 @@ def edit_product(product_id):
             
             conn.commit()
             conn.close()
+            # カテゴリ変更で絞り込み件数が変わるため件数キャッシュも破棄
+            invalidate_counts('products')
+            result_cache.invalidate('products')
+            suggest_index.update_product(product_id, name, category)
             
             flash('商品を更新しました', 'success')
             return redirect('/admin/products')
@@ -385,39 +399,28 @@ def admin_reviews():
     user_id = request.cookies.get('user_id')
     
     if user_id == '1':
-        conn = sqlite3.connect('database/shop.db')
+        conn = get_db()
         cursor = conn.cursor()
         
         search = request.args.get('search', '')
         page = request.args.get('page', 1, type=int)
+        after_id = request.args.get('after_id', type=int)
         per_page = 20
         
         if search:
-            cursor.execute(f"""
-                SELECT ROW_NUMBER() OVER (ORDER BY r.id ASC) as row_num, r.*, u.username, p.name as product_name 
-                FROM reviews r 
-                JOIN users u ON r.user_id = u.id 
-                JOIN products p ON r.product_id = p.id 
-                WHERE p.name LIKE '%{search}%' OR u.username LIKE '%{search}%'
-                ORDER BY r.id ASC
-            """)
+            where_sql = f"p.name LIKE '%{search}%' OR u.username LIKE '%{search}%'"
         else:
-            cursor.execute("""
-                SELECT ROW_NUMBER() OVER (ORDER BY r.id ASC) as row_num, r.*, u.username, p.name as product_name 
-                FROM reviews r 
-                JOIN users u ON r.user_id = u.id 
-                JOIN products p ON r.product_id = p.id 
-                ORDER BY r.id ASC
-            """)
-        
-        all_reviews = cursor.fetchall()
+            where_sql = ""
         
-        # ページング計算
-        total = len(all_reviews)
-        total_pages = (total + per_page - 1) // per_page
-        start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        reviews = all_reviews[start_idx:end_idx]
+        # DB側でページング
+        reviews, total, total_pages, next_after_id = fetch_admin_listing(
+            cursor,
+            "SELECT r.*, u.username, p.name as product_name",
+            """FROM reviews r 
+                JOIN users u ON r.user_id = u.id 
+                JOIN products p ON r.product_id = p.id""",
+            where_sql,
+            id_column='r.id', page=page, per_page=per_page, after_id=after_id)
         
         conn.close()
         
@@ -426,7 +429,8 @@ def admin_reviews():
                              search=search, 
                              page=page, 
                              total_pages=total_pages,
-                             total=total)
+                             total=total,
+                             next_after_id=next_after_id)
     
     return "管理者権限が必要です"
 
@@ -436,7 +440,7 @@ def edit_review(review_id):
     user_id = request.cookies.get('user_id')
     
     if user_id == '1':
-        conn = sqlite3.connect('database/shop.db')
+        conn = get_db()
         cursor = conn.cursor()
         
         if request.method == 'POST':
@@ -448,6 +452,8 @@ def edit_review(review_id):
             
             conn.commit()
             conn.close()
+            result_cache.invalidate('reviews')
+            review_feed.invalidate()
             
             flash('レビューを更新しました', 'success')
             return redirect('/admin/reviews')
@@ -476,18 +482,84 @@ def delete_review(review_id):
     user_id = request.cookies.get('user_id')
     
     if user_id == '1':
-        conn = sqlite3.connect('database/shop.db')
+        conn = get_db()
         cursor = conn.cursor()
         
         cursor.execute("DELETE FROM reviews WHERE id = ?", (review_id,))
         conn.commit()
         conn.close()
+        invalidate_counts('reviews')
+        result_cache.invalidate('reviews')
+        review_feed.invalidate()
         
         flash('レビューを削除しました', 'success')
         return redirect('/admin/reviews')
     
     return "管理者権限が必要です"
 
+# CSVエクスポートできる一覧（SELECT, 検索条件, 並び順）
+EXPORT_LISTINGS = {
+    'products': ("SELECT * FROM products",
+                 "name LIKE ? OR category LIKE ?", "id"),
+    'orders': ("SELECT o.*, u.username FROM orders o JOIN users u ON o.user_id = u.id",
+               "CAST(o.id AS TEXT) LIKE ? OR u.username LIKE ?", "o.id"),
+    'reviews': ("""SELECT r.*, u.username, p.name AS product_name FROM reviews r
+                   JOIN users u ON r.user_id = u.id
+                   JOIN products p ON r.product_id = p.id""",
+                "p.name LIKE ? OR u.username LIKE ?", "r.id"),
+}
+EXPORT_BATCH_SIZE = 500
+
+
+def _csv_cell(value):
+    """表計算ソフトで数式として解釈される値は ' を付けて文字列にする"""
+    if isinstance(value, str) and value[:1] in ('=', '+', '-', '@'):
+        return "'" + value
+    return value
+
+
+@bp.route('/admin/<listing>/export.csv')
+def export_listing(listing):
+    """一覧の全件をCSVでダウンロード（少しずつ読みながら出力するので件数に関係なくメモリ使用量は一定）"""
+    user_id = request.cookies.get('user_id')
+    
+    if user_id == '1':
+        if listing not in EXPORT_LISTINGS:
+            return "エクスポートできない一覧です", 404
+        select_sql, search_sql, order_column = EXPORT_LISTINGS[listing]
+        
+        search = request.args.get('search', '')
+        sql, params = select_sql, ()
+        if search:
+            sql += f" WHERE {search_sql}"
+            params = (f"%{search}%", f"%{search}%")
+        sql += f" ORDER BY {order_column}"
+        
+        def generate():
+            conn = get_db()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(sql, params)
+                
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow([column[0] for column in cursor.description])
+                for count, row in enumerate(iter_rows(cursor, EXPORT_BATCH_SIZE), 1):
+                    writer.writerow([_csv_cell(value) for value in row])
+                    if count % EXPORT_BATCH_SIZE == 0:
+                        yield buffer.getvalue()
+                        buffer.seek(0)
+                        buffer.truncate()
+                yield buffer.getvalue()
+            finally:
+                conn.close()
+        
+        filename = f"{listing}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        return Response(stream_with_context(generate()), mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
+    
+    return "管理者権限が必要です"
+
 @bp.route('/admin/system')
 def system_info():
     """システム情報"""
@@ -607,8 +679,8 @@ def backup_database():
                 timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
                 backup_path = f'database/backup_{safe_name}_{timestamp}.db'
                 
-                # データベースファイルをコピー
-                shutil.copy2('database/shop.db', backup_path)
+                # 書き込み中でも一貫した内容になるようバックアップAPIでコピー
+                backup_to(backup_path)
                 
                 flash(f'データベースバックアップが完了しました: {backup_path}', 'success')
                 return redirect('/admin/database')
@@ -621,6 +693,14 @@ def backup_database():
     
     return "管理者権限が必要です"
 
+def invalidate_caches():
+    """DBを丸ごと入れ替えたあとに、内容を覚えているキャッシュをすべて破棄"""
+    result_cache.invalidate()
+    count_cache.invalidate()
+    review_feed.invalidate()
+    facet_service.cache.invalidate()
+    suggest_index.refresh()
+
 @bp.route('/admin/database/restore/<filename>')
 def restore_database(filename):
     """データベース復元"""
@@ -637,10 +717,11 @@ def restore_database(filename):
             
             # 現在のデータベースをバックアップ
             current_backup = f'database/current_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.db'
-            shutil.copy2('database/shop.db', current_backup)
+            backup_to(current_backup)
             
-            # バックアップから復元
-            shutil.copy2(backup_path, 'database/shop.db')
+            # バックアップから復元（ファイルは上書きせず稼働中のDBへページをコピー）
+            restore_from(backup_path)
+            invalidate_caches()
             
             flash(f'データベース復元が完了しました: {filename}', 'success')
             return redirect('/admin/database')
@@ -662,7 +743,7 @@ def reset_database():
             from datetime import datetime
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             backup_path = f'database/backup_before_reset_{timestamp}.db'
-            shutil.copy2('database/shop.db', backup_path)
+            backup_to(backup_path)
             
             # データベース初期化スクリプトを実行
             import subprocess
@@ -670,6 +751,7 @@ def reset_database():
                                   capture_output=True, text=True)
             
             if result.returncode == 0:
+                invalidate_caches()
                 flash(f'データベース初期化が完了しました。バックアップ: {backup_path}', 'success')
             else:
                 flash(f'初期化エラー: {result.stderr}', 'danger')
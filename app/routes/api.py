@@ -1,5 +1,9 @@
 from flask import Blueprint, request, jsonify
-import sqlite3
+from app.conditional import catalog_validators
+from app.sqlite_db import get_db
+from app.ratings import rating_stats
+from app.review_feed import review_feed
+from app.suggest import suggest_index
 import subprocess
 import os
 
@@ -8,7 +12,13 @@ bp = Blueprint('api', __name__)
 @bp.route('/api/products')
 def api_products():
     """商品API"""
-    conn = sqlite3.connect('database/shop.db')
+    # カタログが変わっていなければ問い合わせずに 304
+    validators = catalog_validators.catalog('api-product-list')
+    not_modified = validators.not_modified()
+    if not_modified:
+        return not_modified
+    
+    conn = get_db()
     cursor = conn.cursor()
     
     category = request.args.get('category', '')
@@ -22,7 +32,8 @@ def api_products():
     products = cursor.fetchall()
     conn.close()
     
-    # 商品データを辞書形式に変換
+    # 商品データを辞書形式に変換（評価集計を付加）
+    ratings = rating_stats.for_products([product[0] for product in products])
     product_list = []
     for product in products:
         product_list.append({
@@ -31,10 +42,37 @@ def api_products():
             'description': product[2],
             'price': product[3],
             'stock': product[4],
-            'category': product[5]
+            'category': product[5],
+            'rating': ratings.get(product[0], rating_stats.empty())
         })
     
-    return jsonify(product_list)
+    return validators.apply(jsonify(product_list))
+
+@bp.route('/api/suggest')
+def api_suggest():
+    """入力補完API（商品名・カテゴリの前方一致）"""
+    query = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', 8, type=int), 1), 20)
+    
+    return jsonify({
+        'query': query,
+        'suggestions': suggest_index.suggest(query, limit=limit)
+    })
+
+@bp.route('/api/reviews')
+def api_reviews():
+    """レビューの続きを読み込むAPI（新しい順、カーソル方式）"""
+    product_id = request.args.get('product_id', type=int)
+    reviews, next_cursor = review_feed.page(
+        product_id,
+        cursor=request.args.get('cursor'),
+        limit=request.args.get('limit', type=int)
+    )
+    
+    return jsonify({
+        'reviews': reviews,
+        'next_cursor': next_cursor
+    })
 
 @bp.route('/api/ping', methods=['POST'])
 def api_ping():
@@ -1,5 +1,5 @@
 from flask import Blueprint, render_template, request, session, redirect, flash
-import sqlite3
+from app.sqlite_db import get_db
 
 bp = Blueprint('cart', __name__)
 
@@ -11,7 +11,7 @@ def view_cart():
         return redirect('/login')
     
     user_id = session['user_id']
-    conn = sqlite3.connect('database/shop.db')
+    conn = get_db()
     cursor = conn.cursor()
     
     cursor.execute("""
@@ -40,7 +40,7 @@ def add_to_cart():
     user_id = session['user_id']
     
     # CSRFトークン検証なし - 脆弱性
-    conn = sqlite3.connect('database/shop.db')
+    conn = get_db()
     cursor = conn.cursor()
     
     # 既存のカートアイテム確認
@@ -72,7 +72,7 @@ def remove_from_cart(item_id):
     
     # CSRFトークン検証なし
     user_id = session['user_id']
-    conn = sqlite3.connect('database/shop.db')
+    conn = get_db()
     cursor = conn.cursor()
     
     cursor.execute("DELETE FROM cart WHERE id = ? AND user_id = ?", (item_id, user_id))
@@ -90,7 +90,7 @@ def update_cart():
         return redirect('/login')
     
     user_id = session['user_id']
-    conn = sqlite3.connect('database/shop.db')
+    conn = get_db()
     cursor = conn.cursor()
     
     # 隠しフィールド操作脆弱性
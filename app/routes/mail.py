@@ -1,5 +1,5 @@
 from flask import Blueprint, request, render_template, session, redirect, flash, send_file
-import sqlite3
+from app.sqlite_db import get_db
 import os
 import uuid
 from werkzeug.utils import secure_filename
@@ -27,7 +27,7 @@ def compose_mail():
         
         conn = None
         try:
-            conn = sqlite3.connect('database/shop.db')
+            conn = get_db()
             cursor = conn.cursor()
             
             # 受信者を探す
@@ -93,7 +93,7 @@ def inbox():
     user_id = session['user_id']
     conn = None
     try:
-        conn = sqlite3.connect('database/shop.db')
+        conn = get_db()
         cursor = conn.cursor()
         
         # 受信メールを取得 (添付ファイル数含む)
@@ -124,7 +124,7 @@ def sent_mail():
     user_id = session['user_id']
     conn = None
     try:
-        conn = sqlite3.connect('database/shop.db')
+        conn = get_db()
         cursor = conn.cursor()
         
         # 送信メールを取得 (添付ファイル数含む)
@@ -155,7 +155,7 @@ def read_mail(email_id):
     user_id = session['user_id']
     conn = None
     try:
-        conn = sqlite3.connect('database/shop.db')
+        conn = get_db()
         cursor = conn.cursor()
         
         # メールを取得
@@ -201,7 +201,7 @@ def download_attachment(attachment_id):
     user_id = session['user_id']
     conn = None
     try:
-        conn = sqlite3.connect('database/shop.db')
+        conn = get_db()
         cursor = conn.cursor()
         
         # 添付ファイル情報を取得
@@ -1,40 +1,65 @@
 from flask import Blueprint, render_template, request, session, redirect, flash, jsonify
 from app.database import db_config
-import sqlite3
+from app.pagination import cached_count, count_cache, fetch_page, page_count
+from app.search import normalize_text, product_search
+from app.sqlite_db import get_db, transaction
 
 bp = Blueprint('main', __name__)
 
+def search_reviews(review_query, limit=10):
+    """レビュー検索（クエリが空なら最新レビュー）
+
+    アプリ本体の / からも使うため、ビュー関数とは分けている。
+    """
+    if review_query and product_search.ensure_index():
+        # レビュー検索 (SQLインジェクション対策済み、XSS脆弱性は残存)
+        # コメント・商品名はn-gramインデックスで照合
+        def build(backend):
+            # 条件は実際に取得した接続の方言で組み立てる
+            where_sql, params = product_search.review_filter(review_query, backend)
+            return f"""
+            SELECT r.*, u.username, p.name as product_name, p.image_url 
+            FROM reviews r 
+            JOIN users u ON r.user_id = u.id 
+            JOIN products p ON r.product_id = p.id 
+            WHERE {where_sql or '1=0'}
+            ORDER BY r.created_at DESC LIMIT ?
+        """, tuple(params) + (limit,)
+        recent_reviews = db_config.execute_query(build)
+    elif review_query:
+        # インデックスが使えない場合はLIKE検索
+        recent_reviews = db_config.execute_query("""
+            SELECT r.*, u.username, p.name as product_name, p.image_url 
+            FROM reviews r 
+            JOIN users u ON r.user_id = u.id 
+            JOIN products p ON r.product_id = p.id 
+            WHERE r.comment LIKE ? OR u.username LIKE ? OR p.name LIKE ?
+            ORDER BY r.created_at DESC LIMIT ?
+        """, (f'%{review_query}%', f'%{review_query}%', f'%{review_query}%', limit))
+    else:
+        # 最新レビューを取得
+        recent_reviews = db_config.execute_query("""
+            SELECT r.*, u.username, p.name as product_name, p.image_url 
+            FROM reviews r 
+            JOIN users u ON r.user_id = u.id 
+            JOIN products p ON r.product_id = p.id 
+            ORDER BY r.created_at DESC LIMIT ?
+        """, (limit,))
+    return recent_reviews
+
 @bp.route('/')
 def index():
     """メインページ"""
     try:
         # 人気商品を取得
         featured_products = db_config.execute_query(
-            "SELECT * FROM products ORDER BY id DESC LIMIT 4"
+            "SELECT * FROM products ORDER BY id DESC LIMIT 4",
+            cache_tables=('products',)
         )
         
         # レビュー検索機能
         review_query = request.args.get('review_search', '')
-        
-        if review_query:
-            # レビュー検索 (SQLインジェクション対策済み、XSS脆弱性は残存)
-            recent_reviews = db_config.execute_query("""
-                SELECT r.*, u.username, p.name as product_name, p.image_url 
-                FROM reviews r 
-                JOIN users u ON r.user_id = u.id 
-                JOIN products p ON r.product_id = p.id 
-                WHERE r.comment LIKE ? OR u.username LIKE ? OR p.name LIKE ?
-                ORDER BY r.created_at DESC LIMIT 10
-            """, (f'%{review_query}%', f'%{review_query}%', f'%{review_query}%'))
-        else:
-            # 最新レビューを取得
-            recent_reviews = db_config.execute_query("""
-                SELECT r.*, u.username, p.name as product_name, p.image_url 
-                FROM reviews r 
-                JOIN users u ON r.user_id = u.id 
-                JOIN products p ON r.product_id = p.id 
-                ORDER BY r.created_at DESC LIMIT 10
-            """)
+        recent_reviews = search_reviews(review_query)
         
         # HTMLテンプレートが見つからない場合のフォールバック
         try:
@@ -71,34 +96,50 @@ def products():
     """商品一覧ページ"""
     try:
         category = request.args.get('category', '')
-        page = request.args.get('page', 1, type=int)
+        sort = request.args.get('sort', 'id')
+        page = max(request.args.get('page', 1, type=int), 1)
         per_page = 9
-        offset = (page - 1) * per_page
         
-        if category:
-            # カテゴリフィルター
-            all_products = db_config.execute_query(
-                "SELECT * FROM products WHERE category = ?",
-                (category,)
-            )
+        # 深いページ用のキーセット（前ページ最後の商品）
+        after_id = request.args.get('after_id', type=int)
+        after_price = request.args.get('after_price', type=float)
+        
+        where_sql = "category = ?" if category else ""
+        params = (category,) if category else ()
+        
+        if sort == 'price':
+            order_columns = ('price', 'id')
+            after = (after_price, after_id) if after_id is not None and after_price is not None else None
         else:
-            all_products = db_config.execute_query("SELECT * FROM products")
+            order_columns = ('id',)
+            after = (after_id,) if after_id is not None else None
         
-        # ページング処理
-        total_products = len(all_products)
-        total_pages = (total_products + per_page - 1) // per_page if total_products > 0 else 1
+        # ページング処理（総件数はキャッシュ）
+        total_products = cached_count(db_config.execute_query, "FROM products", where_sql, params)
+        total_pages = page_count(total_products, per_page)
         
         # 現在のページの商品を取得
-        products = all_products[offset:offset + per_page]
+        products = fetch_page(db_config.execute_query, "SELECT *", "FROM products", where_sql, params,
+                              order_columns=order_columns, page=page, per_page=per_page, after=after)
+        
+        # 次ページ用のキーセット
+        next_cursor = None
+        if len(products) == per_page:
+            last = products[-1]
+            next_cursor = {'after_id': last['id']}
+            if sort == 'price':
+                next_cursor['after_price'] = last['price']
         
         # HTMLテンプレートが見つからない場合のフォールバック
         try:
             return render_template('main/products.html', 
                                  products=products, 
                                  category=category,
+                                 sort=sort,
                                  current_page=page,
                                  total_pages=total_pages,
-                                 total_products=total_products)
+                                 total_products=total_products,
+                                 next_cursor=next_cursor)
         except Exception as template_error:
             print(f"❌ テンプレートエラー: {template_error}")
             # JSONレスポンスでフォールバック
@@ -108,7 +149,8 @@ def products():
                 'current_page': page,
                 'total_pages': total_pages,
                 'category': category or 'All',
-                'products': products
+                'products': products,
+                'next_cursor': next_cursor
             })
                              
     except Exception as e:
@@ -124,23 +166,25 @@ def search():
     """商品検索ページ"""
     try:
         query = request.args.get('q', '')
-        page = request.args.get('page', 1, type=int)
+        page = max(request.args.get('page', 1, type=int), 1)
         per_page = 9
-        offset = (page - 1) * per_page
         
         if query:
-            # 商品検索
-            all_results = db_config.execute_query(
-                "SELECT * FROM products WHERE name LIKE ? OR description LIKE ?",
-                (f'%{query}%', f'%{query}%')
-            )
+            if product_search.ensure_index():
+                # n-gramインデックスで関連度順に検索（件数もインデックスから）
+                # キーは (namespace, from_sql, ...) の形にして商品の更新で破棄されるようにする
+                total_results = count_cache.get_or_set(('search', 'FROM products', normalize_text(query)),
+                                                       lambda: product_search.count(query))
+                results = product_search.search(query, limit=per_page, offset=(page - 1) * per_page)
+            else:
+                # インデックスが使えない場合はLIKE検索
+                where_sql = "name LIKE ? OR description LIKE ?"
+                params = (f'%{query}%', f'%{query}%')
+                total_results = cached_count(db_config.execute_query, "FROM products", where_sql, params)
+                results = fetch_page(db_config.execute_query, "SELECT *", "FROM products", where_sql, params,
+                                     page=page, per_page=per_page)
             
-            # ページング処理
-            total_results = len(all_results)
-            total_pages = (total_results + per_page - 1) // per_page if total_results > 0 else 1
-            
-            # 現在のページの結果を取得
-            results = all_results[offset:offset + per_page]
+            total_pages = page_count(total_results, per_page)
             
             return render_template('main/search.html', 
                                  results=results, 
@@ -172,59 +216,51 @@ def contact():
         email_input = request.form.get('email', '').strip()
         content = request.form.get('content')
         user_id = session['user_id']
-        conn = sqlite3.connect('database/shop.db')
-        cursor = conn.cursor()
-        
-        # admin 계정 찾기
-        cursor.execute("SELECT id FROM users WHERE username = 'admin'")
-        admin = cursor.fetchone()
         
-        if admin:
-            admin_id = admin[0]
+        # 送信するメールをまとめて1トランザクション・1コミットで挿入
+        with transaction() as tx:
+            # admin 계정 찾기
+            admin = tx.query("SELECT id FROM users WHERE username = 'admin'")
             
-            # 이메일 주소들을 쉼표로 분리
-            email_addresses = [email.strip() for email in email_input.split(',') if email.strip()]
-            
-            if email_addresses:
-                main_email = email_addresses[0]  # 첫 번째 이메일이 메인
-                bcc_emails = email_addresses[1:]  # 나머지는 BCC
-                
-                # 이메일 정보를 포함한 내용 생성
-                full_content = f"お問い合わせ者メールアドレス: {main_email}\n\nお問い合わせ内容:\n{content}"
+            if admin:
+                admin_id = admin[0][0]
+                emails = []
                 
-                # admin에게 메일 전송
-                cursor.execute(
-                    "INSERT INTO emails (sender_id, recipient_id, subject, content) VALUES (?, ?, ?, ?)",
-                    (user_id, admin_id, title, full_content)
-                )
+                # 이메일 주소들을 쉼표로 분리
+                email_addresses = [email.strip() for email in email_input.split(',') if email.strip()]
                 
-                # BCC 이메일 주소들 처리
-                for bcc_email in bcc_emails:
-                    # BCC 이메일 주소 정리 (bcc: 접두사 제거)
-                    clean_bcc_email = bcc_email.replace('bcc:', '').strip()
+                if email_addresses:
+                    main_email = email_addresses[0]  # 첫 번째 이메일이 메인
+                    bcc_emails = email_addresses[1:]  # 나머지는 BCC
                     
-                    # BCC 수신자를 위한 별도 메일 생성
-                    bcc_content = f"お問い合わせ者メールアドレス: {main_email}\n\nお問い合わせ内容:\n{content}\n\n※ このメールはBCCで送信されました。"
+                    # 이메일 정보를 포함한 내용 생성
+                    full_content = f"お問い合わせ者メールアドレス: {main_email}\n\nお問い合わせ内容:\n{content}"
                     
-                    # BCC 이메일 주소에 해당하는 사용자 찾기
-                    cursor.execute("SELECT id FROM users WHERE email = ?", (clean_bcc_email,))
-                    bcc_user = cursor.fetchone()
+                    # admin에게 메일 전송
+                    emails.append((user_id, admin_id, title, full_content))
                     
-                    if bcc_user:
-                        # 기존 사용자가 있으면 해당 사용자에게 메일 전송
-                        cursor.execute(
-                            "INSERT INTO emails (sender_id, recipient_id, subject, content) VALUES (?, ?, ?, ?)",
-                            (user_id, bcc_user[0], title, bcc_content)
-                        )
-                    else:
-                        # 기존 사용자가 없으면 admin에게 BCC 메일 전송 (임시 처리)
-                        cursor.execute(
-                            "INSERT INTO emails (sender_id, recipient_id, subject, content) VALUES (?, ?, ?, ?)",
-                            (user_id, admin_id, title, f"[BCC to {clean_bcc_email}] {bcc_content}")
-                        )
-            
-            conn.commit()
-            flash('お問い合わせが正常に送信されました。', 'success')
-        conn.close()
+                    # BCC 이메일 주소들 처리
+                    for bcc_email in bcc_emails:
+                        # BCC 이메일 주소 정리 (bcc: 접두사 제거)
+                        clean_bcc_email = bcc_email.replace('bcc:', '').strip()
+                        
+                        # BCC 수신자를 위한 별도 메일 생성
+                        bcc_content = f"お問い合わせ者メールアドレス: {main_email}\n\nお問い合わせ内容:\n{content}\n\n※ このメールはBCCで送信されました。"
+                        
+                        # BCC 이메일 주소에 해당하는 사용자 찾기
+                        bcc_user = tx.query("SELECT id FROM users WHERE email = ?", (clean_bcc_email,))
+                        
+                        if bcc_user:
+                            # 기존 사용자가 있으면 해당 사용자에게 메일 전송
+                            emails.append((user_id, bcc_user[0][0], title, bcc_content))
+                        else:
+                            # 기존 사용자가 없으면 admin에게 BCC 메일 전송 (임시 처리)
+                            emails.append((user_id, admin_id, title, f"[BCC to {clean_bcc_email}] {bcc_content}"))
+                
+                tx.execute_many(
+                    "INSERT INTO emails (sender_id, recipient_id, subject, content) VALUES (?, ?, ?, ?)",
+                    emails
+                )
+                flash('お問い合わせが正常に送信されました。', 'success')
         return redirect('/')
     return render_template('main/contact.html') 
\ No newline at end of file
@@ -1,8 +1,22 @@
 from flask import Blueprint, render_template, request, session, redirect, flash
-import sqlite3
+from app.sqlite_db import get_db, transaction
 
 bp = Blueprint('order', __name__)
 
+ORDER_INSERT_SQL = """
+    INSERT INTO orders (user_id, shipping_address, payment_method, total_amount, status, created_at) 
+    SELECT ?, ?, ?, COALESCE(?, SUM(p.price * c.quantity), 0), 'pending', CURRENT_TIMESTAMP
+    FROM cart c JOIN products p ON c.product_id = p.id
+    WHERE c.user_id = ?
+"""
+
+ORDER_ITEMS_INSERT_SQL = """
+    INSERT INTO order_items (order_id, product_id, quantity, price) 
+    SELECT ?, c.product_id, c.quantity, p.price
+    FROM cart c JOIN products p ON c.product_id = p.id
+    WHERE c.user_id = ?
+"""
+
 @bp.route('/checkout', methods=['GET', 'POST'])
 def checkout():
     """チェックアウトページ"""
@@ -22,42 +36,25 @@ def checkout():
             flash('配送先住所と支払い方法を入力してください', 'error')
             return redirect('/checkout')
         
-        conn = sqlite3.connect('database/shop.db')
-        cursor = conn.cursor()
-        
-        # 注文作成
-        cursor.execute("""
-            INSERT INTO orders (user_id, shipping_address, payment_method, total_amount, status, created_at) 
-            VALUES (?, ?, ?, ?, 'pending', CURRENT_TIMESTAMP)
-        """, (user_id, shipping_address, payment_method, total_amount))
-        
-        order_id = cursor.lastrowid
-        
-        # カートアイテムを注文アイテムに移動
-        cursor.execute("SELECT product_id, quantity FROM cart WHERE user_id = ?", (user_id,))
-        cart_items = cursor.fetchall()
-        
-        for item in cart_items:
-            # 商品価格取得
-            cursor.execute("SELECT price FROM products WHERE id = ?", (item[0],))
-            price = cursor.fetchone()[0]
+        # カートから注文・注文アイテムを集合演算で作り、カートを空にするまでを
+        # 1トランザクション・1コミットで行う（カートの件数に関係なく文は3つ）
+        with transaction() as tx:
+            # 注文作成（合計は隠しフィールドの値、無ければカートからDB側で計算）
+            order_id = tx.execute(ORDER_INSERT_SQL, (user_id, shipping_address, payment_method,
+                                                     total_amount or None, user_id))
             
-            cursor.execute("""
-                INSERT INTO order_items (order_id, product_id, quantity, price) 
-                VALUES (?, ?, ?, ?)
-            """, (order_id, item[0], item[1], price))
-        
-        # カートを空にする
-        cursor.execute("DELETE FROM cart WHERE user_id = ?", (user_id,))
-        conn.commit()
-        conn.close()
+            # カートアイテムを現在の価格で注文アイテムに移動
+            tx.execute(ORDER_ITEMS_INSERT_SQL, (order_id, user_id))
+            
+            # カートを空にする
+            tx.execute("DELETE FROM cart WHERE user_id = ?", (user_id,))
         
         flash('注文が完了しました', 'success')
         return redirect(f'/order/{order_id}')
     
     # カート情報表示
     user_id = session['user_id']
-    conn = sqlite3.connect('database/shop.db')
+    conn = get_db()
     cursor = conn.cursor()
     
     cursor.execute("""
@@ -85,7 +82,7 @@ def order_detail(order_id):
         return redirect('/login')
     
     user_id = session['user_id']
-    conn = sqlite3.connect('database/shop.db')
+    conn = get_db()
     cursor = conn.cursor()
     
     # SQLインジェクション脆弱性 - 注文照会
@@ -112,7 +109,7 @@ def my_orders():
         return redirect('/login')
     
     user_id = session['user_id']
-    conn = sqlite3.connect('database/shop.db')
+    conn = get_db()
     cursor = conn.cursor()
     
     # SQLインジェクション脆弱性
@@ -129,7 +126,7 @@ def cancel_order(order_id):
         flash('ログインが必要です', 'error')
         return redirect('/login')
     user_id = session['user_id']
-    conn = sqlite3.connect('database/shop.db')
+    conn = get_db()
     cursor = conn.cursor()
     # 본인 주문만 취소 가능
     cursor.execute("SELECT status FROM orders WHERE id = ? AND user_id = ?", (order_id, user_id))
@@ -1,5 +1,9 @@
 from flask import Blueprint, render_template, request, session, redirect, flash, jsonify
+from app.conditional import catalog_validators
 from app.database import db_config
+from app.facets import facet_service
+from app.ratings import rating_stats
+from app.review_feed import review_feed
 
 bp = Blueprint('product', __name__)
 
@@ -7,10 +11,17 @@ bp = Blueprint('product', __name__)
 def product_detail(product_id):
     """商品詳細ページ"""
     try:
+        # 商品とレビューが変わっていなければ問い合わせずに 304
+        validators = catalog_validators.product('product', product_id)
+        not_modified = validators.not_modified()
+        if not_modified:
+            return not_modified
+        
         # 商品情報取得
         products = db_config.execute_query(
             "SELECT * FROM products WHERE id = ?",
-            (product_id,)
+            (product_id,),
+            cache_tables=('products',)
         )
         
         if not products:
@@ -20,14 +31,16 @@ def product_detail(product_id):
         product = products[0]
         
         # レビュー取得 (XSS脆弱性は学習用に残す)
-        reviews = db_config.execute_query(
-            "SELECT r.*, u.username FROM reviews r JOIN users u ON r.user_id = u.id WHERE r.product_id = ? ORDER BY r.created_at DESC",
-            (product_id,)
-        )
+        # 新しい順に1ページ分だけ取得（先頭ページはキャッシュ）
+        reviews, next_cursor = review_feed.page(product_id, cursor=request.args.get('reviews_cursor'))
+        
+        # 評価集計（reviewsを走査せず集計テーブルから取得）
+        rating = rating_stats.get(product_id)
         
         # HTMLテンプレートが見つからない場合のフォールバック
         try:
-            return render_template('product/detail.html', product=product, reviews=reviews)
+            return validators.apply(render_template('product/detail.html', product=product, reviews=reviews,
+                                                    rating=rating, next_cursor=next_cursor))
         except Exception as template_error:
             print(f"❌ テンプレートエラー: {template_error}")
             # JSONレスポンスでフォールバック
@@ -35,6 +48,8 @@ def product_detail(product_id):
                 'page': 'Product Detail',
                 'product': product,
                 'reviews': reviews,
+                'next_cursor': next_cursor,
+                'rating': rating,
                 'mode': 'JSON API (テンプレートフォールバック)'
             })
         
@@ -68,6 +83,7 @@ def add_review(product_id):
         )
         
         if result:
+            review_feed.invalidate(product_id)
             flash('レビューを投稿しました', 'success')
         else:
             flash('レビュー投稿に失敗しました', 'error')
@@ -83,21 +99,20 @@ def add_review(product_id):
 def categories():
     """カテゴリ一覧"""
     try:
-        categories = db_config.execute_query("SELECT DISTINCT category FROM products")
+        validators = catalog_validators.catalog('categories')
+        not_modified = validators.not_modified()
+        if not_modified:
+            return not_modified
         
-        # カテゴリごとの商品数も取得
-        category_counts = {}
-        for cat in categories:
-            category_name = cat['category']
-            count = db_config.execute_query(
-                "SELECT COUNT(*) as count FROM products WHERE category = ?",
-                (category_name,)
-            )
-            category_counts[category_name] = count[0]['count'] if count else 0
+        # カテゴリ・価格帯ごとの商品数を1回の集計クエリで取得（カタログ版数でキャッシュ）
+        facets = facet_service.facets()
+        categories = [{'category': facet['value']} for facet in facets['categories']]
+        category_counts = {facet['value']: facet['count'] for facet in facets['categories']}
             
-        return render_template('product/categories.html', 
-                             categories=categories,
-                             category_counts=category_counts)
+        return validators.apply(render_template('product/categories.html',
+                                                categories=categories,
+                                                category_counts=category_counts,
+                                                price_buckets=facets['price_buckets']))
                              
     except Exception as e:
         print(f"❌ カテゴリ一覧エラー: {e}")
@@ -1,31 +1,22 @@
 from flask import Blueprint, render_template, request, session, redirect, flash
-import sqlite3
+from app.review_feed import review_feed
+from app.sqlite_db import get_db
 
 bp = Blueprint('review', __name__)
 
 @bp.route('/reviews')
 def all_reviews():
     """全レビュー一覧"""
-    conn = sqlite3.connect('database/shop.db')
-    cursor = conn.cursor()
+    # 新しい順に1ページ分だけ取得（先頭ページはキャッシュ）
+    reviews, next_cursor = review_feed.page(cursor=request.args.get('cursor'))
     
     # XSS脆弱性のあるレビュー表示
-    cursor.execute("""
-        SELECT r.*, u.username, p.name as product_name, p.image_url 
-        FROM reviews r 
-        JOIN users u ON r.user_id = u.id 
-        JOIN products p ON r.product_id = p.id 
-        ORDER BY r.created_at DESC
-    """)
-    reviews = cursor.fetchall()
-    conn.close()
-    
-    return render_template('review/list.html', reviews=reviews)
+    return render_template('review/list.html', reviews=reviews, next_cursor=next_cursor)
 
 @bp.route('/review/<int:review_id>')
 def review_detail(review_id):
     """レビュー詳細"""
-    conn = sqlite3.connect('database/shop.db')
+    conn = get_db()
     cursor = conn.cursor()
     
     # SQLインジェクション脆弱性
@@ -1,5 +1,5 @@
 from flask import Blueprint, render_template, request, session, redirect, flash, url_for
-import sqlite3
+from app.sqlite_db import get_db
 import os
 from werkzeug.utils import secure_filename
 
@@ -22,7 +22,7 @@ def user_profile():
         return redirect('/login')
     
     user_id = session['user_id']
-    conn = sqlite3.connect('database/shop.db')
+    conn = get_db()
     cursor = conn.cursor()
     
     # SQLインジェクション脆弱性
@@ -65,7 +65,7 @@ def edit_profile():
                 
                 flash(f'ファイル {filename} をアップロードしました', 'success')
         
-        conn = sqlite3.connect('database/shop.db')
+        conn = get_db()
         cursor = conn.cursor()
         
         # プロフィール画像がある場合のみ更新
@@ -83,7 +83,7 @@ def edit_profile():
         return redirect('/user/profile')
     
     user_id = session['user_id']
-    conn = sqlite3.connect('database/shop.db')
+    conn = get_db()
     cursor = conn.cursor()
     cursor.execute(f"SELECT * FROM users WHERE id = {user_id}")
     user = cursor.fetchone()
@@ -134,7 +134,7 @@ def change_password():
             flash('パスワードは6文字以上で入力してください', 'error')
             return render_template('user/change_password.html')
         
-        conn = sqlite3.connect('database/shop.db')
+        conn = get_db()
         cursor = conn.cursor()
         
         # 現在のパスワード確認
@@ -0,0 +1,124 @@
+import threading
+
+from flask.json.provider import DefaultJSONProvider
+
+
+class Columns:
+    """1つの結果セットの全行で共有する列情報（列名 -> 位置）"""
+
+    __slots__ = ('names', 'index')
+
+    def __init__(self, names):
+        self.names = tuple(names)
+        # 同名の列は dict(row) と同じく後の列を優先
+        self.index = {name: position for position, name in enumerate(self.names)}
+
+
+_columns_cache = {}
+_columns_lock = threading.Lock()
+
+
+def columns_for(names):
+    """同じ列構成の結果では同じ Columns を使い回す"""
+    names = tuple(names)
+    columns = _columns_cache.get(names)
+    if columns is None:
+        with _columns_lock:
+            if len(_columns_cache) >= 1024:
+                _columns_cache.clear()
+            columns = _columns_cache.setdefault(names, Columns(names))
+    return columns
+
+
+class Row:
+    """ドライバが返したタプルをそのまま保持する軽量な行
+
+    row[3] のような位置指定と row['price'] のような列名指定の両方に対応する。
+    行ごとに辞書を作らないので、大きな一覧でもメモリと割り当てが少ない。
+    反復・アンパックは値の順（タプルと同じ）、in は列名で判定する（辞書と同じ）。
+    """
+
+    __slots__ = ('_values', '_columns')
+
+    def __init__(self, values, columns):
+        self._values = values
+        self._columns = columns
+
+    def __getitem__(self, key):
+        if key.__class__ is str:
+            return self._values[self._columns.index[key]]
+        return self._values[key]
+
+    def __len__(self):
+        return len(self._values)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __contains__(self, key):
+        return key in self._columns.index
+
+    def __eq__(self, other):
+        if isinstance(other, Row):
+            return self._values == other._values and self._columns.names == other._columns.names
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        if isinstance(other, tuple):
+            return self._values == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Row({self.to_dict()!r})"
+
+    def get(self, key, default=None):
+        position = self._columns.index.get(key)
+        return default if position is None else self._values[position]
+
+    def keys(self):
+        return self._columns.index.keys()
+
+    def values(self):
+        return [self._values[position] for position in self._columns.index.values()]
+
+    def items(self):
+        return [(name, self._values[position]) for name, position in self._columns.index.items()]
+
+    def to_dict(self):
+        return {name: self._values[position] for name, position in self._columns.index.items()}
+
+
+def rows_from_cursor(cursor):
+    """実行済みカーソルの結果を Row のリストで返す（カーソルはタプルを返すこと）"""
+    if cursor.description is None:
+        return []
+    columns = columns_for(column[0] for column in cursor.description)
+    return [Row(values, columns) for values in cursor.fetchall()]
+
+
+def iter_rows(cursor, batch_size):
+    """実行済みカーソルから batch_size 行ずつ取得して Row を1行ずつ返す
+
+    名前付きカーソル（PostgreSQL）は最初の取得まで description が無いため、
+    列情報は最初のバッチを受け取ってから作る。
+    """
+    columns = None
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            return
+        if columns is None:
+            columns = columns_for(column[0] for column in cursor.description)
+        for values in batch:
+            yield Row(values, columns)
+
+
+class RowJSONProvider(DefaultJSONProvider):
+    """jsonify で Row を辞書（JSONオブジェクト）として出力する"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Row):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
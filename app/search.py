@@ -0,0 +1,529 @@
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from functools import partial
+
+from dotenv import load_dotenv
+
+from app.database import db_config
+from app.statements import statement_cache
+
+# 環境変数を読み込み
+load_dotenv()
+
+# n-gramの長さ（2=バイグラム、3=トライグラム）。変更後はインデックスの再構築が必要
+SEARCH_NGRAM_SIZE = int(os.getenv('SEARCH_NGRAM_SIZE', 2))
+# 1回の同期で反映する変更キューの件数
+SEARCH_SYNC_BATCH = int(os.getenv('SEARCH_SYNC_BATCH', 500))
+# 再構築時に1度に読み込む行数
+SEARCH_REBUILD_CHUNK = 5000
+
+# インデックス対象: 元テーブル -> (インデックステーブル, キー列, 列)
+SEARCH_ENTITIES = {
+    'products': ('product_ngrams', 'product_id', ('name', 'description', 'category')),
+    'reviews': ('review_ngrams', 'review_id', ('comment',)),
+}
+
+# BM25の列の重み（name, description, category）
+BM25_WEIGHTS = (10.0, 5.0, 2.0)
+
+# SQLite: n-gramを格納するFTS5テーブルと変更キュー
+# 正規化はPython側で行うため、トリガーは変更された行IDをキューに積むだけ
+SQLITE_SEARCH_DDL = [
+    # 旧形式（unicode61で原文を直接索引）のFTSテーブルを削除
+    "DROP TRIGGER IF EXISTS products_fts_ai",
+    "DROP TRIGGER IF EXISTS products_fts_ad",
+    "DROP TRIGGER IF EXISTS products_fts_au",
+    "DROP TABLE IF EXISTS products_fts",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_ngrams USING fts5(name, description, category)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS review_ngrams USING fts5(comment)",
+    """
+    CREATE TABLE IF NOT EXISTS search_index_queue (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        entity TEXT NOT NULL,
+        row_id INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_search_ai AFTER INSERT ON products BEGIN
+        INSERT INTO search_index_queue(entity, row_id) VALUES ('products', new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_search_au AFTER UPDATE OF name, description, category ON products BEGIN
+        INSERT INTO search_index_queue(entity, row_id) VALUES ('products', new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_search_ad AFTER DELETE ON products BEGIN
+        INSERT INTO search_index_queue(entity, row_id) VALUES ('products', old.id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS reviews_search_ai AFTER INSERT ON reviews BEGIN
+        INSERT INTO search_index_queue(entity, row_id) VALUES ('reviews', new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS reviews_search_au AFTER UPDATE OF comment ON reviews BEGIN
+        INSERT INTO search_index_queue(entity, row_id) VALUES ('reviews', new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS reviews_search_ad AFTER DELETE ON reviews BEGIN
+        INSERT INTO search_index_queue(entity, row_id) VALUES ('reviews', old.id);
+    END
+    """,
+]
+
+# PostgreSQL: n-gramを格納するテーブル（tsvector生成列 + GIN）と変更キュー
+POSTGRES_SEARCH_DDL = [
+    # 旧形式（原文のtsvector生成列）を削除
+    "DROP INDEX IF EXISTS idx_products_search_vector",
+    "ALTER TABLE products DROP COLUMN IF EXISTS search_vector",
+    """
+    CREATE TABLE IF NOT EXISTS product_ngrams (
+        product_id INTEGER PRIMARY KEY,
+        name TEXT,
+        description TEXT,
+        category TEXT,
+        search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(description, '')), 'B') ||
+            setweight(to_tsvector('simple', coalesce(category, '')), 'C')
+        ) STORED
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_product_ngrams_search ON product_ngrams USING GIN (search_vector)",
+    """
+    CREATE TABLE IF NOT EXISTS review_ngrams (
+        review_id INTEGER PRIMARY KEY,
+        comment TEXT,
+        search_vector tsvector GENERATED ALWAYS AS (to_tsvector('simple', coalesce(comment, ''))) STORED
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_review_ngrams_search ON review_ngrams USING GIN (search_vector)",
+    """
+    CREATE TABLE IF NOT EXISTS search_index_queue (
+        seq BIGSERIAL PRIMARY KEY,
+        entity TEXT NOT NULL,
+        row_id INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE OR REPLACE FUNCTION queue_search_index() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            INSERT INTO search_index_queue(entity, row_id) VALUES (TG_TABLE_NAME, OLD.id);
+        ELSE
+            INSERT INTO search_index_queue(entity, row_id) VALUES (TG_TABLE_NAME, NEW.id);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS products_search_queue ON products",
+    """
+    CREATE TRIGGER products_search_queue
+    AFTER INSERT OR DELETE OR UPDATE OF name, description, category ON products
+    FOR EACH ROW EXECUTE FUNCTION queue_search_index()
+    """,
+    "DROP TRIGGER IF EXISTS reviews_search_queue ON reviews",
+    """
+    CREATE TRIGGER reviews_search_queue
+    AFTER INSERT OR DELETE OR UPDATE OF comment ON reviews
+    FOR EACH ROW EXECUTE FUNCTION queue_search_index()
+    """,
+]
+
+# 単語の区切り（記号・空白・アンダースコア）
+_SEGMENT_SPLIT = re.compile(r'[\W_]+')
+
+# ひらがな -> カタカナ（ゝゞ も含む）
+_HIRAGANA_TO_KATAKANA = {cp: cp + 0x60 for cp in list(range(0x3041, 0x3097)) + [0x309D, 0x309E]}
+
+
+def normalize_text(text):
+    """検索用の正規化
+
+    NFKCで全角英数・半角カナを統一し、小文字化してひらがなをカタカナに揃える。
+    """
+    text = unicodedata.normalize('NFKC', text or '')
+    return text.lower().translate(_HIRAGANA_TO_KATAKANA)
+
+
+def segments(text):
+    """正規化したテキストを記号・空白で区切った断片のリスト"""
+    return [segment for segment in _SEGMENT_SPLIT.split(normalize_text(text)) if segment]
+
+
+def index_ngrams(text, n=None):
+    """インデックス用のn-gram列（スペース区切り）
+
+    各断片の先頭から1文字ずつずらしてn文字を取り出す。断片の末尾では
+    n文字に満たない短いgramも出力し、1文字の検索でも前方一致で拾えるようにする。
+    例（n=2）: ノートパソコン -> ノー ート トパ パソ ソコ コン ン
+    """
+    n = n or SEARCH_NGRAM_SIZE
+    grams = []
+    for segment in segments(text):
+        grams.extend(segment[i:i + n] for i in range(len(segment)))
+    return ' '.join(grams)
+
+
+def query_ngrams(query, n=None):
+    """検索語を断片ごとのn-gram列に分解
+
+    戻り値: [(grams, is_prefix), ...]
+    n文字以上の断片は連続するn-gramのフレーズ、n文字未満の断片は前方一致。
+    """
+    n = n or SEARCH_NGRAM_SIZE
+    phrases = []
+    for segment in segments(query):
+        if len(segment) >= n:
+            phrases.append(([segment[i:i + n] for i in range(len(segment) - n + 1)], False))
+        else:
+            phrases.append(([segment], True))
+    return phrases
+
+
+class ProductSearchIndex:
+    """商品・レビューのn-gram全文検索インデックス
+
+    日本語の分かち書きなしのテキストを検索できるよう、正規化したテキストを
+    n-gramに分解してSQLiteではFTS5、PostgreSQLでは tsvector + GIN に格納する。
+    元テーブルの変更はトリガーでキューに積まれ、次の検索時に反映される。
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._ready = {}
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def _connection_backend(self, conn):
+        # 実際に取得した接続で判定（PostgreSQL障害中はSQLite接続が返る）
+        return 'sqlite' if isinstance(conn, sqlite3.Connection) else 'postgres'
+
+    def _current_backend(self):
+        """いま接続を取得したときのバックエンド（接続できなければ None）"""
+        conn = self.db.get_db_connection()
+        if not conn:
+            return None
+        try:
+            return self._connection_backend(conn)
+        finally:
+            self.db.release_connection(conn)
+
+    def _index_exists(self, backend):
+        if backend == 'sqlite':
+            rows = self.db.execute_query(
+                "SELECT name FROM sqlite_master WHERE name IN ('product_ngrams', 'review_ngrams', 'search_index_queue')",
+                primary=True
+            )
+        else:
+            rows = self.db.execute_query(
+                "SELECT table_name FROM information_schema.tables "
+                "WHERE table_name IN ('product_ngrams', 'review_ngrams', 'search_index_queue')",
+                primary=True
+            )
+        return len(rows) == 3
+
+    def ensure_index(self):
+        """インデックスがなければ作成し、未反映の変更を取り込む"""
+        backend = self._current_backend()
+        if backend is None:
+            return False
+        if backend not in self._ready:
+            with self._lock:
+                if backend not in self._ready:
+                    existed = self._index_exists(backend)
+                    if not existed:
+                        for ddl in (SQLITE_SEARCH_DDL if backend == 'sqlite' else POSTGRES_SEARCH_DDL):
+                            self.db.execute_update(ddl)
+                    ready = self._index_exists(backend)
+                    if ready and not existed:
+                        # 既存のデータを取り込む
+                        self._populate()
+                    if ready:
+                        print(f"✅ 全文検索インデックス準備完了 ({backend}, {SEARCH_NGRAM_SIZE}-gram)")
+                    else:
+                        print(f"⚠️ 全文検索インデックスを作成できません ({backend}) - LIKE検索を使用")
+                    self._ready[backend] = ready
+
+        if self._ready[backend]:
+            self.sync()
+        return self._ready[backend]
+
+    def _key_column(self, entity, backend):
+        return 'rowid' if backend == 'sqlite' else SEARCH_ENTITIES[entity][1]
+
+    def _upsert_sql(self, entity, backend):
+        table, key, columns = SEARCH_ENTITIES[entity]
+        placeholders = ', '.join('?' for _ in range(len(columns) + 1))
+        if backend == 'sqlite':
+            return f"INSERT OR REPLACE INTO {table} (rowid, {', '.join(columns)}) VALUES ({placeholders})"
+        updates = ', '.join(f"{col} = EXCLUDED.{col}" for col in columns)
+        return (f"INSERT INTO {table} ({key}, {', '.join(columns)}) VALUES ({placeholders}) "
+                f"ON CONFLICT ({key}) DO UPDATE SET {updates}")
+
+    def _delete_sql(self, entity, backend):
+        return f"DELETE FROM {SEARCH_ENTITIES[entity][0]} WHERE {self._key_column(entity, backend)} = ?"
+
+    def _index_row(self, row, columns):
+        return (row['id'],) + tuple(index_ngrams(row[col]) for col in columns)
+
+    def _write(self, operations):
+        """(sql, [params, ...]) のリストを1つの接続・1トランザクションで実行
+
+        方言で変わる文は sql にバックエンド名を受け取る関数を渡す（取得した接続で決める）。
+        """
+        conn = self.db.get_db_connection()
+        if not conn:
+            return False
+
+        backend = self._connection_backend(conn)
+        is_sqlite = backend == 'sqlite'
+        broken = False
+        try:
+            cursor = conn.cursor()
+            if not is_sqlite:
+                # プール接続はautocommitのため明示的にトランザクションを張る
+                cursor.execute("BEGIN")
+            for sql, param_rows in operations:
+                if callable(sql):
+                    sql = sql(backend)
+                if param_rows is None:
+                    cursor.execute(sql)
+                elif param_rows:
+                    cursor.executemany(statement_cache.get(sql, backend, True).text, param_rows)
+            if is_sqlite:
+                conn.commit()
+            else:
+                cursor.execute("COMMIT")
+            return True
+        except Exception as e:
+            broken = self.db._is_connection_error(e)
+            try:
+                if is_sqlite:
+                    conn.rollback()
+                else:
+                    cursor.execute("ROLLBACK")
+            except Exception:
+                broken = True
+            print(f"❌ 全文検索インデックス更新エラー: {e}")
+            return False
+        finally:
+            self.db.release_connection(conn, discard=broken)
+
+    def _populate(self):
+        """元テーブルの全行をインデックスに取り込む（件数を返す）"""
+        operations = [("DELETE FROM search_index_queue", None)]
+        for table, _, _ in SEARCH_ENTITIES.values():
+            operations.append((f"DELETE FROM {table}", None))
+        if not self._write(operations):
+            return None
+
+        total = 0
+        for entity, (_, _, columns) in SEARCH_ENTITIES.items():
+            last_id = 0
+            while True:
+                rows = self.db.execute_query(
+                    f"SELECT id, {', '.join(columns)} FROM {entity} WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, SEARCH_REBUILD_CHUNK), primary=True
+                )
+                if not rows:
+                    break
+                index_rows = [self._index_row(row, columns) for row in rows]
+                if not self._write([(partial(self._upsert_sql, entity), index_rows)]):
+                    return None
+                total += len(rows)
+                last_id = rows[-1]['id']
+                if len(rows) < SEARCH_REBUILD_CHUNK:
+                    break
+        return total
+
+    def sync(self):
+        """変更キューをインデックスに反映（反映した件数を返す）"""
+        if not self._sync_lock.acquire(blocking=False):
+            # 他のスレッドが同期中
+            return 0
+        try:
+            queued = self.db.execute_query(
+                "SELECT seq, entity, row_id FROM search_index_queue ORDER BY seq LIMIT ?",
+                (SEARCH_SYNC_BATCH,), primary=True
+            )
+            if not queued:
+                return 0
+
+            operations = []
+            for entity, (_, _, columns) in SEARCH_ENTITIES.items():
+                ids = sorted({row['row_id'] for row in queued if row['entity'] == entity})
+                if not ids:
+                    continue
+                placeholders = ', '.join('?' for _ in ids)
+                rows = self.db.execute_query(
+                    f"SELECT id, {', '.join(columns)} FROM {entity} WHERE id IN ({placeholders})", tuple(ids),
+                    primary=True
+                )
+                operations.append((partial(self._upsert_sql, entity),
+                                   [self._index_row(row, columns) for row in rows]))
+
+                deleted = set(ids) - {row['id'] for row in rows}
+                if deleted:
+                    operations.append((partial(self._delete_sql, entity),
+                                       [(row_id,) for row_id in sorted(deleted)]))
+
+            # 読み込み後に積まれた変更は次回に回す
+            operations.append(("DELETE FROM search_index_queue WHERE seq <= ?", [(queued[-1]['seq'],)]))
+            return len(queued) if self._write(operations) else 0
+        finally:
+            self._sync_lock.release()
+
+    def rebuild(self):
+        """インデックスを作り直して件数を返す"""
+        backend = self._current_backend()
+        if backend is None:
+            return None
+        self._ready.pop(backend, None)
+        if not self.ensure_index():
+            return None
+        return self._populate()
+
+    def match_expression(self, query, backend, column=None):
+        """検索語からFTS5のMATCH式 / tsquery を作る（空ならNone）
+
+        backend は実際に実行する接続の方言（db_config.execute_query に渡す関数の引数）。
+        column を指定するとその列だけを対象にする（PostgreSQLは重みで絞り込む）。
+        """
+        phrases = query_ngrams(query)
+        if not phrases:
+            return None
+
+        if backend == 'sqlite':
+            parts = []
+            for grams, is_prefix in phrases:
+                phrase = '"' + ' '.join(grams) + '"'
+                parts.append(phrase + '*' if is_prefix else phrase)
+            expression = ' AND '.join(parts)
+            return f"{column} : ({expression})" if column else expression
+
+        weight = ''
+        if column:
+            weight = 'ABC'[SEARCH_ENTITIES['products'][2].index(column)]
+        parts = []
+        for grams, is_prefix in phrases:
+            if is_prefix:
+                parts.append(f"'{grams[0]}':*{weight}")
+            else:
+                parts.append('(' + ' <-> '.join(f"'{gram}'{':' + weight if weight else ''}" for gram in grams) + ')')
+        return ' & '.join(parts)
+
+    def _filter_sql(self, category, backend):
+        if backend == 'sqlite':
+            where = "product_ngrams MATCH ?"
+        else:
+            where = "s.search_vector @@ to_tsquery('simple', ?)"
+        if category:
+            where += " AND p.category = ?"
+        return where
+
+    def search(self, query, category='', order_by=None, limit=None, offset=0, joins=''):
+        """関連度順（order_by指定時はその順）で商品を検索
+
+        joins は order_by が参照するテーブルの結合（商品の別名は p）。
+        """
+        if not query_ngrams(query):
+            return []
+
+        def build(backend):
+            expression = self.match_expression(query, backend)
+            params = [expression] + ([category] if category else [])
+            where = self._filter_sql(category, backend)
+
+            if backend == 'sqlite':
+                weights = ', '.join(str(w) for w in BM25_WEIGHTS)
+                rank_sql = f"bm25(product_ngrams, {weights}), p.id"
+                sql = ("SELECT p.* FROM product_ngrams JOIN products p ON p.id = product_ngrams.rowid "
+                       f"{joins} WHERE {where} ORDER BY {order_by or rank_sql}")
+            else:
+                rank_sql = "ts_rank(s.search_vector, to_tsquery('simple', ?)) DESC, p.id"
+                sql = ("SELECT p.* FROM product_ngrams s JOIN products p ON p.id = s.product_id "
+                       f"{joins} WHERE {where} ORDER BY {order_by or rank_sql}")
+                if not order_by:
+                    params.append(expression)
+
+            if limit is not None:
+                sql += " LIMIT ? OFFSET ?"
+                params.extend([limit, offset])
+            return sql, tuple(params)
+
+        # 方言は実際に取得した接続で決める（PostgreSQL障害中はSQLite接続が返る）
+        return self.db.execute_query(build)
+
+    def count(self, query, category=''):
+        """インデックスから一致件数を取得"""
+        if not query_ngrams(query):
+            return 0
+
+        def build(backend):
+            params = [self.match_expression(query, backend)] + ([category] if category else [])
+            if backend == 'sqlite':
+                if category:
+                    sql = ("SELECT COUNT(*) AS count FROM product_ngrams JOIN products p ON p.id = product_ngrams.rowid "
+                           f"WHERE {self._filter_sql(category, backend)}")
+                else:
+                    sql = "SELECT COUNT(*) AS count FROM product_ngrams WHERE product_ngrams MATCH ?"
+            else:
+                sql = ("SELECT COUNT(*) AS count FROM product_ngrams s JOIN products p ON p.id = s.product_id "
+                       f"WHERE {self._filter_sql(category, backend)}")
+            return sql, tuple(params)
+
+        rows = self.db.execute_query(build)
+        return rows[0]['count'] if rows else 0
+
+    def product_filter(self, query, backend, alias='p'):
+        """商品の絞り込み条件（集計など検索結果以外のクエリ用）
+
+        backend は実際に実行する接続の方言。呼び出し側は db_config.execute_query に
+        (sql, params) を返す関数を渡し、その中で呼ぶ。
+        戻り値: (where_sql, params)。検索語が空なら (None, ())
+        """
+        expression = self.match_expression(query, backend)
+        if expression is None:
+            return None, ()
+        if backend == 'sqlite':
+            where_sql = f"{alias}.id IN (SELECT rowid FROM product_ngrams WHERE product_ngrams MATCH ?)"
+        else:
+            where_sql = (f"{alias}.id IN (SELECT product_id FROM product_ngrams "
+                         "WHERE search_vector @@ to_tsquery('simple', ?))")
+        return where_sql, (expression,)
+
+    def review_filter(self, query, backend):
+        """レビュー検索のWHERE条件（r: reviews, u: users の別名が前提）
+
+        コメントと商品名はインデックス、ユーザー名は短いのでLIKEで照合する。
+        backend の扱いは product_filter と同じ。
+        戻り値: (where_sql, params)。検索語が空なら (None, ())
+        """
+        comment_expression = self.match_expression(query, backend)
+        if comment_expression is None:
+            return None, ()
+        name_expression = self.match_expression(query, backend, column='name')
+
+        if backend == 'sqlite':
+            where_sql = ("r.id IN (SELECT rowid FROM review_ngrams WHERE review_ngrams MATCH ?) "
+                         "OR u.username LIKE ? "
+                         "OR r.product_id IN (SELECT rowid FROM product_ngrams WHERE product_ngrams MATCH ?)")
+        else:
+            where_sql = ("r.id IN (SELECT review_id FROM review_ngrams WHERE search_vector @@ to_tsquery('simple', ?)) "
+                         "OR u.username LIKE ? "
+                         "OR r.product_id IN (SELECT product_id FROM product_ngrams "
+                         "WHERE search_vector @@ to_tsquery('simple', ?))")
+        return where_sql, (comment_expression, f'%{query}%', name_expression)
+
+
+# グローバルインスタンス
+product_search = ProductSearchIndex(db_config)
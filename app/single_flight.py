@@ -0,0 +1,88 @@
+import os
+import threading
+
+from dotenv import load_dotenv
+
+# 環境変数を読み込み
+load_dotenv()
+
+# 先行する計算を待つ最大秒数（超えたら待つのをやめて自分で計算する）
+SINGLE_FLIGHT_TIMEOUT = float(os.getenv('SINGLE_FLIGHT_TIMEOUT', 30))
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """同じキーの同時実行を1回にまとめる
+
+    最初の呼び出しだけが fn() を実行し、実行中に同じキーで呼ばれたスレッドは
+    その完了を待って同じ結果（例外なら同じ例外）を受け取る。
+    キャッシュ切れの瞬間に同じクエリが一斉に走るのを防ぐ。
+    """
+
+    def __init__(self, timeout=SINGLE_FLIGHT_TIMEOUT):
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'shared': 0, 'timeouts': 0, 'background': 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats['calls'] += 1
+            else:
+                self._stats['shared'] += 1
+
+        if leader:
+            return self._run(key, call, fn)
+        if not call.done.wait(self.timeout):
+            # 先行する計算が詰まっている（接続待ちなど）ときは巻き込まれず自分で計算する
+            with self._lock:
+                self._stats['timeouts'] += 1
+            return fn()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def _run(self, key, call, fn):
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def do_background(self, key, fn):
+        """バックグラウンドスレッドで fn() を実行（同じキーが実行中なら何もせず False）"""
+        with self._lock:
+            if key in self._calls:
+                return False
+            call = self._calls[key] = _Call()
+            self._stats['background'] += 1
+
+        def run():
+            try:
+                self._run(key, call, fn)
+            except Exception as e:
+                print(f"❌ バックグラウンド更新エラー: {e}")
+
+        threading.Thread(target=run, name='single-flight-refresh', daemon=True).start()
+        return True
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
@@ -0,0 +1,175 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+from app.query_audit import RecordingCursor, query_recorder
+from app.result_cache import result_cache
+from app.transaction import Transaction
+
+# 環境変数を読み込み
+load_dotenv()
+
+# ブループリント共通のSQLite設定
+SQLITE_DB_PATH = os.getenv('SQLITE_DB_PATH', 'database/shop.db')
+SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', -16000))      # 負数はKiB単位（約16MB）
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 64 * 1024 * 1024))
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))    # ミリ秒
+
+_local = threading.local()
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+class ManagedConnection:
+    """スレッド共有のSQLite接続ラッパー
+
+    close() は未コミットの変更を破棄するだけで接続自体は保持する。
+    これにより既存の connect → commit → close の流れをそのまま使える。
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def close(self):
+        if self._conn.in_transaction:
+            self._conn.rollback()
+
+    def cursor(self, *args):
+        cursor = self._conn.cursor(*args)
+        if query_recorder.enabled:
+            return RecordingCursor(cursor, query_recorder, 'sqlite')
+        return cursor
+
+    def execute(self, sql, *args):
+        query_recorder.record('sqlite', sql)
+        return self._conn.execute(sql, *args)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def _connect():
+    """新しい接続を作成してPRAGMAを設定"""
+    directory = os.path.dirname(SQLITE_DB_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    conn = sqlite3.connect(SQLITE_DB_PATH, timeout=SQLITE_BUSY_TIMEOUT / 1000)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+    conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def get_db():
+    """現在のスレッドのSQLite接続を取得（なければ作成）
+
+    接続はスレッドごとに1本だけ保持し、スレッド終了時に破棄される。
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.generation != _generation:
+        # 復元などで接続の作り直しが要求された
+        close_db()
+        conn = None
+
+    if conn is None:
+        conn = _connect()
+        _local.conn = conn
+        _local.generation = _generation
+
+    return ManagedConnection(conn)
+
+
+@contextmanager
+def transaction():
+    """現在のスレッドの接続で複数の文を1トランザクションで実行する
+
+        with transaction() as tx:
+            order_id = tx.execute("INSERT ...", (...))
+            tx.execute_many("INSERT ...", rows)
+
+    BEGIN IMMEDIATE で開始し、ブロックを抜けると1回だけコミットする。
+    例外時は全体をロールバックして例外をそのまま送出する。
+    コミット後、書き込んだテーブルに依存するクエリ結果キャッシュを破棄する。
+    """
+    get_db()
+    tx = Transaction(_local.conn, 'sqlite', 'sqlite')
+    tx.begin()
+    try:
+        yield tx
+        tx.commit()
+        if tx.tables:
+            result_cache.invalidate(*tx.tables)
+    except BaseException:
+        if not tx.rollback():
+            close_db()
+        raise
+
+
+def release_db(exception=None):
+    """リクエスト終了時の後始末（未コミットの変更を破棄、接続は保持）"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and conn.in_transaction:
+        conn.rollback()
+
+
+def close_db():
+    """現在のスレッドの接続を閉じる"""
+    conn = getattr(_local, 'conn', None)
+    _local.conn = None
+    if conn is not None:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+def checkpoint():
+    """WALの内容をメインDBファイルに書き戻す（ファイルコピー前に呼ぶ）"""
+    conn = get_db()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def backup_to(path):
+    """稼働中のDBを path へコピー（バックアップAPIを使うので、書き込み中でもWALを含め一貫した内容になる）"""
+    get_db()
+    target = sqlite3.connect(path)
+    try:
+        _local.conn.backup(target)
+    finally:
+        target.close()
+
+
+def restore_from(path):
+    """path のバックアップの内容を稼働中のDBへ書き戻す
+
+    ファイルを上書きせず、接続越しにバックアップAPIでページをコピーする。
+    コピー中は書き込みロックを取り、結果はWAL経由で反映されるので、
+    他のスレッドが開いている接続・mmap・残っているWALと食い違わない。
+    """
+    get_db()
+    source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        source.backup(_local.conn)
+    finally:
+        source.close()
+    invalidate_connections()
+
+
+def invalidate_connections():
+    """全スレッドの接続を次回取得時に作り直させる（DB復元後など）"""
+    global _generation
+    with _generation_lock:
+        _generation += 1
+    close_db()
+
+
+def init_app(app):
+    """Flaskアプリにteardownを登録"""
+    app.teardown_appcontext(release_db)
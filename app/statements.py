@@ -0,0 +1,233 @@
+import os
+import re
+import threading
+import weakref
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+try:
+    import psycopg2.errors
+    import psycopg2.extensions
+except ImportError:  # SQLiteのみの環境（db_helper）
+    psycopg2 = None
+
+# 環境変数を読み込み
+load_dotenv()
+
+# コンパイル済みSQLの保持数（LRU）
+STATEMENT_CACHE_SIZE = int(os.getenv('STATEMENT_CACHE_SIZE', 512))
+# プール接続ごとにサーバー側プリペアドステートメントを使うか
+# （Supabaseのトランザクションプーラー(6543番)など PREPARE を保持できない経路では無効にする）
+DB_PREPARED_STATEMENTS = os.getenv('DB_PREPARED_STATEMENTS', 'false').lower() == 'true'
+
+# 文字列・引用符付き識別子・コメント・ドル引用（中身は書き換えない）と、プレースホルダー・%
+_SQL_TOKEN = re.compile(r"""
+    (?P<literal>
+        '(?:[^']|'')*'?
+      | "(?:[^"]|"")*"?
+      | --[^\n]*
+      | /\*.*?(?:\*/|\Z)
+      | \$\$.*?(?:\$\$|\Z)
+      | \$(?P<tag>[A-Za-z_]\w*)\$.*?(?:\$(?P=tag)\$|\Z)
+    )
+  | (?P<placeholder>\?|%s)
+  | (?P<percent>%)
+""", re.VERBOSE | re.DOTALL)
+
+# 書き込み先のテーブル名（INSERT INTO / UPDATE / DELETE FROM / REPLACE INTO / TRUNCATE / DDL）
+_WRITE_TARGET = re.compile(r"""
+    \b(?:
+        (?:INSERT|REPLACE)(?:\s+OR\s+\w+)?\s+INTO
+      | UPDATE(?:\s+OR\s+\w+)?(?!\s+(?:SET|OF)\b)
+      | DELETE\s+FROM
+      | TRUNCATE(?:\s+TABLE)?(?:\s+ONLY)?
+      | (?:CREATE|ALTER|DROP)\s+TABLE(?:\s+IF(?:\s+NOT)?\s+EXISTS)?
+    )\s+(?P<table>(?:"[^"]+"|\w+)(?:\.(?:"[^"]+"|\w+))?)
+""", re.VERBOSE | re.IGNORECASE)
+
+
+def written_tables(sql):
+    """SQLが書き込むテーブル名の集合（小文字、スキーマ名と引用符は除く）
+
+    文字列リテラル・コメント中の語は見ない（引用符付き識別子は残す）。SELECT なら空集合。
+    """
+    body = _SQL_TOKEN.sub(
+        lambda m: ' ' if m.group('literal') and not m.group().startswith('"') else m.group(), sql
+    )
+    return frozenset(
+        match.group('table').rsplit('.', 1)[-1].strip('"').lower()
+        for match in _WRITE_TARGET.finditer(body)
+    )
+
+
+class Statement:
+    """バックエンド向けに変換済みのSQL
+
+    text: cursor.execute に渡す文字列
+    numbered: プレースホルダーを $1, $2... にした文字列（PREPARE用、PostgreSQLのみ）
+    execute_text: プリペア済みの文を実行する EXECUTE 文
+    tables: 書き込み先のテーブル名（結果キャッシュの無効化用）
+    """
+
+    __slots__ = ('sql', 'text', 'numbered', 'param_count', 'is_insert', 'name', 'execute_text', 'tables')
+
+    def __init__(self, sql, text, numbered, param_count, name):
+        self.sql = sql
+        self.text = text
+        self.numbered = numbered
+        self.param_count = param_count
+        self.is_insert = sql.lstrip()[:6].upper() == 'INSERT'
+        self.name = name
+        self.execute_text = f"EXECUTE {name} ({', '.join(['%s'] * param_count)})" if numbered else None
+        self.tables = written_tables(sql)
+
+
+def compile_statement(sql, backend, has_params, name=None):
+    """? / %s のどちらで書かれたSQLもバックエンドのプレースホルダーに変換
+
+    文字列リテラルやコメント中の ? はそのまま残す。PostgreSQL（psycopg2）で
+    パラメータを渡す場合は、プレースホルダー以外の % を %% にエスケープする。
+    """
+    if not has_params:
+        return Statement(sql, sql, None, 0, name)
+
+    postgres = backend == 'postgres'
+    text, numbered = [], []
+    count = 0
+    position = 0
+    for match in _SQL_TOKEN.finditer(sql):
+        text.append(sql[position:match.start()])
+        numbered.append(sql[position:match.start()])
+        position = match.end()
+        token = match.group()
+        if match.group('placeholder'):
+            count += 1
+            text.append('%s' if postgres else '?')
+            numbered.append(f'${count}')
+        elif postgres:
+            # psycopg2 はパラメータ付きの文では % をすべて書式指定として解釈する
+            text.append(token.replace('%', '%%'))
+            numbered.append(token)
+        else:
+            text.append(token)
+            numbered.append(token)
+    text.append(sql[position:])
+    numbered.append(sql[position:])
+    return Statement(sql, ''.join(text), ''.join(numbered) if backend == 'postgres' else None, count, name)
+
+
+class StatementCache:
+    """SQL文字列ごとの変換結果を保持するLRUキャッシュ
+
+    同じSQLは2回目以降辞書を引くだけで、文字列処理を行わない。
+    """
+
+    def __init__(self, max_entries=STATEMENT_CACHE_SIZE, prepare=DB_PREPARED_STATEMENTS):
+        self.max_entries = max_entries
+        self.prepare = prepare
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._sequence = 0
+        # 接続 -> その接続で PREPARE 済みの名前
+        self._prepared = weakref.WeakKeyDictionary()
+        self._unpreparable = set()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'prepares': 0, 'prepare_failures': 0}
+
+    def get(self, sql, backend, has_params):
+        key = (sql, backend, has_params)
+        # ヒット時はロックを取らない（OrderedDictの各操作はGIL下でアトミック、統計は概数）
+        statement = self._entries.get(key)
+        if statement is not None:
+            self._stats['hits'] += 1
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                pass
+            return statement
+        with self._lock:
+            self._stats['misses'] += 1
+            self._sequence += 1
+            name = f"stmt_{self._sequence}"
+
+        statement = compile_statement(sql, backend, has_params, name)
+        with self._lock:
+            self._entries[key] = statement
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+        return statement
+
+    def execute(self, cursor, conn, sql, params, backend):
+        """変換済みSQLで実行（PostgreSQLで有効なら接続ごとのプリペアドステートメントを使う）"""
+        statement = self.get(sql, backend, bool(params))
+        if not params:
+            cursor.execute(statement.text)
+        elif backend == 'postgres' and self.prepare and self._ensure_prepared(cursor, conn, statement):
+            try:
+                cursor.execute(statement.execute_text, params)
+            except (psycopg2.errors.FeatureNotSupported, psycopg2.errors.InvalidSqlStatementName):
+                # テーブル定義の変更で結果の型が変わった・接続側で破棄された場合は作り直す
+                self._forget(cursor, conn, statement)
+                cursor.execute(statement.text, params)
+        else:
+            cursor.execute(statement.text, params)
+        return statement
+
+    def _ensure_prepared(self, cursor, conn, statement):
+        if statement.name in self._unpreparable:
+            return False
+        with self._lock:
+            names = self._prepared.setdefault(conn, set())
+            if statement.name in names:
+                return True
+        # トランザクション中の失敗は後続の文を巻き込むため、アイドル状態の接続でのみ準備する
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        try:
+            if len(names) >= self.max_entries:
+                cursor.execute("DEALLOCATE ALL")
+                names.clear()
+            cursor.execute(f"PREPARE {statement.name} AS {statement.numbered}")
+        except Exception as e:
+            # 型を推論できない文などはプリペアせずに実行する
+            print(f"⚠️ PREPARE失敗（通常実行に切り替え）: {e}")
+            with self._lock:
+                self._unpreparable.add(statement.name)
+                self._stats['prepare_failures'] += 1
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            return False
+        with self._lock:
+            names.add(statement.name)
+            self._stats['prepares'] += 1
+        return True
+
+    def _forget(self, cursor, conn, statement):
+        with self._lock:
+            names = self._prepared.get(conn)
+            if names is not None:
+                names.discard(statement.name)
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        try:
+            cursor.execute(f"DEALLOCATE {statement.name}")
+        except psycopg2.Error:
+            pass
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats['hits'] + stats['misses']
+            stats.update({
+                'size': len(self._entries),
+                'max_size': self.max_entries,
+                'hit_ratio': round(stats['hits'] / lookups, 4) if lookups else 0.0,
+                'prepared_statements': self.prepare,
+            })
+            return stats
+
+
+# グローバルインスタンス
+statement_cache = StatementCache()
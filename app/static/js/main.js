@@ -16,6 +16,12 @@ document.addEventListener("DOMContentLoaded", function () {
 
   // 脆弱性情報の表示
   showVulnerabilityInfo();
+
+  // 検索ボックスの入力補完
+  document.querySelectorAll("input[data-suggest]").forEach(initSuggest);
+
+  // レビューの続きを読み込むボタン
+  document.querySelectorAll("[data-review-more]").forEach(initReviewPager);
 });
 
 // 脆弱性情報の表示
@@ -131,6 +137,229 @@ function searchProducts() {
   }
 }
 
+// 入力補完
+const SUGGEST_DEBOUNCE_MS = 150;
+const SUGGEST_CACHE_SIZE = 100;
+const suggestCache = new Map();
+
+function fetchSuggestions(query, signal) {
+  if (suggestCache.has(query)) {
+    return Promise.resolve(suggestCache.get(query));
+  }
+
+  return fetch(`/api/suggest?q=${encodeURIComponent(query)}`, { signal: signal })
+    .then(function (response) {
+      return response.json();
+    })
+    .then(function (data) {
+      const suggestions = data.suggestions || [];
+      // 古いものから捨てる（Mapは挿入順を保持）
+      if (suggestCache.size >= SUGGEST_CACHE_SIZE) {
+        suggestCache.delete(suggestCache.keys().next().value);
+      }
+      suggestCache.set(query, suggestions);
+      return suggestions;
+    });
+}
+
+function suggestionUrl(suggestion) {
+  if (suggestion.type === "category") {
+    return `/products?category=${encodeURIComponent(suggestion.value)}`;
+  }
+  return `/product/${suggestion.id}`;
+}
+
+function initSuggest(input) {
+  input.setAttribute("autocomplete", "off");
+  input.parentElement.classList.add("position-relative");
+
+  const menu = document.createElement("div");
+  menu.className = "dropdown-menu w-100";
+  menu.style.top = "100%";
+  input.parentElement.appendChild(menu);
+
+  let timer = null;
+  let controller = null;
+  let activeIndex = -1;
+
+  function hide() {
+    menu.classList.remove("show");
+    activeIndex = -1;
+  }
+
+  function render(suggestions) {
+    menu.innerHTML = "";
+    activeIndex = -1;
+    if (!suggestions.length) {
+      hide();
+      return;
+    }
+
+    suggestions.forEach(function (suggestion) {
+      const item = document.createElement("a");
+      item.className = "dropdown-item";
+      item.href = suggestionUrl(suggestion);
+      item.textContent = suggestion.value;
+      if (suggestion.type === "category") {
+        const badge = document.createElement("span");
+        badge.className = "badge bg-secondary ms-2";
+        badge.textContent = `カテゴリ ${suggestion.count}件`;
+        item.appendChild(badge);
+      }
+      menu.appendChild(item);
+    });
+    menu.classList.add("show");
+  }
+
+  function setActive(index) {
+    const items = menu.querySelectorAll(".dropdown-item");
+    if (!items.length) {
+      return;
+    }
+    activeIndex = (index + items.length) % items.length;
+    items.forEach(function (item, i) {
+      item.classList.toggle("active", i === activeIndex);
+    });
+  }
+
+  input.addEventListener("input", function () {
+    clearTimeout(timer);
+    const query = input.value.trim();
+    if (!query) {
+      hide();
+      return;
+    }
+
+    // 入力が止まってから問い合わせる
+    timer = setTimeout(function () {
+      if (controller) {
+        controller.abort();
+      }
+      controller = new AbortController();
+      fetchSuggestions(query, controller.signal)
+        .then(function (suggestions) {
+          if (input.value.trim() === query) {
+            render(suggestions);
+          }
+        })
+        .catch(function (error) {
+          if (error.name !== "AbortError") {
+            console.log("入力補完エラー:", error);
+          }
+        });
+    }, SUGGEST_DEBOUNCE_MS);
+  });
+
+  input.addEventListener("keydown", function (event) {
+    if (!menu.classList.contains("show")) {
+      return;
+    }
+    if (event.key === "ArrowDown") {
+      event.preventDefault();
+      setActive(activeIndex + 1);
+    } else if (event.key === "ArrowUp") {
+      event.preventDefault();
+      setActive(activeIndex - 1);
+    } else if (event.key === "Enter" && activeIndex >= 0) {
+      event.preventDefault();
+      window.location.href = menu.querySelectorAll(".dropdown-item")[activeIndex].href;
+    } else if (event.key === "Escape") {
+      hide();
+    }
+  });
+
+  input.addEventListener("blur", function () {
+    // 候補のクリックを先に処理させる
+    setTimeout(hide, 150);
+  });
+}
+
+// レビューの続きを読み込む
+function buildReviewCard(review, layout) {
+  const card = document.createElement("div");
+  card.className = layout === "list" ? "card mb-4" : "card mb-3";
+  const body = document.createElement("div");
+  body.className = "card-body";
+
+  const header = document.createElement("div");
+  header.className = "d-flex justify-content-between";
+  const title = document.createElement("h6");
+  title.textContent =
+    layout === "list" ? review.product_name : review.created_at;
+  const meta = document.createElement("div");
+  const rating = document.createElement("span");
+  rating.className = "text-warning";
+  rating.textContent = `⭐ ${review.rating}/5 `;
+  const info = document.createElement("small");
+  info.className = "text-muted";
+  info.textContent =
+    layout === "list"
+      ? `投稿者: ${review.username} ${review.created_at}`
+      : review.username;
+  meta.appendChild(rating);
+  meta.appendChild(info);
+  header.appendChild(title);
+  header.appendChild(meta);
+
+  const content = document.createElement("div");
+  content.className = "review-content mt-2";
+  content.textContent = review.comment;
+
+  body.appendChild(header);
+  body.appendChild(content);
+  if (layout === "list") {
+    const link = document.createElement("a");
+    link.href = `/review/${review.id}`;
+    link.className = "btn btn-outline-primary btn-sm mt-3";
+    link.textContent = "詳細を見る";
+    body.appendChild(link);
+  }
+  card.appendChild(body);
+  return card;
+}
+
+function initReviewPager(button) {
+  const layout = button.dataset.reviewMore;
+  const container = document.querySelector(".reviews-list");
+  if (!container) {
+    return;
+  }
+
+  button.addEventListener("click", function (event) {
+    event.preventDefault();
+    if (button.classList.contains("disabled")) {
+      return;
+    }
+
+    const params = new URLSearchParams({ cursor: button.dataset.cursor });
+    if (button.dataset.productId) {
+      params.set("product_id", button.dataset.productId);
+    }
+
+    button.classList.add("disabled");
+    fetch(`/api/reviews?${params.toString()}`)
+      .then(function (response) {
+        return response.json();
+      })
+      .then(function (data) {
+        (data.reviews || []).forEach(function (review) {
+          container.appendChild(buildReviewCard(review, layout));
+        });
+        if (data.next_cursor) {
+          button.dataset.cursor = data.next_cursor;
+          button.classList.remove("disabled");
+        } else {
+          button.remove();
+        }
+      })
+      .catch(function (error) {
+        console.log("レビュー読み込みエラー:", error);
+        // 通常のページ遷移にフォールバック
+        window.location.href = button.href;
+      });
+  });
+}
+
 // レビュー投稿
 function submitReview(productId) {
   const rating = document.getElementById("rating").value;
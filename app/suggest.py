@@ -0,0 +1,191 @@
+import bisect
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from app.database import db_config
+from app.search import segments
+
+# 環境変数を読み込み
+load_dotenv()
+
+# 他プロセスでの変更を取り込むための全件再構築の間隔（秒）
+SUGGEST_REFRESH_INTERVAL = float(os.getenv('SUGGEST_REFRESH_INTERVAL', 300))
+# 候補を探すときに走査する最大エントリ数（同名商品の重複除去用）
+SUGGEST_SCAN_LIMIT = 200
+# キーと商品IDの区切り（どの文字よりも小さいので短いキーが先に並ぶ）
+_SEPARATOR = '\x00'
+
+
+def suggest_keys(name):
+    """商品名から前方一致用のキーを作る
+
+    正規化した商品名全体に加え、2番目以降の単語の先頭からのキーも作る。
+    例: "Sony α7 IV" -> ["sony α7 iv", "α7 iv", "iv"]
+    """
+    normalized = ' '.join(segments(name))
+    if not normalized:
+        return []
+    keys = [normalized]
+    position = normalized.find(' ')
+    while position != -1:
+        keys.append(normalized[position + 1:])
+        position = normalized.find(' ', position + 1)
+    return keys
+
+
+class SuggestIndex:
+    """入力補完用のメモリ内前方一致インデックス
+
+    「正規化キー + 区切り + 商品ID」の文字列をソート済み配列で保持し、
+    bisect で前方一致範囲の先頭を求める。検索は O(log n + 件数)。
+    カテゴリは件数が少ないので商品数付きの辞書で持つ。
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._entries = []      # ソート済みの "キー\x00商品ID"
+        self._names = {}        # 商品ID -> 商品名
+        self._product_keys = {}  # 商品ID -> エントリのリスト
+        self._product_category = {}  # 商品ID -> カテゴリ
+        self._categories = {}   # カテゴリ -> 商品数
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._built_at = None
+
+    def build(self, rows):
+        """(id, name, category) の並びから全件を構築して入れ替える"""
+        entries = []
+        names = {}
+        product_keys = {}
+        product_category = {}
+        categories = {}
+        for product_id, name, category in rows:
+            keys = [f"{key}{_SEPARATOR}{product_id}" for key in suggest_keys(name)]
+            entries.extend(keys)
+            names[product_id] = name
+            product_keys[product_id] = keys
+            if category:
+                product_category[product_id] = category
+                categories[category] = categories.get(category, 0) + 1
+        entries.sort()
+
+        with self._lock:
+            self._entries = entries
+            self._names = names
+            self._product_keys = product_keys
+            self._product_category = product_category
+            self._categories = categories
+            self._built_at = time.monotonic()
+        return len(names)
+
+    def _load(self):
+        rows = self.db.execute_query("SELECT id, name, category FROM products")
+        count = self.build((row['id'], row['name'], row['category']) for row in rows)
+        print(f"✅ 入力補完インデックス構築: {count}件")
+        return count
+
+    def refresh(self):
+        """productsテーブルから全件再構築"""
+        with self._build_lock:
+            return self._load()
+
+    def ensure_fresh(self):
+        """未構築なら構築し、古くなっていればバックグラウンドで再構築"""
+        if self._built_at is None:
+            with self._build_lock:
+                if self._built_at is None:
+                    self._load()
+        elif time.monotonic() - self._built_at > SUGGEST_REFRESH_INTERVAL and not self._build_lock.locked():
+            # 同時に何本も走らないよう、先に構築時刻を進めておく
+            self._built_at = time.monotonic()
+            threading.Thread(target=self.refresh, daemon=True).start()
+
+    def _remove_locked(self, product_id):
+        for entry in self._product_keys.pop(product_id, []):
+            position = bisect.bisect_left(self._entries, entry)
+            if position < len(self._entries) and self._entries[position] == entry:
+                del self._entries[position]
+        self._names.pop(product_id, None)
+
+        category = self._product_category.pop(product_id, None)
+        if category:
+            self._categories[category] -= 1
+            if self._categories[category] <= 0:
+                del self._categories[category]
+
+    def add_product(self, product_id, name, category=None):
+        """商品を追加（既にあれば置き換え）"""
+        if product_id is None:
+            return
+        keys = [f"{key}{_SEPARATOR}{product_id}" for key in suggest_keys(name)]
+        with self._lock:
+            if self._built_at is None:
+                # 未構築なら初回の構築時に読み込まれる
+                return
+            self._remove_locked(product_id)
+            for entry in keys:
+                bisect.insort(self._entries, entry)
+            self._names[product_id] = name
+            self._product_keys[product_id] = keys
+            if category:
+                self._product_category[product_id] = category
+                self._categories[category] = self._categories.get(category, 0) + 1
+
+    def update_product(self, product_id, name, category=None):
+        """商品名・カテゴリの変更を反映"""
+        self.add_product(product_id, name, category)
+
+    def remove_product(self, product_id):
+        """商品を削除"""
+        with self._lock:
+            self._remove_locked(product_id)
+
+    def suggest(self, query, limit=8):
+        """前方一致する候補を返す（カテゴリ → 商品名の順）"""
+        prefix = ' '.join(segments(query))
+        if not prefix:
+            return []
+
+        self.ensure_fresh()
+        suggestions = []
+
+        with self._lock:
+            # カテゴリは商品数の多い順
+            matched = [(count, category) for category, count in self._categories.items()
+                       if ' '.join(segments(category)).startswith(prefix)]
+            for count, category in sorted(matched, key=lambda item: (-item[0], item[1]))[:max(1, limit // 4)]:
+                suggestions.append({'type': 'category', 'value': category, 'count': count})
+
+            # 商品名はキーの辞書順（短い補完ほど先）
+            seen = set()
+            position = bisect.bisect_left(self._entries, prefix)
+            end = min(len(self._entries), position + SUGGEST_SCAN_LIMIT)
+            while position < end and len(suggestions) < limit:
+                entry = self._entries[position]
+                if not entry.startswith(prefix):
+                    break
+                product_id = int(entry.rsplit(_SEPARATOR, 1)[1])
+                name = self._names.get(product_id)
+                if name is not None and name not in seen:
+                    seen.add(name)
+                    suggestions.append({'type': 'product', 'value': name, 'id': product_id})
+                position += 1
+
+        return suggestions
+
+    def stats(self):
+        """インデックスの状態"""
+        with self._lock:
+            return {
+                'products': len(self._names),
+                'entries': len(self._entries),
+                'categories': len(self._categories),
+                'age_seconds': round(time.monotonic() - self._built_at, 1) if self._built_at else None,
+            }
+
+
+# グローバルインスタンス
+suggest_index = SuggestIndex(db_config)
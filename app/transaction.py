@@ -0,0 +1,128 @@
+import os
+import random
+import sqlite3
+import time
+
+from dotenv import load_dotenv
+
+try:
+    import psycopg2.extensions
+    import psycopg2.extras
+except ImportError:  # SQLiteのみの環境
+    psycopg2 = None
+
+from app.query_audit import query_recorder
+from app.rows import rows_from_cursor
+from app.statements import statement_cache
+
+# 環境変数を読み込み
+load_dotenv()
+
+# SQLiteがロック中（SQLITE_BUSY）のときの再試行回数と初回待機（秒、再試行ごとに倍）
+DB_BUSY_RETRIES = int(os.getenv('DB_BUSY_RETRIES', 5))
+DB_BUSY_BACKOFF = float(os.getenv('DB_BUSY_BACKOFF', 0.05))
+
+
+def is_busy_error(error):
+    """SQLiteのロック待ちタイムアウト（database is locked / busy）かどうか"""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def retry_busy(fn, retries=None, backoff=None):
+    """SQLITE_BUSY の間は指数バックオフ（ゆらぎ付き）で fn を再試行する"""
+    retries = DB_BUSY_RETRIES if retries is None else retries
+    backoff = DB_BUSY_BACKOFF if backoff is None else backoff
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except sqlite3.OperationalError as e:
+            if attempt == retries or not is_busy_error(e):
+                raise
+            delay = backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+            print(f"🔄 SQLiteロック中、{delay:.2f}秒後に再試行 ({attempt + 1}/{retries})")
+            time.sleep(delay)
+
+
+class Transaction:
+    """1本の接続を固定して複数の文を1トランザクションで実行する
+
+    db_config.transaction() / sqlite_db.transaction() の with 文で受け取る。
+    ブロックを抜けると1回だけコミットし、例外時はすべてロールバックする。
+
+    SQLiteは BEGIN IMMEDIATE で開始時に書き込みロックを取り、途中の文で
+    ロック待ちにならないようにする（開始とコミットはロック中なら再試行）。
+
+    tables には書き込んだテーブル名がたまる（コミット後の結果キャッシュ無効化用）。
+    """
+
+    def __init__(self, conn, backend, source):
+        self.conn = conn
+        self.backend = backend
+        self.source = source
+        self.tables = set()
+        if backend == 'sqlite':
+            self.cursor = conn.cursor()
+            # 行はタプルで受け取り Row で包む
+            self.cursor.row_factory = None
+        else:
+            self.cursor = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+
+    def begin(self):
+        if self.backend == 'sqlite':
+            retry_busy(lambda: self.cursor.execute("BEGIN IMMEDIATE"))
+        else:
+            # プール接続はautocommitのため明示的にトランザクションを張る
+            self.cursor.execute("BEGIN")
+
+    def commit(self):
+        if self.backend == 'sqlite':
+            retry_busy(self.conn.commit)
+        else:
+            self.cursor.execute("COMMIT")
+
+    def rollback(self):
+        """ロールバック（失敗したら接続を破棄すべきなので False）"""
+        try:
+            if self.backend == 'sqlite':
+                self.conn.rollback()
+            else:
+                self.cursor.execute("ROLLBACK")
+            return True
+        except Exception:
+            return False
+
+    def query(self, sql, params=None):
+        """SELECT の結果を Row のリストで返す"""
+        query_recorder.record(self.source, sql)
+        statement_cache.execute(self.cursor, self.conn, sql, params, self.backend)
+        return rows_from_cursor(self.cursor)
+
+    def execute(self, sql, params=None):
+        """INSERT/UPDATE/DELETE を実行
+
+        RETURNING 付きの文なら最初の行の先頭列、SQLiteならそれ以外は lastrowid を返す
+        （PostgreSQLで挿入IDが必要な場合は RETURNING id を付ける）。
+        """
+        query_recorder.record(self.source, sql)
+        statement = statement_cache.execute(self.cursor, self.conn, sql, params, self.backend)
+        self.tables.update(statement.tables)
+        if self.cursor.description:
+            # 文を最後まで進めてからコミットできるよう全行を読む
+            rows = self.cursor.fetchall()
+            return rows[0][0] if rows else None
+        return self.cursor.lastrowid if self.backend == 'sqlite' else None
+
+    def execute_many(self, sql, rows):
+        """同じ文を複数のパラメータでまとめて実行し、処理した件数を返す"""
+        query_recorder.record(self.source, sql)
+        rows = list(rows)
+        statement = statement_cache.get(sql, self.backend, True)
+        self.tables.update(statement.tables)
+        if self.backend == 'sqlite':
+            self.cursor.executemany(statement.text, rows)
+        else:
+            psycopg2.extras.execute_batch(self.cursor, statement.text, rows)
+        return len(rows)
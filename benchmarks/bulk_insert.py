@@ -0,0 +1,113 @@
+"""商品の一括投入（1行ずつの execute_update と bulk_insert）の比較
+
+一時SQLiteファイルの products テーブルに合成商品を投入し、
+従来の1行1トランザクションの execute_update と、チャンクごとに executemany する
+bulk_insert（全体で1トランザクション）の挿入速度を比較する。
+1行ずつの方式は遅いので --per-row-rows 件だけ計測して毎秒件数で比べる。
+
+使い方:
+    python benchmarks/bulk_insert.py
+    python benchmarks/bulk_insert.py --rows 1000000 --per-row-rows 2000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.database import DatabaseConfig  # noqa: E402
+from app.replicas import ReplicaRouter  # noqa: E402
+from app.result_cache import ResultCache  # noqa: E402
+from benchmarks.search_ngram import ADJECTIVES, CATEGORIES, NOUNS, PHRASES  # noqa: E402
+
+COLUMNS = ('name', 'description', 'price', 'stock', 'category', 'image_url')
+
+
+class BenchmarkConfig(DatabaseConfig):
+    """接続先だけを一時SQLiteファイルに差し替えた DatabaseConfig"""
+
+    def __init__(self, path, chunk_size):
+        self.path = path
+        self.use_postgres = False
+        self._pool = None
+        self.bulk_chunk_size = chunk_size
+        # レプリカなし、結果キャッシュはこの計測専用
+        self.replicas = ReplicaRouter([])
+        self.result_cache = ResultCache()
+
+    def get_db_connection(self):
+        return sqlite3.connect(self.path)
+
+
+def create_table(path):
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            price REAL NOT NULL,
+            stock INTEGER DEFAULT 0,
+            category TEXT,
+            image_url TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+    conn.close()
+
+
+def generate_products(count, seed=42):
+    """合成商品をジェネレータで返す（全件をメモリに載せない）"""
+    rng = random.Random(seed)
+    for i in range(count):
+        yield (f"{rng.choice(ADJECTIVES)}{rng.choice(NOUNS)}", rng.choice(PHRASES), float(rng.randint(100, 200000)),
+               rng.randint(0, 100), rng.choice(CATEGORIES), f"/static/uploads/{i}.jpg")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--per-row-rows', type=int, default=2000)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bulk.db')
+        create_table(path)
+        db = BenchmarkConfig(path, args.chunk_size)
+        sql = f"INSERT INTO products ({', '.join(COLUMNS)}) VALUES ({', '.join(['?'] * len(COLUMNS))})"
+
+        start = time.perf_counter()
+        for values in generate_products(args.per_row_rows):
+            db.execute_update(sql, values)
+        per_row = time.perf_counter() - start
+
+        start = time.perf_counter()
+        inserted = db.bulk_insert('products', COLUMNS, generate_products(args.rows))
+        bulk = time.perf_counter() - start
+
+        start = time.perf_counter()
+        ids = db.bulk_insert('products', COLUMNS, generate_products(args.per_row_rows), return_ids=True)
+        bulk_ids = time.perf_counter() - start
+
+        conn = sqlite3.connect(path)
+        total = conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+        conn.close()
+
+    per_row_rate = args.per_row_rows / per_row
+    print(f"📦 products に投入（チャンク {args.chunk_size:,}行）")
+    print(f"{'方式':<22} {'件数':>10} {'時間':>10} {'件/秒':>12}")
+    print(f"{'execute_update (1行ずつ)':<22} {args.per_row_rows:>10,} {per_row:>9.2f}s {per_row_rate:>12,.0f}")
+    print(f"{'bulk_insert':<22} {inserted:>10,} {bulk:>9.2f}s {inserted / bulk:>12,.0f}")
+    print(f"{'bulk_insert (id取得)':<22} {len(ids):>10,} {bulk_ids:>9.2f}s {len(ids) / bulk_ids:>12,.0f}")
+    print(f"⏱️ 1行ずつで {args.rows:,}行を投入した場合の推定: {args.rows / per_row_rate:,.0f}s")
+    print(f"🔍 テーブル件数: {total:,}")
+
+
+if __name__ == '__main__':
+    main()
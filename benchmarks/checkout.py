@@ -0,0 +1,195 @@
+"""チェックアウトの同時実行ベンチマーク（1品ずつのループと集合演算の比較）
+
+ユーザーごとに --items 品のカートを用意し、--checkouts 件のチェックアウトを
+--workers スレッドで同時に実行する。どちらの方式も Transaction（1トランザクション・
+1コミット）で実行し、文の数だけが違う。
+
+- loop: 商品価格の SELECT と order_items の INSERT を1品ずつ（1 + 2×品数 + 2 文）
+- set:  app/routes/order.py と同じ INSERT ... SELECT（3文）
+
+ロック待ちは書き込みロックの取得（SQLiteの BEGIN IMMEDIATE、再試行の待機を含む）と
+コミットにかかった時間。PostgreSQLは別ユーザーのカート同士で行ロックが競合しないため、
+ほぼ0になる。
+
+使い方:
+    python benchmarks/checkout.py
+    python benchmarks/checkout.py --database-url postgresql://...   # PostgreSQLも計測
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.routes.order import ORDER_INSERT_SQL, ORDER_ITEMS_INSERT_SQL  # noqa: E402
+from app.transaction import Transaction  # noqa: E402
+
+PG_SCHEMA = 'checkout_benchmark'
+
+SCHEMA = {
+    'sqlite': [
+        "CREATE TABLE products (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, price REAL NOT NULL)",
+        "CREATE TABLE cart (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, product_id INTEGER, quantity INTEGER)",
+        """CREATE TABLE orders (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, shipping_address TEXT,
+               payment_method TEXT, total_amount REAL, status TEXT, created_at TIMESTAMP)""",
+        """CREATE TABLE order_items (id INTEGER PRIMARY KEY AUTOINCREMENT, order_id INTEGER, product_id INTEGER,
+               quantity INTEGER, price REAL)""",
+    ],
+    'postgres': [
+        "CREATE TABLE products (id SERIAL PRIMARY KEY, name VARCHAR(255), price DECIMAL(10,2) NOT NULL)",
+        "CREATE TABLE cart (id SERIAL PRIMARY KEY, user_id INTEGER, product_id INTEGER, quantity INTEGER)",
+        """CREATE TABLE orders (id SERIAL PRIMARY KEY, user_id INTEGER, shipping_address TEXT,
+               payment_method VARCHAR(50), total_amount DECIMAL(10,2), status VARCHAR(50), created_at TIMESTAMP)""",
+        """CREATE TABLE order_items (id SERIAL PRIMARY KEY, order_id INTEGER, product_id INTEGER,
+               quantity INTEGER, price DECIMAL(10,2))""",
+    ],
+}
+# app/migrations.py の v2, v3 と同じインデックス
+INDEXES = [
+    "CREATE INDEX idx_cart_user_product ON cart (user_id, product_id)",
+    "CREATE INDEX idx_orders_user ON orders (user_id, id)",
+    "CREATE INDEX idx_order_items_order ON order_items (order_id)",
+]
+
+
+def checkout_loop(tx, user_id):
+    """変更前の checkout と同じく1品ずつ価格を引いて挿入"""
+    order_id = tx.execute("""
+        INSERT INTO orders (user_id, shipping_address, payment_method, total_amount, status, created_at)
+        VALUES (?, ?, ?, ?, 'pending', CURRENT_TIMESTAMP) RETURNING id
+    """, (user_id, '東京都', 'card', 0))
+    for product_id, quantity in tx.query("SELECT product_id, quantity FROM cart WHERE user_id = ?", (user_id,)):
+        price = tx.query("SELECT price FROM products WHERE id = ?", (product_id,))[0][0]
+        tx.execute("INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (?, ?, ?, ?)",
+                   (order_id, product_id, quantity, price))
+    tx.execute("DELETE FROM cart WHERE user_id = ?", (user_id,))
+
+
+def checkout_set(tx, user_id):
+    """app/routes/order.py と同じ集合演算の checkout"""
+    order_id = tx.execute(ORDER_INSERT_SQL.rstrip() + " RETURNING id", (user_id, '東京都', 'card', None, user_id))
+    tx.execute(ORDER_ITEMS_INSERT_SQL, (order_id, user_id))
+    tx.execute("DELETE FROM cart WHERE user_id = ?", (user_id,))
+
+
+class Backend:
+    """SQLiteファイルかPostgreSQLスキーマへの接続を作る"""
+
+    def __init__(self, name, path=None, database_url=None):
+        self.name = name
+        self.path = path
+        self.database_url = database_url
+
+    def connect(self):
+        if self.name == 'sqlite':
+            # app/sqlite_db.py と同じ設定
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            return conn
+        import psycopg2
+        conn = psycopg2.connect(self.database_url, options=f"-c search_path={PG_SCHEMA}")
+        conn.autocommit = True
+        return conn
+
+    def setup(self, users, items):
+        conn = self.connect()
+        cursor = conn.cursor()
+        if self.name == 'postgres':
+            cursor.execute(f"DROP SCHEMA IF EXISTS {PG_SCHEMA} CASCADE")
+            cursor.execute(f"CREATE SCHEMA {PG_SCHEMA}")
+        else:
+            for table in ('order_items', 'orders', 'cart', 'products'):
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        for sql in SCHEMA[self.name] + INDEXES:
+            cursor.execute(sql)
+        mark = '?' if self.name == 'sqlite' else '%s'
+        cursor.executemany(f"INSERT INTO products (name, price) VALUES ({mark}, {mark})",
+                           [(f"商品{i}", 100 + i) for i in range(items * 5)])
+        cursor.executemany(f"INSERT INTO cart (user_id, product_id, quantity) VALUES ({mark}, {mark}, {mark})",
+                           [(user, (user * 7 + i) % (items * 5) + 1, 1 + i % 3)
+                            for user in range(1, users + 1) for i in range(items)])
+        if self.name == 'sqlite':
+            conn.commit()
+        conn.close()
+
+    def teardown(self):
+        if self.name == 'postgres':
+            conn = self.connect()
+            conn.cursor().execute(f"DROP SCHEMA IF EXISTS {PG_SCHEMA} CASCADE")
+            conn.close()
+
+
+def run(backend, checkout, users, workers):
+    """全ユーザーのチェックアウトを同時実行して (経過秒, ロック待ち秒のリスト, 文の数) を返す"""
+    local = threading.local()
+    connections = []
+    lock = threading.Lock()
+
+    def one(user_id):
+        conn = getattr(local, 'conn', None)
+        if conn is None:
+            conn = local.conn = backend.connect()
+            with lock:
+                connections.append(conn)
+        tx = Transaction(conn, backend.name, 'benchmark')
+        start = time.perf_counter()
+        tx.begin()
+        wait = time.perf_counter() - start
+        try:
+            checkout(tx, user_id)
+        except BaseException:
+            tx.rollback()
+            raise
+        start = time.perf_counter()
+        tx.commit()
+        return wait + time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        waits = list(pool.map(one, range(1, users + 1)))
+    elapsed = time.perf_counter() - start
+    for conn in connections:
+        conn.close()
+    return elapsed, waits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checkouts', type=int, default=200)
+    parser.add_argument('--items', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--database-url', default=os.getenv('BENCHMARK_DATABASE_URL'))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backends = [Backend('sqlite', path=os.path.join(tmp, 'checkout.db'))]
+        if args.database_url:
+            backends.append(Backend('postgres', database_url=args.database_url))
+        else:
+            print("⚠️ --database-url（BENCHMARK_DATABASE_URL）未指定のためPostgreSQLは省略")
+
+        print(f"🛒 {args.checkouts}件のチェックアウト × {args.items}品、{args.workers}スレッド同時実行")
+        print(f"{'DB':<9} {'方式':<5} {'件/秒':>9} {'ロック待ち平均':>12} {'p95':>9} {'最大':>9} {'合計':>9}")
+        for backend in backends:
+            try:
+                for label, checkout in (('loop', checkout_loop), ('set', checkout_set)):
+                    backend.setup(args.checkouts, args.items)
+                    elapsed, waits = run(backend, checkout, args.checkouts, args.workers)
+                    waits_ms = sorted(wait * 1000 for wait in waits)
+                    p95 = waits_ms[int(len(waits_ms) * 0.95) - 1]
+                    print(f"{backend.name:<9} {label:<5} {args.checkouts / elapsed:>9,.0f} "
+                          f"{statistics.mean(waits_ms):>10.1f}ms {p95:>7.1f}ms {waits_ms[-1]:>7.1f}ms {elapsed:>8.2f}s")
+            finally:
+                backend.teardown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""ETag による再検証（If-None-Match → 304）と通常の取得の比較
+
+同じプロセス内でWSGIアプリ（ページキャッシュは通さない）を直接呼び、
+--path を毎回本文ごと取得する場合と、前回の ETag を付けて再検証する場合の
+毎秒リクエスト数・レイテンシ・転送バイト数を比べる。
+結果キャッシュは無効にして、本文の取得が毎回DBを読む状態で計測する。
+
+データベースは通常どおり database/shop.db を使う（先に python database/init_db.py）。
+
+使い方:
+    python benchmarks/conditional.py
+    python benchmarks/conditional.py --path /product/1 --requests 5000
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def call(wsgi_app, environ):
+    """WSGIアプリを呼び出して (ステータスコード, ヘッダー, 本文のバイト数) を返す"""
+    captured = {}
+
+    def start_response(status, headers, exc_info=None):
+        captured['status'], captured['headers'] = int(status.split()[0]), dict(headers)
+
+    result = wsgi_app(dict(environ, **{'wsgi.input': io.BytesIO()}), start_response)
+    size = sum(len(chunk) for chunk in result)
+    if hasattr(result, 'close'):
+        result.close()
+    return captured['status'], captured['headers'], size
+
+
+def measure(wsgi_app, environ, requests, expect):
+    latencies, sizes = [], []
+    for _ in range(requests):
+        start = time.perf_counter()
+        status, _, size = call(wsgi_app, environ)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if status != expect:
+            sys.exit(f"❌ ステータス {status}（期待値 {expect}）")
+        sizes.append(size)
+    return sorted(latencies), sum(sizes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--path', default='/products')
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    from werkzeug.test import EnvironBuilder
+    from app import create_app
+    from app.result_cache import result_cache
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        app = create_app()
+    # ページキャッシュ（MicrocacheMiddleware）を外したFlaskアプリ本体
+    wsgi_app = getattr(app.wsgi_app, 'wsgi_app', app.wsgi_app)
+    result_cache.max_bytes = 0
+    environ = EnvironBuilder(path=args.path).get_environ()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, headers, _ = call(wsgi_app, environ)
+    etag = headers.get('ETag')
+    if not etag:
+        sys.exit("❌ ETag が返りません（マイグレーション未適用？）")
+
+    print(f"🌐 GET {args.path} を{args.requests}回（ETag {etag}）")
+    print(f"{'方式':<12} {'件/秒':>9} {'p50':>10} {'p99':>10} {'転送量':>12}")
+    scenarios = (
+        ('本文を取得', environ, 200),
+        ('再検証(304)', dict(environ, HTTP_IF_NONE_MATCH=etag), 304),
+    )
+    rates = []
+    for label, scenario_environ, expect in scenarios:
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            latencies, total = measure(wsgi_app, scenario_environ, args.requests, expect)
+            elapsed = time.perf_counter() - started
+        rates.append(args.requests / elapsed)
+        print(f"{label:<12} {rates[-1]:>9,.0f} {statistics.median(latencies):>8.2f}ms "
+              f"{latencies[int(len(latencies) * 0.99) - 1]:>8.2f}ms {total:>10,}B")
+    print(f"📈 再検証 / 本文を取得: {rates[1] / rates[0]:.1f}倍")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""匿名ユーザーのページキャッシュ（WSGIミドルウェア）の有無によるスループット
+
+クッキーなしの --clients 並列クライアントが --duration 秒間 --path を取得し続け、
+毎秒リクエスト数とレイテンシを比較する。
+
+- 既定: 同じプロセス内で --clients スレッドから直接WSGIアプリを呼ぶ。
+  「毎回DB」（結果キャッシュもなし）、「結果キャッシュのみ」、「ページキャッシュ」の3通り
+- --http: アプリを別プロセスのマルチスレッドHTTPサーバーで起動し、
+  MICROCACHE_ENABLED=false / true で比較する（クライアントも同じマシンで動くので、
+  CPUが少ないとクライアントと開発用サーバーの処理が律速になる）
+
+データベースは通常どおり database/shop.db を使う（先に python database/init_db.py）。
+
+使い方:
+    python benchmarks/microcache.py
+    python benchmarks/microcache.py --clients 500 --duration 20 --path /product/1
+    python benchmarks/microcache.py --http
+"""
+import argparse
+import contextlib
+import http.client
+import io
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+
+def serve(port):
+    """ベンチマーク対象のサーバー（子プロセスで実行）"""
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    app = create_app()
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    # 多数の同時接続を取りこぼさないよう待ち行列を広げる
+    server.socket.listen(1024)
+    print('ready', flush=True)
+    server.serve_forever()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(enabled):
+    port = free_port()
+    env = dict(os.environ, MICROCACHE_ENABLED='true' if enabled else 'false', FLASK_ENV='production')
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', str(port)],
+                               cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    for line in process.stdout:
+        if line.strip() == 'ready':
+            break
+    # 以降のログは読み捨てる（パイプが詰まってサーバーが止まらないように）
+    threading.Thread(target=lambda: process.stdout.read(), daemon=True).start()
+    return process, port
+
+
+def http_get(port, path):
+    """1回取得してステータスコードを返す"""
+    try:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        conn.request('GET', path, headers={'Accept-Encoding': 'gzip'})
+        response = conn.getresponse()
+        response.read()
+        conn.close()
+        return response.status
+    except OSError:
+        return None
+
+
+def wsgi_get(wsgi_app, environ):
+    """WSGIアプリを直接呼び出してステータスコードを返す"""
+    status = []
+
+    def start_response(value, headers, exc_info=None):
+        status.append(int(value.split()[0]))
+
+    result = wsgi_app(dict(environ, **{'wsgi.input': io.BytesIO()}), start_response)
+    b''.join(result)
+    if hasattr(result, 'close'):
+        result.close()
+    return status[0]
+
+
+def load(get, clients, duration):
+    """clients 並列で duration 秒間 get() を呼び、(成功件数, エラー件数, レイテンシms) を返す"""
+    deadline = time.perf_counter() + duration
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def client():
+        local, failed = [], 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            if get() != 200:
+                failed += 1
+                continue
+            local.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(latencies), errors[0], sorted(latencies)
+
+
+def report(label, count, errors, latencies, duration):
+    p99 = latencies[int(len(latencies) * 0.99) - 1] if latencies else 0
+    print(f"{label:<16} {count / duration:>9,.0f} "
+          f"{statistics.median(latencies) if latencies else 0:>8.1f}ms {p99:>8.1f}ms {errors:>7}")
+    return count / duration
+
+
+def run_http(args):
+    results = []
+    for enabled in (False, True):
+        process, port = start_server(enabled)
+        try:
+            # 初回の遅延初期化（インデックス作成など）を計測から外す
+            load(lambda: http_get(port, args.path), 1, 0.5)
+            count, errors, latencies = load(lambda: http_get(port, args.path), args.clients, args.duration)
+        finally:
+            process.terminate()
+            process.wait()
+        results.append(report('ページキャッシュ' if enabled else 'キャッシュなし', count, errors, latencies, args.duration))
+    return results
+
+
+def run_wsgi(args):
+    from werkzeug.test import EnvironBuilder
+    from app import create_app
+    from app.microcache import MicrocacheMiddleware
+    from app.result_cache import result_cache
+
+    # ページ側のログ出力は捨てる
+    with contextlib.redirect_stdout(io.StringIO()):
+        app = create_app()
+    middleware = app.wsgi_app
+    if not isinstance(middleware, MicrocacheMiddleware):
+        sys.exit("❌ MICROCACHE_ENABLED=false のため計測できません")
+    environ = EnvironBuilder(path=args.path, headers={'Accept-Encoding': 'gzip'}).get_environ()
+
+    results = []
+    scenarios = (
+        ('毎回DB', middleware.wsgi_app, 0),
+        ('結果キャッシュのみ', middleware.wsgi_app, result_cache.max_bytes),
+        ('ページキャッシュ', middleware, result_cache.max_bytes),
+    )
+    for label, wsgi_app, max_bytes in scenarios:
+        result_cache.max_bytes = max_bytes
+        result_cache.invalidate()
+        with contextlib.redirect_stdout(io.StringIO()):
+            load(lambda: wsgi_get(wsgi_app, environ), 1, 0.5)
+            count, errors, latencies = load(lambda: wsgi_get(wsgi_app, environ), args.clients, args.duration)
+        results.append(report(label, count, errors, latencies, args.duration))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--path', default='/')
+    parser.add_argument('--http', action='store_true')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+
+    print(f"🌐 GET {args.path}（クッキーなし）を{args.clients}並列で{args.duration:g}秒間"
+          f"（{'HTTP' if args.http else 'WSGI直接呼び出し'}）")
+    print(f"{'方式':<16} {'件/秒':>9} {'p50':>10} {'p99':>10} {'エラー':>7}")
+    results = run_http(args) if args.http else run_wsgi(args)
+    if results[0]:
+        print(f"📈 ページキャッシュ / {'キャッシュなし' if args.http else '毎回DB'}: {results[-1] / results[0]:.1f}倍")
+
+
+if __name__ == '__main__':
+    main()
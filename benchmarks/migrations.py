@@ -0,0 +1,159 @@
+"""スキーママイグレーション（インデックス追加）前後のクエリレイテンシ比較
+
+database/init_db.py と同じスキーマの一時SQLiteファイルに合成データを投入し、
+各画面のクエリをマイグレーション適用前と適用後で計測する。
+
+使い方:
+    python benchmarks/migrations.py
+    python benchmarks/migrations.py --scale 0.2 --repeat 50
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.migrations import MIGRATIONS, Migrator  # noqa: E402
+from benchmarks.search_ngram import BenchmarkDB  # noqa: E402
+from database.init_db import init_database  # noqa: E402
+
+# scale=1 のときの件数
+BASE_COUNTS = {
+    'users': 20000,
+    'products': 50000,
+    'reviews': 1000000,
+    'cart': 200000,
+    'orders': 200000,
+    'order_items': 600000,
+    'emails': 500000,
+    'email_attachments': 150000,
+}
+
+# (表示名, SQL, パラメータ生成関数) — 各ルートと同じクエリ
+QUERIES = [
+    ('商品詳細のレビュー', """
+        SELECT r.id, r.rating, r.comment, r.created_at, u.username
+        FROM reviews r JOIN users u ON r.user_id = u.id
+        WHERE r.product_id = ? ORDER BY r.created_at DESC, r.id DESC LIMIT 11
+    """, lambda rng, n: (rng.randint(1, n['products']),)),
+    ('カート表示', """
+        SELECT c.id, p.name, p.price, c.quantity, p.id as product_id, p.image_url
+        FROM cart c JOIN products p ON c.product_id = p.id WHERE c.user_id = ?
+    """, lambda rng, n: (rng.randint(1, n['users']),)),
+    ('カート追加時の既存行確認', "SELECT * FROM cart WHERE user_id = ? AND product_id = ?",
+     lambda rng, n: (rng.randint(1, n['users']), rng.randint(1, n['products']))),
+    ('注文履歴', "SELECT * FROM orders WHERE user_id = ? ORDER BY id ASC",
+     lambda rng, n: (rng.randint(1, n['users']),)),
+    ('注文明細', """
+        SELECT oi.*, p.name FROM order_items oi JOIN products p ON oi.product_id = p.id WHERE oi.order_id = ?
+    """, lambda rng, n: (rng.randint(1, n['orders']),)),
+    ('受信箱', """
+        SELECT e.*, u.username as sender_name,
+               (SELECT COUNT(*) FROM email_attachments WHERE email_id = e.id) as attachment_count
+        FROM emails e JOIN users u ON e.sender_id = u.id
+        WHERE e.recipient_id = ? ORDER BY e.created_at DESC
+    """, lambda rng, n: (rng.randint(1, n['users']),)),
+    ('送信箱', """
+        SELECT e.*, u.username as recipient_name FROM emails e JOIN users u ON e.recipient_id = u.id
+        WHERE e.sender_id = ? ORDER BY e.created_at DESC
+    """, lambda rng, n: (rng.randint(1, n['users']),)),
+]
+
+
+def timestamp(rng):
+    return f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00"
+
+
+def populate(conn, counts, seed=42):
+    rng = random.Random(seed)
+    n = counts
+    conn.executemany("INSERT INTO users (username, password, email) VALUES (?, ?, ?)",
+                     ((f'bench{i}', 'x', f'bench{i}@example.com') for i in range(n['users'])))
+    conn.executemany("INSERT INTO products (name, description, price, stock, category) VALUES (?, ?, ?, ?, ?)",
+                     ((f'商品{i}', '説明', rng.randint(100, 200000), 10, '電子機器') for i in range(n['products'])))
+    conn.executemany("INSERT INTO reviews (product_id, user_id, rating, comment, created_at) VALUES (?, ?, ?, ?, ?)",
+                     ((rng.randint(1, n['products']), rng.randint(1, n['users']), rng.randint(1, 5), 'レビュー', timestamp(rng))
+                      for _ in range(n['reviews'])))
+    conn.executemany("INSERT INTO cart (user_id, product_id, quantity) VALUES (?, ?, ?)",
+                     ((rng.randint(1, n['users']), rng.randint(1, n['products']), 1) for _ in range(n['cart'])))
+    conn.executemany("INSERT INTO orders (user_id, shipping_address, payment_method, total_amount, created_at) "
+                     "VALUES (?, ?, ?, ?, ?)",
+                     ((rng.randint(1, n['users']), '東京都', 'card', 1000, timestamp(rng)) for _ in range(n['orders'])))
+    conn.executemany("INSERT INTO order_items (order_id, product_id, quantity, price) VALUES (?, ?, ?, ?)",
+                     ((rng.randint(1, n['orders']), rng.randint(1, n['products']), 1, 1000) for _ in range(n['order_items'])))
+    conn.executemany("INSERT INTO emails (sender_id, recipient_id, subject, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                     ((rng.randint(1, n['users']), rng.randint(1, n['users']), '件名', '本文', timestamp(rng))
+                      for _ in range(n['emails'])))
+    conn.executemany("INSERT INTO email_attachments (email_id, original_filename, stored_filename, file_path) "
+                     "VALUES (?, ?, ?, ?)",
+                     ((rng.randint(1, n['emails']), 'a.txt', 'a.txt', '/tmp/a.txt') for _ in range(n['email_attachments'])))
+    conn.commit()
+    conn.execute("ANALYZE")
+
+
+def measure(db, counts, repeat, seed=7):
+    """クエリごとの (中央値ms, p95 ms)"""
+    results = {}
+    conn = db.get_db_connection()
+    try:
+        for label, sql, make_params in QUERIES:
+            rng = random.Random(seed)
+            samples = []
+            for _ in range(repeat):
+                params = make_params(rng, counts)
+                start = time.perf_counter()
+                conn.execute(sql, params).fetchall()
+                samples.append((time.perf_counter() - start) * 1000)
+            samples.sort()
+            results[label] = (statistics.median(samples), samples[int(len(samples) * 0.95) - 1])
+    finally:
+        db.release_connection(conn)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, default=1.0, help='件数の倍率')
+    parser.add_argument('--repeat', type=int, default=30)
+    args = parser.parse_args()
+
+    counts = {table: max(int(count * args.scale), 1) for table, count in BASE_COUNTS.items()}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            init_database()
+            db = BenchmarkDB(os.path.join(tmp, 'database', 'shop.db'))
+
+            print(f"📦 合成データ投入中: {', '.join(f'{t}={c:,}' for t, c in counts.items())}")
+            conn = db.get_db_connection()
+            start = time.perf_counter()
+            populate(conn, counts)
+            conn.close()
+            print(f"   {time.perf_counter() - start:.1f}s")
+
+            before = measure(db, counts, args.repeat)
+
+            start = time.perf_counter()
+            applied = Migrator(db, MIGRATIONS).migrate()
+            print(f"🔧 マイグレーション適用 {applied}: {time.perf_counter() - start:.1f}s")
+            db.execute_update("ANALYZE")
+
+            after = measure(db, counts, args.repeat)
+        finally:
+            os.chdir(cwd)
+
+    print(f"\n{'クエリ':<16} {'適用前 中央値':>12} {'p95':>10} {'適用後 中央値':>12} {'p95':>10} {'倍率':>8}")
+    for label, _, _ in QUERIES:
+        b_med, b_p95 = before[label]
+        a_med, a_p95 = after[label]
+        print(f"{label:<16} {b_med:>10.3f}ms {b_p95:>8.3f}ms {a_med:>10.3f}ms {a_p95:>8.3f}ms "
+              f"{b_med / a_med if a_med else float('inf'):>7.0f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""execute_query の行表現（dict と Row）のメモリ・スループット比較
+
+商品テーブルと同じ列構成の一時SQLiteファイル（デフォルト10万行）から全件を取得し、
+従来の dict(row) 変換と Row（列情報共有 + タプル）について、
+結果の保持メモリ・取得時間・列アクセス時間を比較する。
+
+使い方:
+    python benchmarks/rows.py
+    python benchmarks/rows.py --rows 500000 --repeat 3
+"""
+import argparse
+import gc
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.rows import rows_from_cursor  # noqa: E402
+from benchmarks.search_ngram import ADJECTIVES, CATEGORIES, NOUNS, PHRASES  # noqa: E402
+
+QUERY = "SELECT * FROM products"
+
+
+def create_products(path, count, seed=42):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            price REAL NOT NULL,
+            stock INTEGER DEFAULT 0,
+            category TEXT,
+            image_url TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO products (name, description, price, stock, category, image_url) VALUES (?, ?, ?, ?, ?, ?)",
+        ((f"{rng.choice(ADJECTIVES)}{rng.choice(NOUNS)}", rng.choice(PHRASES), float(rng.randint(100, 200000)),
+          rng.randint(0, 100), rng.choice(CATEGORIES), f"/static/uploads/{i}.jpg") for i in range(count))
+    )
+    conn.commit()
+    conn.close()
+
+
+def fetch_dicts(conn):
+    """従来の execute_query と同じ変換"""
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute(QUERY)
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def fetch_rows(conn):
+    """現在の execute_query と同じ変換"""
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(QUERY)
+    return rows_from_cursor(cursor)
+
+
+def retained_memory(fetch, conn):
+    """結果を保持したままの確保メモリ（MB）と確保ブロック数"""
+    gc.collect()
+    tracemalloc.start()
+    result = fetch(conn)
+    current, _ = tracemalloc.get_traced_memory()
+    blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+    tracemalloc.stop()
+    del result
+    return current / 1024 / 1024, blocks
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'rows.db')
+        create_products(path, args.rows)
+        conn = sqlite3.connect(path)
+
+        print(f"📦 {args.rows:,}行 × 8列（{QUERY}）")
+        print(f"{'方式':<6} {'保持メモリ':>10} {'確保ブロック':>12} {'取得':>10} {'列名で参照':>10} {'位置で参照':>10}")
+        for label, fetch in (('dict', fetch_dicts), ('Row', fetch_rows)):
+            memory, blocks = retained_memory(fetch, conn)
+            fetch_ms = timed(lambda: fetch(conn), args.repeat)
+            result = fetch(conn)
+            by_key = timed(lambda: sum(row['price'] for row in result), args.repeat)
+            # dict は位置指定に対応していない
+            by_position = '-' if label == 'dict' else f"{timed(lambda: sum(row[3] for row in result), args.repeat):.1f}ms"
+            print(f"{label:<6} {memory:>8.1f}MB {blocks:>12,} {fetch_ms:>8.1f}ms {by_key:>8.1f}ms {by_position:>10}")
+            del result
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""n-gram全文検索と従来のLIKE検索のベンチマーク
+
+合成した商品カタログ（デフォルト50万件）を一時SQLiteファイルに作成し、
+main.search と同じ「件数 + 1ページ分」の取得時間を比較する。
+
+使い方:
+    python benchmarks/search_ngram.py
+    python benchmarks/search_ngram.py --products 100000 --repeat 10
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.search import ProductSearchIndex, SEARCH_NGRAM_SIZE  # noqa: E402
+
+ADJECTIVES = ['高性能', '軽量', '最新', 'プロ仕様', 'コンパクト', 'ワイヤレス', '防水', '人間工学に基づいた',
+              'おしゃれな', '静音', '大容量', 'スマート', 'ヴィンテージ', 'エコ']
+NOUNS = ['ノートパソコン', 'ヘッドフォン', '椅子', 'スマートフォン', 'タブレット', 'キーボード', 'マウス',
+         'ランニングシューズ', 'コーヒーメーカー', 'デスクライト', 'リュック', '腕時計', 'カメラ', 'スピーカー']
+PHRASES = ['毎日の作業が快適になります。', '長時間の使用でも疲れにくい設計です。', 'ギフトにも最適です。',
+           '在庫限りの特別価格。', 'ｵﾌｨｽでもご家庭でも使えます。', 'バッテリーは最大20時間持続します。',
+           'USB-C充電に対応しています。', 'おすすめの人気商品です。']
+CATEGORIES = ['電子機器', '家具', 'ファッション', 'キッチン', 'スポーツ']
+
+# (表示名, 検索語)
+QUERIES = [
+    ('カタカナ', 'ヘッドフォン'),
+    ('ひらがな入力', 'へっどふぉん'),
+    ('漢字2文字', '椅子'),
+    ('複数語', '人間工学 椅子'),
+    ('半角カナ', 'ｶﾒﾗ'),
+    ('1文字', '椅'),
+    ('該当なし', '冷蔵庫'),
+]
+
+
+class BenchmarkDB:
+    """ProductSearchIndex が使うDB操作だけを持つSQLiteファイル用の実装"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def is_sqlite_mode(self):
+        return True
+
+    def get_db_connection(self):
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def release_connection(self, conn, discard=False):
+        conn.close()
+
+    def _is_connection_error(self, error):
+        return False
+
+    def execute_query(self, query, params=None, primary=False):
+        conn = self.get_db_connection()
+        try:
+            return [dict(row) for row in conn.execute(query, params or ())]
+        finally:
+            conn.close()
+
+    def execute_update(self, query, params=None):
+        conn = self.get_db_connection()
+        try:
+            cursor = conn.execute(query, params or ())
+            conn.commit()
+            return cursor.lastrowid
+        finally:
+            conn.close()
+
+
+def create_catalog(path, count, seed=42):
+    """合成カタログを作成"""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            price REAL NOT NULL,
+            stock INTEGER DEFAULT 0,
+            category TEXT,
+            image_url TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE reviews (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER,
+            user_id INTEGER,
+            rating INTEGER,
+            comment TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    def rows():
+        for i in range(count):
+            name = f"{rng.choice(ADJECTIVES)}{rng.choice(NOUNS)} {i}"
+            description = ''.join(rng.sample(PHRASES, 3))
+            yield (name, description, rng.randint(500, 300000), rng.randint(0, 100), rng.choice(CATEGORIES))
+
+    conn.executemany(
+        "INSERT INTO products (name, description, price, stock, category) VALUES (?, ?, ?, ?, ?)", rows()
+    )
+    conn.commit()
+    conn.close()
+
+
+def timed(fn, repeat):
+    """中央値（ミリ秒）と最後の結果を返す"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), result
+
+
+def like_search(db, query, per_page):
+    """従来の main.search と同じLIKE検索（件数 + 1ページ目）"""
+    params = (f'%{query}%', f'%{query}%')
+    total = db.execute_query(
+        "SELECT COUNT(*) AS count FROM products WHERE (name LIKE ? OR description LIKE ?)", params
+    )[0]['count']
+    db.execute_query(
+        "SELECT * FROM products WHERE (name LIKE ? OR description LIKE ?) ORDER BY id ASC LIMIT ? OFFSET ?",
+        params + (per_page, 0)
+    )
+    return total
+
+
+def ngram_search(index, query, per_page):
+    """n-gramインデックスでの検索（件数 + 1ページ目）"""
+    total = index.count(query)
+    index.search(query, limit=per_page, offset=0)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=500000, help='合成する商品数')
+    parser.add_argument('--repeat', type=int, default=5, help='各クエリの実行回数（中央値を表示）')
+    parser.add_argument('--per-page', type=int, default=9)
+    parser.add_argument('--keep', action='store_true', help='作成したDBファイルを削除しない')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='search_bench_')
+    path = os.path.join(directory, 'catalog.db')
+
+    print(f"🔍 合成カタログ作成中: {args.products:,}件 ({path})")
+    start = time.perf_counter()
+    create_catalog(path, args.products)
+    print(f"   作成: {time.perf_counter() - start:.1f}s, サイズ: {os.path.getsize(path) / 1024 / 1024:.1f}MB")
+
+    db = BenchmarkDB(path)
+    index = ProductSearchIndex(db)
+    start = time.perf_counter()
+    index.ensure_index()
+    print(f"   {SEARCH_NGRAM_SIZE}-gramインデックス構築: {time.perf_counter() - start:.1f}s, "
+          f"サイズ: {os.path.getsize(path) / 1024 / 1024:.1f}MB")
+
+    print()
+    print(f"{'クエリ':<14}{'LIKE ms':>10}{'件数':>9}{'n-gram ms':>12}{'件数':>9}{'倍率':>8}")
+    for label, query in QUERIES:
+        like_ms, like_total = timed(lambda: like_search(db, query, args.per_page), args.repeat)
+        ngram_ms, ngram_total = timed(lambda: ngram_search(index, query, args.per_page), args.repeat)
+        speedup = like_ms / ngram_ms if ngram_ms else float('inf')
+        print(f"{label:<14}{like_ms:>10.1f}{like_total:>9,}{ngram_ms:>12.1f}{ngram_total:>9,}{speedup:>7.1f}x")
+
+    if args.keep:
+        print(f"\nDB: {path}")
+    else:
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+        os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main()
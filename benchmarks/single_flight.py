@@ -0,0 +1,134 @@
+"""キャッシュ切れの瞬間の同時アクセス（thundering herd）で実行されるクエリ数
+
+一時SQLiteファイルの products を集計するクエリを execute_query(cache_tables=...)
+でキャッシュし、有効期間が切れた直後に --threads スレッドから同時に呼び出す。
+実際にデータベースで実行されたクエリ数と、呼び出し側の待ち時間を比較する。
+
+- まとめない:   期限切れを見た全スレッドがそれぞれクエリを実行する（従来の動作）
+- single-flight: 1スレッドだけが実行し、残りはその結果を待つ
+- stale-while-revalidate: 全スレッドが古い結果を即座に受け取り、読み直しは裏で1回
+
+使い方:
+    python benchmarks/single_flight.py
+    python benchmarks/single_flight.py --threads 100 --rows 200000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.database import DatabaseConfig  # noqa: E402
+from app.replicas import ReplicaRouter  # noqa: E402
+from app.result_cache import ResultCache  # noqa: E402
+from app.single_flight import SingleFlight  # noqa: E402
+
+QUERY = """
+    SELECT category, COUNT(*) AS count, AVG(price) AS average, MAX(price) AS highest
+    FROM products GROUP BY category ORDER BY category
+"""
+TTL = 0.2
+
+
+class NoCoalescing(SingleFlight):
+    """まとめずにその場で実行する（比較用）"""
+
+    def do(self, key, fn):
+        return fn()
+
+
+class BenchmarkConfig(DatabaseConfig):
+    """接続先を一時SQLiteファイルに差し替え、実行したクエリ数を数える DatabaseConfig"""
+
+    def __init__(self, path, result_cache):
+        self.path = path
+        self.use_postgres = False
+        self._pool = None
+        self.replicas = ReplicaRouter([])
+        self.result_cache = result_cache
+        self.read_your_writes_seconds = 0
+        self.queries = 0
+        self._count_lock = threading.Lock()
+
+    def get_db_connection(self):
+        return sqlite3.connect(self.path)
+
+    def _run_query(self, conn, query, params):
+        with self._count_lock:
+            self.queries += 1
+        return super()._run_query(conn, query, params)
+
+
+def create_products(path, rows):
+    rng = random.Random(42)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT, price REAL, category TEXT)")
+    conn.executemany("INSERT INTO products (name, price, category) VALUES (?, ?, ?)",
+                     ((f"商品{i}", rng.randint(100, 200000), f"cat{rng.randint(1, 50)}") for i in range(rows)))
+    conn.commit()
+    conn.close()
+
+
+def herd(db, threads):
+    """期限切れのキーに threads スレッドが同時に問い合わせ、(クエリ数, 待ち時間ms) を返す"""
+    db.execute_query(QUERY, cache_tables=('products',))
+    time.sleep(TTL * 1.5)
+    db.queries = 0
+    barrier = threading.Barrier(threads)
+    latencies = []
+    lock = threading.Lock()
+
+    def one():
+        barrier.wait()
+        start = time.perf_counter()
+        rows = db.execute_query(QUERY, cache_tables=('products',))
+        elapsed = (time.perf_counter() - start) * 1000
+        assert rows, '結果が空です'
+        with lock:
+            latencies.append(elapsed)
+
+    workers = [threading.Thread(target=one) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    # バックグラウンドの読み直しが終わるのを待つ
+    while db.result_cache._flight.stats()['in_flight']:
+        time.sleep(0.01)
+    return db.queries, sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=100)
+    parser.add_argument('--rows', type=int, default=200000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'herd.db')
+        create_products(path, args.rows)
+
+        print(f"🐘 {args.rows:,}件の集計クエリ、期限切れ直後に{args.threads}スレッドが同時アクセス")
+        print(f"{'方式':<24} {'DBクエリ':>8} {'p50':>10} {'p99':>10} {'最大':>10}")
+        scenarios = (
+            ('まとめない', 0, NoCoalescing()),
+            ('single-flight', 0, None),
+            ('stale-while-revalidate', 30, None),
+        )
+        for label, stale_ttl, flight in scenarios:
+            cache = ResultCache(ttl=TTL, stale_ttl=stale_ttl)
+            if flight is not None:
+                cache._flight = flight
+            queries, latencies = herd(BenchmarkConfig(path, cache), args.threads)
+            print(f"{label:<24} {queries:>8} {statistics.median(latencies):>8.2f}ms "
+                  f"{latencies[int(len(latencies) * 0.99) - 1]:>8.2f}ms {latencies[-1]:>8.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
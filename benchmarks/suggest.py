@@ -0,0 +1,89 @@
+"""入力補完インデックス（/api/suggest）のレイテンシ計測
+
+合成した商品名（デフォルト100万件）からインデックスを構築し、
+実際の商品名から切り出した前方一致クエリのレイテンシ分布を表示する。
+
+使い方:
+    python benchmarks/suggest.py
+    python benchmarks/suggest.py --products 200000 --queries 50000
+"""
+import argparse
+import os
+import random
+import resource
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.suggest import SuggestIndex  # noqa: E402
+from benchmarks.search_ngram import ADJECTIVES, CATEGORIES, NOUNS  # noqa: E402
+
+BRANDS = ['Sony', 'Apple', 'Nike', 'Dyson', 'パナソニック', 'ｼｬｰﾌﾟ', 'Anker', 'ニトリ', '無印良品', 'Logicool']
+
+
+def synthetic_products(count, seed=42):
+    rng = random.Random(seed)
+    for product_id in range(1, count + 1):
+        name = f"{rng.choice(BRANDS)} {rng.choice(ADJECTIVES)}{rng.choice(NOUNS)} {rng.randint(1, 9999)}"
+        yield product_id, name, rng.choice(CATEGORIES)
+
+
+def percentile(sorted_values, ratio):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * ratio))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=1000000, help='合成する商品数')
+    parser.add_argument('--queries', type=int, default=20000, help='計測するクエリ数')
+    parser.add_argument('--limit', type=int, default=8, help='候補数')
+    args = parser.parse_args()
+
+    products = list(synthetic_products(args.products))
+
+    index = SuggestIndex(db=None)
+    start = time.perf_counter()
+    index.build(products)
+    stats = index.stats()
+    print(f"🔍 構築: {args.products:,}件 / {stats['entries']:,}エントリ "
+          f"{time.perf_counter() - start:.1f}s, 最大RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f}MB")
+
+    # 実在する商品名の先頭1〜6文字（ひらがな入力を想定して一部はそのまま、一部は別表記）
+    rng = random.Random(7)
+    queries = []
+    for _ in range(args.queries):
+        _, name, _ = rng.choice(products)
+        word = rng.choice(name.split(' ')[:2])
+        queries.append(word[:rng.randint(1, 6)])
+
+    # ウォームアップ
+    for query in queries[:1000]:
+        index.suggest(query, limit=args.limit)
+
+    timings = []
+    empty = 0
+    for query in queries:
+        start = time.perf_counter()
+        result = index.suggest(query, limit=args.limit)
+        timings.append((time.perf_counter() - start) * 1000)
+        if not result:
+            empty += 1
+    timings.sort()
+
+    print(f"   クエリ {len(queries):,}件（候補なし {empty}件）")
+    print(f"   p50 {statistics.median(timings):.3f}ms  p95 {percentile(timings, 0.95):.3f}ms  "
+          f"p99 {percentile(timings, 0.99):.3f}ms  max {timings[-1]:.3f}ms")
+
+    # 管理画面からの追加・変更・削除（差分更新）のコスト
+    start = time.perf_counter()
+    for product_id in range(args.products + 1, args.products + 1001):
+        index.add_product(product_id, f"追加商品 {product_id}", 'テスト')
+    for product_id in range(args.products + 1, args.products + 1001):
+        index.remove_product(product_id)
+    print(f"   差分更新（追加+削除）: {(time.perf_counter() - start) * 1000 / 2000:.3f}ms/件")
+
+
+if __name__ == '__main__':
+    main()
@@ -97,6 +97,12 @@ CREATE TABLE IF NOT EXISTS email_attachments (
     FOREIGN KEY (email_id) REFERENCES emails (id)
 );
 
+-- 商品・レビューの全文検索（n-gram）インデックスは初回検索時にアプリが作成する
+-- 手動で作り直す場合: flask --app run rebuild-search-index
+
+-- 検索用のセカンダリインデックスは app/migrations.py で管理する（起動時に自動適用）
+-- 手動で適用する場合: flask --app run migrate
+
 -- 基本データ挿入
 INSERT INTO users (username, password, email, is_admin) VALUES 
 ('admin', 'admin123', 'admin@shop.com', true)